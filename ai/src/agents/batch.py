@@ -0,0 +1,90 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from src.agents.supervisor import get_supervisor_agent
+from src.llm.embed import aembed_texts
+from src.llm.usage import track_usage
+from src.tools.supervisor import ltm
+from src.utils.deadline import reset_deadline, start_deadline
+from src.utils.logger import setup_logger
+from src.utils.tracing import span
+logger = setup_logger(__name__)
+
+# Graph runs in flight at once for a single batch
+BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+# Time budget for each question of a batch
+BATCH_QUESTION_DEADLINE_SECONDS = float(os.getenv("CHAT_BATCH_QUESTION_DEADLINE_SECONDS", "60"))
+
+
+async def run_batch(
+    questions: List[str],
+    concurrency: Optional[int] = None,
+    deadline_seconds: float = BATCH_QUESTION_DEADLINE_SECONDS,
+    tenant: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Answer many questions with the supervisor graph.
+
+    All questions are embedded in one batch and their memories fetched with a
+    single multi-vector Milvus search; the embeddings go into the graph state
+    so saving the answers does not embed the questions again. The graphs then
+    run with bounded concurrency and each result is yielded as soon as it
+    finishes, so results arrive out of order (use "index" to match them to
+    the input).
+
+    Args:
+        questions: The questions to answer
+        concurrency: Maximum number of graph runs in flight (default BATCH_CONCURRENCY)
+        deadline_seconds: Time budget for each question
+        tenant: Tenant the token usage is attributed to
+
+    Yields:
+        One result dictionary per question, with the token usage of its graph run
+    """
+    app = get_supervisor_agent().app
+    with span("chat.batch_prepare", questions=len(questions)), track_usage(tenant):
+        try:
+            embeddings = await aembed_texts(questions)
+        except Exception as e:
+            logger.error("Error embedding batch questions: %s", e)
+            embeddings = None
+        memories = await ltm.get_similar_questions_batch(questions, embeddings=embeddings)
+    semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+
+    async def run_one(index: int, question: str) -> Dict[str, Any]:
+        async with semaphore:
+            # each task has its own context, so the deadline is per question
+            deadline_token = start_deadline(deadline_seconds)
+            try:
+                with span("chat.batch_question", index=index), track_usage(tenant) as usage:
+                    state = await app.ainvoke(
+                        {
+                            "task": {"original": question},
+                            "memories": memories[index],
+                            "question_embedding": embeddings[index] if embeddings else None,
+                        },
+                        config={"configurable": {"question": question}},
+                    )
+                answer = state.get("answer") or {}
+                return {
+                    "index": index,
+                    "question": question,
+                    "response": answer.get("response") or answer.get("summary", ""),
+                    "response_id": answer.get("response_id"),
+                    "usage": usage.summary(),
+                }
+            except Exception as e:
+                logger.error("Error answering batch question %s: %s", index, e)
+                return {"index": index, "question": question, "error": str(e)}
+            finally:
+                reset_deadline(deadline_token)
+
+    tasks = [asyncio.create_task(run_one(i, q)) for i, q in enumerate(questions)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
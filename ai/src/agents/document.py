@@ -1,7 +1,9 @@
-from typing import AsyncGenerator, Literal, Dict, Any
+from functools import lru_cache
+from typing import AsyncGenerator, Literal, Dict, Any, Optional
 import os
 from datetime import datetime
 import uuid
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from src.utils.logger import setup_logger
 logger = setup_logger(__name__)
@@ -21,13 +23,17 @@ from src.tools.document import (
 )
 
 from src.states.document import DocumentState
+from src.utils.trace import traced_node
 from src.llm.runner import get_llm_model, call_llm, call_llm_sync
 
-class JiraAgent:
+class DocumentAgent:
     """
-    Agent that interacts with JIRA for ticket management and data retrieval.
-    This agent can create, update, fetch and search JIRA tickets, as well as
-    store and retrieve JIRA data from Milvus vector database.
+    Agent that manages documents and retrieves document data.
+    This agent can create, update, fetch and search documents, as well as
+    store and retrieve document data from Milvus vector database.
+
+    The workflow is compiled once in __init__; use get_document_agent() to
+    share one compiled instance across requests.
     """
 
     def __init__(self):
@@ -70,7 +76,7 @@ class JiraAgent:
                 return "generate_response"
         
         if operation in ["create", "update", "fetch"] and "document_data" in state:
-            logger.info(f"Storing document data in Milvus for operation: {operation}")
+            logger.info("Storing document data in Milvus for operation: %s", operation)
             return "store_document_data"
             
         return "generate_response"
@@ -101,18 +107,18 @@ class JiraAgent:
     def _create_workflow(self):
         workflow = StateGraph(DocumentState)
         
-        workflow.add_node("analyze_request", self._analyze_request)
-        workflow.add_node("create_document", create_document)
-        workflow.add_node("update_document", update_document)
-        workflow.add_node("assign_document", assign_document)
-        workflow.add_node("fetch_documents", fetch_documents)
-        workflow.add_node("analyze_documents", analyze_documents)
-        workflow.add_node("search_documents", search_documents)
-        workflow.add_node("comment_on_document", comment_on_document)
-        workflow.add_node("search_milvus", search_document_in_milvus)
-        workflow.add_node("store_document_data", store_document_in_milvus)
-        workflow.add_node("delete_document", delete_document)
-        workflow.add_node("generate_response", self._generate_response)
+        workflow.add_node("analyze_request", traced_node("analyze_request", self._analyze_request))
+        workflow.add_node("create_document", traced_node("create_document", create_document))
+        workflow.add_node("update_document", traced_node("update_document", update_document))
+        workflow.add_node("assign_document", traced_node("assign_document", assign_document))
+        workflow.add_node("fetch_documents", traced_node("fetch_documents", fetch_documents))
+        workflow.add_node("analyze_documents", traced_node("analyze_documents", analyze_documents))
+        workflow.add_node("search_documents", traced_node("search_documents", search_documents))
+        workflow.add_node("comment_on_document", traced_node("comment_on_document", comment_on_document))
+        workflow.add_node("search_milvus", traced_node("search_milvus", search_document_in_milvus))
+        workflow.add_node("store_document_data", traced_node("store_document_data", store_document_in_milvus))
+        workflow.add_node("delete_document", traced_node("delete_document", delete_document))
+        workflow.add_node("generate_response", traced_node("generate_response", self._generate_response))
 
         operation_map = {
             "create_document": "create_document",
@@ -172,7 +178,7 @@ class JiraAgent:
             else:
                 operation = str(response)
                 
-            logger.info(f"LLM returned operation: {operation}")
+            logger.info("LLM returned operation: %s", operation)
             
             # Normalize the operation
             if "create" in operation.lower():
@@ -195,20 +201,20 @@ class JiraAgent:
             else:
                 operation = "search"  # Default to search
                 
-            logger.info(f"Normalized operation: {operation} for task: {task}")
+            logger.info("Normalized operation: %s for task: %s", operation, task)
             
         except Exception as e:
-            logger.error(f"Error analyzing request: {str(e)}")
+            logger.error("Error analyzing request: %s", e)
             # Default to search as fallback
             operation = "search"
         
         return {"task": task, "operation": operation, **state}
 
     def _generate_response(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        logger.info(f"Generating final response: {state}")
+        logger.debug("Generating final response with state keys: %s", list(state))
 
         """Generate a human-readable response based on the state"""
-        ticket_data = state.get("ticket_data", {})
+        document_data = state.get("document_data", {})
         operation = state.get("operation", "")
         task = state.get("task", "")
         answer = state.get("answer", "")
@@ -232,7 +238,7 @@ class JiraAgent:
             logger.info("Successfully generated document response")
             
         except Exception as e:
-            logger.error(f"Error generating response: {str(e)}")
+            logger.error("Error generating response: %s", e)
             response_content = f"I encountered an error while processing your request related to {operation} operation. Please try again."
         
         # Generate a unique response ID
@@ -253,16 +259,16 @@ class JiraAgent:
         # Mark this as task_complete to signal to the supervisor that no further processing is needed
         state["task_complete"] = True
         
-        logger.info(f"Generated document response with ID: {response_id}")
+        logger.info("Generated document response with ID: %s", response_id)
         
         return state
 
-    def run(self, input: str):
-        logger.info(f"Document Agent received input: {input}")
+    def run(self, input: str, config: Optional[RunnableConfig] = None):
+        logger.debug("Document Agent received input keys: %s", list(input))
         if isinstance(input, str):
             input = {"task": input}
         
-        result = self.app.invoke(input)
+        result = self.app.invoke(input, config=config)
         
         # Ensure we're correctly setting the answer in the output
         # This is critical for the supervisor to recognize completion
@@ -272,3 +278,9 @@ class JiraAgent:
             logger.warning("Document Agent did not set answer in result")
             
         return result
+
+
+@lru_cache(maxsize=1)
+def get_document_agent() -> DocumentAgent:
+    """Return the process-wide DocumentAgent with its compiled workflow"""
+    return DocumentAgent()
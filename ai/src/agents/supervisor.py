@@ -1,65 +1,91 @@
+from functools import lru_cache
 from typing import Dict, Any, Optional
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from src.llm.runner import get_llm_model, call_llm, call_llm_sync
-from src.agents.document import DocumentAgent
+from src.agents.document import DocumentAgent, get_document_agent
 from src.tools.supervisor import (
-    create_plan,
+    draft_plan,
     generate_answer,
     retrieve_memories,
+    route_request,
     save_memories,
 )
 from src.states.supervisor import SupervisorState
+from src.utils.trace import timed_node
 
-from langgraph.graph import StateGraph
+from langgraph.graph import StateGraph, START
 
 from src.utils.logger import setup_logger
 logger = setup_logger(__name__)
 
+def check_agent_completion(state: Dict[str, Any]) -> str:
+    """Decide where to go after a sub-agent has run"""
+    if state.get("task_complete"):
+        return "save_memories"
+    return "generate_answer"
+
+
+def merge_context(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Join point for the parallel memory, routing and planning branches"""
+    return {}
+
+
 class SupervisorAgent:
     """
     Supervisor agent that coordinates between different agents.
     This agent analyzes user requests and routes them to the appropriate agent.
+
+    Building the agent compiles both LangGraph workflows, so it is done once per
+    process (see get_supervisor_agent). Per-request values are passed through
+    the run config, e.g. config={"configurable": {"question": ...}}.
+
+    ``app`` is stateless: every run starts from its input. ``threaded_app``
+    is the same graph compiled with a checkpointer (see attach_checkpointer);
+    runs on it need a "thread_id" in the configurable and resume from the
+    state the previous turn of that thread left behind.
     """
-    def __init__(self):
-        self.model = get_llm_model()
-        self.document_agent = DocumentAgent()
+    def __init__(self, document_agent: Optional[DocumentAgent] = None):
+        self.document_agent = document_agent or get_document_agent()
         self.app = self._create_workflow()
+        self.threaded_app = None
+
+    def attach_checkpointer(self, checkpointer: BaseCheckpointSaver) -> None:
+        """Compile the checkpointed variant of the workflow"""
+        self.threaded_app = self._create_workflow(checkpointer)
 
-    def _create_workflow(self):
+    def _create_workflow(self, checkpointer: Optional[BaseCheckpointSaver] = None):
         workflow = StateGraph(SupervisorState)
-        workflow.add_node("retrieve_memories", retrieve_memories)
-        workflow.add_node("document_agent", self.document_agent.app)
-        workflow.add_node("create_plan", create_plan)
-        workflow.add_node("generate_answer", generate_answer)
-        workflow.add_node("save_memories", save_memories)
+        workflow.add_node("retrieve_memories", timed_node("retrieve_memories", retrieve_memories))
+        workflow.add_node("route_request", timed_node("route_request", route_request))
+        workflow.add_node("draft_plan", timed_node("draft_plan", draft_plan))
+        workflow.add_node("merge_context", timed_node("merge_context", merge_context))
+        workflow.add_node("document_agent", timed_node("document_agent", self._run_document_agent))
+        workflow.add_node("generate_answer", timed_node("generate_answer", generate_answer))
+        workflow.add_node("save_memories", timed_node("save_memories", save_memories))
+
+        # Memory lookup, routing and plan drafting are independent of each
+        # other, so they run as parallel branches and join in merge_context
+        parallel_steps = ["retrieve_memories", "route_request", "draft_plan"]
+        for step in parallel_steps:
+            workflow.add_edge(START, step)
+        workflow.add_edge(parallel_steps, "merge_context")
 
         # Define conditional routing map
         conditional_map = {
             "document": "document_agent",
             "generate_answer": "generate_answer"
         }
-
-        # Set up the workflow
-        workflow.add_edge("retrieve_memories", "create_plan")
         
-        # Add conditional routing based on the next_step determined in create_plan
+        # Route based on the next_step determined in route_request
         workflow.add_conditional_edges(
-            "create_plan", lambda x: x.get("next_step", ""), conditional_map
+            "merge_context", lambda x: x.get("next_step", ""), conditional_map
         )
         
         # Connect agent outputs with conditional routing based on task completion
         workflow.add_conditional_edges(
             "document_agent", check_agent_completion, 
             {
-                "create_plan": "create_plan", 
-                "generate_answer": "generate_answer",
-                "save_memories": "save_memories"
-            }
-        )
-        
-        workflow.add_conditional_edges(
-            "document_agent", check_agent_completion, 
-            {
-                "create_plan": "create_plan", 
                 "generate_answer": "generate_answer",
                 "save_memories": "save_memories"
             }
@@ -68,11 +94,27 @@ class SupervisorAgent:
         # Connect generate_answer to save_memories
         workflow.add_edge("generate_answer", "save_memories")
 
-        # Set entry and exit points
-        workflow.set_entry_point("retrieve_memories")
+        # Set exit point
         workflow.set_finish_point("save_memories")
 
-        return workflow.compile()
+        return workflow.compile(checkpointer=checkpointer)
+
+    async def _run_document_agent(self, state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        """Run the document graph and return only the keys the supervisor tracks"""
+        task = state.get("task", {})
+        document_input = {
+            "task": task.get("original", "") if isinstance(task, dict) else str(task),
+            # request-scoped memo: the document graph reuses what the
+            # supervisor already computed instead of embedding the task again
+            "question_embedding": state.get("question_embedding"),
+            "memories": state.get("memories"),
+        }
+        result = await self.document_agent.app.ainvoke(document_input, config=config)
+        return {
+            key: result[key]
+            for key in ("answer", "task_complete")
+            if key in result
+        }
 
     def _determine_agent(self, task: str) -> str:
         """Determine which agent should handle the task"""
@@ -90,15 +132,41 @@ class SupervisorAgent:
         else:
             return "generate_answer"
 
-    def run(self, input: Dict[str, Any]):
+    def run(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None):
         """
         Run the supervisor agent to process the user's request.
         
         Args:
             input: Dictionary containing user and task information
+            config: Per-request run configuration
         
         Returns:
             Streaming response from the agent workflow
         """
-        logger.info(f"Supervisor Agent received input: {input}")
-        return self.app.stream(input)
+        logger.debug("Supervisor Agent received input keys: %s", list(input))
+        return self.app.stream(input, config=config)
+
+
+@lru_cache(maxsize=1)
+def get_supervisor_agent() -> SupervisorAgent:
+    """Return the process-wide SupervisorAgent with its compiled workflows"""
+    return SupervisorAgent()
+
+
+def warm_up(checkpointer: Optional[BaseCheckpointSaver] = None) -> SupervisorAgent:
+    """
+    Build the shared agents and LLM clients ahead of the first request.
+
+    Called from the application startup hook so no request pays for model
+    construction, tool binding or graph compilation.
+
+    Args:
+        checkpointer: Saver for conversation threads; when given, the
+            checkpointed workflow is compiled as well
+    """
+    agent = get_supervisor_agent()
+    if checkpointer is not None:
+        agent.attach_checkpointer(checkpointer)
+    get_llm_model()
+    logger.info("Supervisor and document graphs compiled")
+    return agent
@@ -1,9 +1,21 @@
-from typing import Literal, Optional
-from pydantic import BaseModel
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
 
 
 class ChatInput(BaseModel):
     question: str
+    session_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    # tenant the token usage and cost of the request are attributed to
+    tenant: Optional[str] = None
+    # "events": legacy JSON-ish stream built from astream_events
+    # "messages": low-overhead SSE stream of answer tokens and a final "done" event
+    stream_mode: Literal["events", "messages"] = "events"
+
+class BatchChatInput(BaseModel):
+    questions: List[str] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    tenant: Optional[str] = None
 
 class ChatAnswerAddons(BaseModel):
     type: str
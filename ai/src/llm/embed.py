@@ -1,11 +1,113 @@
 import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
 from langchain_openai.embeddings import OpenAIEmbeddings
+from src.utils.deadline import current_timeout
+from src.llm.usage import record_usage
+from src.utils.metrics import model_call
+from src.utils.tracing import span
 
 
+# Maximum number of inputs per embeddings request
+EMBED_BATCH_SIZE = int(os.getenv("OPENAI_EMBEDDING_BATCH_SIZE", "512"))
+
 openai_embeddings = OpenAIEmbeddings(
     model=os.getenv("OPENAI_EMBEDDING_MODEL_NAME"), api_key=os.getenv("OPENAI_API_KEY"), dimensions=768
 )
 
 
+class EmbeddingCallCounter:
+    """Embedding requests made while a track_embedding_calls() block is active"""
+
+    def __init__(self, parent: Optional["EmbeddingCallCounter"] = None):
+        self.parent = parent
+        self.calls = 0
+        self.texts = 0
+
+
+_embedding_calls: ContextVar[Optional[EmbeddingCallCounter]] = ContextVar("embedding_calls", default=None)
+
+
+@contextmanager
+def track_embedding_calls() -> Iterator[EmbeddingCallCounter]:
+    """
+    Count the embedding requests made in the current context.
+
+    The counter is shared with the tasks the context spawns (e.g. parallel
+    graph nodes). Blocks can be nested; calls count towards every enclosing
+    block.
+    """
+    counter = EmbeddingCallCounter(_embedding_calls.get())
+    token = _embedding_calls.set(counter)
+    try:
+        yield counter
+    finally:
+        _embedding_calls.reset(token)
+
+
+def _record_call(texts: int) -> None:
+    counter = _embedding_calls.get()
+    while counter is not None:
+        counter.calls += 1
+        counter.texts += texts
+        counter = counter.parent
+
+
+def _request_options() -> dict:
+    options = {
+        "model": openai_embeddings.model,
+        "dimensions": openai_embeddings.dimensions,
+    }
+    # without a deadline the client's default timeout applies (timeout=None would disable it)
+    timeout = current_timeout()
+    if timeout is not None:
+        options["timeout"] = timeout
+    return options
+
+
+def _record_usage(embedding_span, response) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        tokens = getattr(usage, "prompt_tokens", 0) or 0
+        embedding_span.add("input_tokens", tokens)
+        cost = record_usage(openai_embeddings.model, tokens)
+        if cost:
+            embedding_span.add("cost_usd", cost)
+
+
 def embed_text(text: str) -> list[float]:
-    return openai_embeddings.embed_query(text)
\ No newline at end of file
+    _record_call(1)
+    with span("embedding", texts=1, model=openai_embeddings.model) as embedding_span, \
+            model_call("embedding", openai_embeddings.model):
+        if current_timeout() is None:
+            return openai_embeddings.embed_query(text)
+        # Inside a request: call the client directly so the deadline bounds the call
+        response = openai_embeddings.client.create(input=[text], **_request_options())
+        _record_usage(embedding_span, response)
+        return response.data[0].embedding
+
+
+async def aembed_text(text: str) -> list[float]:
+    _record_call(1)
+    with span("embedding", texts=1, model=openai_embeddings.model) as embedding_span, \
+            model_call("embedding", openai_embeddings.model):
+        if current_timeout() is None:
+            return await openai_embeddings.aembed_query(text)
+        response = await openai_embeddings.async_client.create(input=[text], **_request_options())
+        _record_usage(embedding_span, response)
+        return response.data[0].embedding
+
+
+async def aembed_texts(texts: list[str]) -> list[list[float]]:
+    """Embed many texts with one request per EMBED_BATCH_SIZE inputs"""
+    embeddings: list[list[float]] = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        batch = texts[start:start + EMBED_BATCH_SIZE]
+        _record_call(len(batch))
+        with span("embedding", texts=len(batch), model=openai_embeddings.model) as embedding_span, \
+                model_call("embedding", openai_embeddings.model):
+            response = await openai_embeddings.async_client.create(input=batch, **_request_options())
+            _record_usage(embedding_span, response)
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
@@ -1,19 +1,124 @@
 import os
-from typing import Iterator, Dict, Any, List, Union
+import time
+from typing import AsyncIterator, Iterator, Dict, Any, List, Optional, Union
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_openai.chat_models import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.outputs.llm_result import LLMResult
 from langchain_core.messages import BaseMessageChunk
+from langchain_core.runnables import RunnableConfig
+from src.llm.usage import record_usage
+from src.utils.deadline import current_timeout
+from src.utils.metrics import LLM_TIME_TO_FIRST_TOKEN_SECONDS, record_model_call
+from src.utils.tracing import start_span
 from src.utils.logger import setup_logger
 logger = setup_logger(__name__)
 
+
+class LLMSpanHandler(BaseCallbackHandler):
+    """
+    Records every chat completion of the model as an "llm.chat" span, in the
+    model call metrics and in the usage ledger of the request (token counts
+    and estimated cost, see src.llm.usage).
+
+    Attached to the ChatOpenAI client, so it also sees calls made directly on
+    .llm or through bind_tools(). It runs inline (not in an executor) so the
+    span becomes a child of the span that is current at the call site.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[UUID, Any] = {}
+        self._streaming: set = set()
+        # run_id -> (start time, model), kept apart from the span because
+        # unsampled spans do not time anything
+        self._runs: Dict[UUID, Any] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name")
+        self._runs[run_id] = (time.perf_counter(), model)
+        self._spans[run_id] = start_span(
+            "llm.chat",
+            model=model,
+            streaming=bool(params.get("stream")),
+            messages=sum(len(batch) for batch in messages),
+        )
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        params = kwargs.get("invocation_params") or {}
+        self._runs[run_id] = (time.perf_counter(), params.get("model") or params.get("model_name"))
+        self._spans[run_id] = start_span("llm.chat", prompts=len(prompts))
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._spans.get(run_id)
+        if span is None:
+            return
+        if run_id not in self._streaming:
+            self._streaming.add(run_id)
+            span.set(ttft_ms=span.elapsed_ms())
+            run = self._runs.get(run_id)
+            if run is not None:
+                LLM_TIME_TO_FIRST_TOKEN_SECONDS.labels(run[1] or "unknown").observe(time.perf_counter() - run[0])
+        span.add("chunks", 1)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._spans.pop(run_id, None)
+        self._streaming.discard(run_id)
+        model = self._record_call(run_id)
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+                # the model that answered, e.g. a dated snapshot of the requested one
+                model = (getattr(message, "response_metadata", None) or {}).get("model_name") or model
+        if usage:
+            tokens = {
+                "input_tokens": usage.get("input_tokens"),
+                "output_tokens": usage.get("output_tokens"),
+                "cached_input_tokens": (usage.get("input_token_details") or {}).get("cache_read"),
+            }
+        else:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            tokens = {
+                "input_tokens": token_usage.get("prompt_tokens"),
+                "output_tokens": token_usage.get("completion_tokens"),
+            }
+        cost = record_usage(model, **tokens)
+        if span is not None:
+            span.set(cost_usd=cost, **tokens)
+            span.end()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._spans.pop(run_id, None)
+        self._streaming.discard(run_id)
+        self._record_call(run_id, error=True)
+        if span is not None:
+            span.end(error=error)
+
+    def _record_call(self, run_id: UUID, error: bool = False) -> Optional[str]:
+        """Observe the call's latency; returns the model it was sent to"""
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        start, model = run
+        record_model_call("chat", model, time.perf_counter() - start, error=error)
+        return model
+
+
 class OpenAI:
     def __init__(self, model_id: str = os.getenv("OPENAI_MODEL_NAME")):
         self.llm = ChatOpenAI(
             model=model_id,
             api_key=os.getenv("OPENAI_API_KEY"),
             streaming=True,
+            # report token usage on streamed completions too
+            stream_usage=True,
             temperature=0,
+            callbacks=[LLMSpanHandler()],
         )
 
     def _format_messages(self, prompt: Union[str, List[Dict[str, str]]]) -> List[Union[HumanMessage, SystemMessage]]:
@@ -33,35 +138,68 @@ class OpenAI:
             return messages
         else:
             # Fallback for any other format
-            logger.warning(f"Unexpected prompt format: {type(prompt)}")
+            logger.warning("Unexpected prompt format: %s", type(prompt))
             return [HumanMessage(content=str(prompt))]
 
+    def _call_kwargs(self) -> Dict[str, Any]:
+        """Per-call request options; the timeout follows the request deadline"""
+        timeout = current_timeout()
+        return {"timeout": timeout} if timeout is not None else {}
+
     def call_llm(self, prompt: Union[str, List[Dict[str, str]]]) -> Iterator[BaseMessageChunk]:
         """Call LLM with streaming enabled"""
         try:
             messages = self._format_messages(prompt)
-            llm_response = self.llm.stream(messages)
+            llm_response = self.llm.stream(messages, **self._call_kwargs())
             return llm_response
         except Exception as e:
-            logger.error(f"Error calling LLM with streaming: {str(e)}")
+            logger.error("Error calling LLM with streaming: %s", e)
+            message = f"Error calling LLM: {str(e)}"
             # Return a simple error message
             class ErrorMessage:
                 @property
                 def content(self):
-                    return f"Error calling LLM: {str(e)}"
+                    return message
             return ErrorMessage()
 
     def call_llm_sync(self, prompt: Union[str, List[Dict[str, str]]]) -> LLMResult:
         """Call LLM synchronously"""
         try:
             messages = self._format_messages(prompt)
-            llm_response = self.llm.invoke(messages)
+            llm_response = self.llm.invoke(messages, **self._call_kwargs())
             return llm_response
         except Exception as e:
-            logger.error(f"Error calling LLM synchronously: {str(e)}")
+            logger.error("Error calling LLM synchronously: %s", e)
+            message = f"Error calling LLM: {str(e)}"
+            # Return a simple error message
+            class ErrorMessage:
+                @property
+                def content(self):
+                    return message
+            return ErrorMessage()
+
+    async def acall_llm_sync(self, prompt: Union[str, List[Dict[str, str]]]) -> LLMResult:
+        """Call LLM asynchronously and wait for the full completion"""
+        try:
+            messages = self._format_messages(prompt)
+            return await self.llm.ainvoke(messages, **self._call_kwargs())
+        except Exception as e:
+            logger.error("Error calling LLM asynchronously: %s", e)
+            # e is unbound once the except block ends, so keep its message
+            message = f"Error calling LLM: {str(e)}"
             # Return a simple error message
             class ErrorMessage:
                 @property
                 def content(self):
-                    return f"Error calling LLM: {str(e)}"
+                    return message
             return ErrorMessage()
+
+    async def astream_llm(
+        self,
+        prompt: Union[str, List[Dict[str, str]]],
+        config: Optional[RunnableConfig] = None
+    ) -> AsyncIterator[BaseMessageChunk]:
+        """Stream LLM chunks asynchronously as they arrive"""
+        messages = self._format_messages(prompt)
+        async for chunk in self.llm.astream(messages, config=config, **self._call_kwargs()):
+            yield chunk
@@ -1,64 +1,79 @@
 import os
-from typing import Iterator
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, Optional
 from .openai import OpenAI
 from langchain_core.outputs.llm_result import LLMResult
 from langchain_core.messages import BaseMessageChunk
+from langchain_core.runnables import RunnableConfig
 from src.utils.logger import setup_logger
 logger = setup_logger(__name__)
 
 
+@lru_cache(maxsize=None)
+def get_openai(model_id: Optional[str] = None) -> OpenAI:
+    """
+    Return the process-wide OpenAI wrapper for a model.
+
+    The underlying ChatOpenAI client (and its HTTP connection pool) is built
+    once per model id and shared by every request.
+    """
+    return OpenAI(model_id=model_id) if model_id else OpenAI()
+
+
 def get_superior_llm_model():
-    return OpenAI(model_id=os.getenv("SUPERIOR_OPENAI_MODEL_NAME")).llm
+    return get_openai(os.getenv("SUPERIOR_OPENAI_MODEL_NAME")).llm
 
 def get_llm_model():
-    return OpenAI().llm
+    return get_openai().llm
 
 
 def call_llm(prompt: str, model_id: str = None) -> Iterator[BaseMessageChunk]:
-    kwargs = {"model_id": model_id} if model_id else {}
-
-    openai = OpenAI(**kwargs)
+    openai = get_openai(model_id)
     llm_response: LLMResult = openai.call_llm(prompt)
     return llm_response
 
 
+def astream_llm(prompt: str, model_id: str = None, config: Optional[RunnableConfig] = None) -> AsyncIterator[BaseMessageChunk]:
+    """Stream the completion token by token; pass the node config so graph events see the tokens"""
+    return get_openai(model_id).astream_llm(prompt, config=config)
+
+
+async def acall_llm_sync(prompt: str, model_id: str = None) -> LLMResult:
+    """Async counterpart of call_llm_sync; cancelling the caller cancels the request"""
+    return await get_openai(model_id).acall_llm_sync(prompt)
+
+
 def call_llm_sync(prompt: str, model_id: str = None) -> LLMResult:
-    kwargs = {"model_id": model_id} if model_id else {}
-    
     # Initialize the LLM response variable
     llm_response = None
     
-    # Create OpenAI instance
-    openai = OpenAI(**kwargs)
+    # Reuse the shared OpenAI instance
+    openai = get_openai(model_id)
     
     # Call the synchronous LLM method
     llm_response = openai.call_llm_sync(prompt)
     
-    logger.info(f"Sync LLM call completed with response type: {type(llm_response)}")
+    logger.debug("Sync LLM call completed with response type: %s", type(llm_response))
     
     return llm_response
 
 
 def call_superior_llm(prompt: str, model_id: str = None) -> Iterator[BaseMessageChunk]:
-    kwargs = {"model_id": model_id} if model_id else {}
-
-    openai = OpenAI(**kwargs, model_id=os.getenv("SUPERIOR_OPENAI_MODEL_NAME"))
+    openai = get_openai(model_id or os.getenv("SUPERIOR_OPENAI_MODEL_NAME"))
     llm_response: LLMResult = openai.call_llm(prompt)
     return llm_response
 
 
 def call_superior_llm_sync(prompt: str, model_id: str = None) -> LLMResult:
-    kwargs = {"model_id": model_id} if model_id else {}
-    
     # Initialize the LLM response variable
     llm_response = None
     
-    # Create OpenAI instance
-    openai = OpenAI(**kwargs, model_id=os.getenv("SUPERIOR_OPENAI_MODEL_NAME"))
+    # Reuse the shared OpenAI instance
+    openai = get_openai(model_id or os.getenv("SUPERIOR_OPENAI_MODEL_NAME"))
     
     # Call the synchronous LLM method
     llm_response = openai.call_llm_sync(prompt)
     
-    logger.info(f"Sync LLM call completed with response type: {type(llm_response)}")
+    logger.debug("Sync LLM call completed with response type: %s", type(llm_response))
     
     return llm_response
@@ -0,0 +1,198 @@
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from src.utils.metrics import MODEL_COST_USD, MODEL_TOKENS
+from src.utils.logger import setup_logger
+logger = setup_logger(__name__)
+
+# USD per million tokens. Override or extend with LLM_PRICING, a JSON object
+# of the same shape, e.g.
+#   LLM_PRICING='{"gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6}}'
+# Models are matched by the longest name that prefixes the reported model,
+# so dated snapshots (gpt-4o-mini-2024-07-18) use their family's price.
+DEFAULT_PRICING: Dict[str, Dict[str, float]] = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "text-embedding-3-small": {"input": 0.02},
+    "text-embedding-3-large": {"input": 0.13},
+}
+# Tenant attributed to usage outside of a tracked request
+DEFAULT_TENANT = "default"
+# Tenants that get their own label on the token and cost metrics (comma
+# separated). The tenant is free text from the request, so any other value is
+# counted as "other" to keep the metrics' label cardinality bounded; the
+# ledger and the spans keep the value as sent.
+METRIC_TENANTS = frozenset(
+    name.strip() for name in os.getenv("USAGE_METRIC_TENANTS", "").split(",") if name.strip()
+) | {DEFAULT_TENANT}
+OTHER_TENANT = "other"
+
+
+def tenant_label(tenant: Optional[str]) -> str:
+    """Metric label for a tenant: itself if it is in METRIC_TENANTS, otherwise OTHER_TENANT"""
+    return tenant if tenant in METRIC_TENANTS else OTHER_TENANT
+
+
+def _load_pricing() -> Dict[str, Dict[str, float]]:
+    pricing = dict(DEFAULT_PRICING)
+    raw = os.getenv("LLM_PRICING")
+    if raw:
+        try:
+            pricing.update(json.loads(raw))
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error("Ignoring invalid LLM_PRICING: %s", e)
+    return pricing
+
+
+PRICING = _load_pricing()
+
+
+def model_price(model: Optional[str]) -> Optional[Dict[str, float]]:
+    """Price entry for a model, or None if it is not priced"""
+    if not model:
+        return None
+    if model in PRICING:
+        return PRICING[model]
+    matches = [name for name in PRICING if model.startswith(name)]
+    return PRICING[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(
+    model: Optional[str],
+    input_tokens: int,
+    output_tokens: int = 0,
+    cached_input_tokens: int = 0,
+) -> Optional[float]:
+    """
+    Estimated cost of a request in USD.
+
+    Cached input tokens are part of input_tokens (as OpenAI reports them) and
+    are billed at the cached rate where the model has one.
+
+    Returns:
+        The cost, or None if the model has no price
+    """
+    price = model_price(model)
+    if price is None:
+        return None
+    cached_rate = price.get("cached_input", price["input"])
+    return (
+        (input_tokens - cached_input_tokens) * price["input"]
+        + cached_input_tokens * cached_rate
+        + output_tokens * price.get("output", 0.0)
+    ) / 1_000_000
+
+
+class UsageLedger:
+    """Token usage and cost of the model calls made while track_usage() is active"""
+
+    def __init__(self, tenant: str, parent: Optional["UsageLedger"] = None):
+        self.tenant = tenant
+        self.parent = parent
+        self.totals = self._empty()
+        self.by_node: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {"calls": 0, "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+
+    def add(self, node: str, input_tokens: int, cached_input_tokens: int, output_tokens: int, cost: Optional[float]) -> None:
+        for entry in (self.totals, self.by_node.setdefault(node, self._empty())):
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["cached_input_tokens"] += cached_input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost_usd"] += cost or 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals and per-node usage, with costs rounded for display"""
+        def rounded(entry: Dict[str, Any]) -> Dict[str, Any]:
+            return {**entry, "cost_usd": round(entry["cost_usd"], 6)}
+        return {
+            "tenant": self.tenant,
+            **rounded(self.totals),
+            "nodes": {node: rounded(entry) for node, entry in self.by_node.items()},
+        }
+
+
+_ledger: ContextVar[Optional[UsageLedger]] = ContextVar("usage_ledger", default=None)
+_node: ContextVar[Optional[str]] = ContextVar("usage_node", default=None)
+
+
+@contextmanager
+def track_usage(tenant: Optional[str] = None, ledger: Optional[UsageLedger] = None) -> Iterator[UsageLedger]:
+    """
+    Account the model calls made in the current context to a ledger.
+
+    The ledger is shared with the tasks and executor threads the context
+    spawns, so the graph nodes of a request all record into it. Blocks can be
+    nested; usage counts towards every enclosing ledger. The tenant defaults
+    to the enclosing ledger's.
+
+    Args:
+        tenant: Tenant the usage is attributed to
+        ledger: Record into this ledger instead of a new one, e.g. one created
+            by the caller that reports the usage
+    """
+    if ledger is None:
+        parent = _ledger.get()
+        ledger = UsageLedger(tenant or (parent.tenant if parent else DEFAULT_TENANT), parent)
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+
+
+@contextmanager
+def usage_node(name: str) -> Iterator[None]:
+    """Attribute the model calls made in the enclosed block to a graph node"""
+    token = _node.set(name)
+    try:
+        yield
+    finally:
+        _node.reset(token)
+
+
+def record_usage(
+    model: Optional[str],
+    input_tokens: Optional[int],
+    output_tokens: Optional[int] = 0,
+    cached_input_tokens: Optional[int] = 0,
+) -> Optional[float]:
+    """
+    Record the token usage of one model call.
+
+    The usage is added to the current ledger (and its parents) under the
+    current graph node, and to the token and cost metrics (labelled with
+    tenant_label() of the ledger's tenant).
+
+    Returns:
+        The estimated cost in USD, or None if the model has no price
+    """
+    input_tokens = input_tokens or 0
+    output_tokens = output_tokens or 0
+    cached_input_tokens = cached_input_tokens or 0
+    cost = estimate_cost(model, input_tokens, output_tokens, cached_input_tokens)
+
+    node = _node.get() or "none"
+    ledger = _ledger.get()
+    tenant = tenant_label(ledger.tenant if ledger else DEFAULT_TENANT)
+    while ledger is not None:
+        ledger.add(node, input_tokens, cached_input_tokens, output_tokens, cost)
+        ledger = ledger.parent
+
+    model = model or "unknown"
+    MODEL_TOKENS.labels(tenant, node, model, "input").inc(input_tokens - cached_input_tokens)
+    if cached_input_tokens:
+        MODEL_TOKENS.labels(tenant, node, model, "cached_input").inc(cached_input_tokens)
+    if output_tokens:
+        MODEL_TOKENS.labels(tenant, node, model, "output").inc(output_tokens)
+    if cost:
+        MODEL_COST_USD.labels(tenant, node, model).inc(cost)
+    return cost
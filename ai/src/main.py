@@ -1,14 +1,36 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from src.agents.supervisor import warm_up
+from src.memory.checkpoint import get_thread_store
 from src.routes import chat
+from src.utils.admission import AdmissionRejected
+from src.utils.metrics import MetricsMiddleware, monitor_event_loop_lag, render_metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the conversation thread store, then compile the agent graphs once
+    # so requests only execute them
+    thread_store = get_thread_store()
+    checkpointer = await thread_store.open()
+    warm_up(checkpointer)
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    yield
+    lag_monitor.cancel()
+    await thread_store.close()
+
 
 app = FastAPI(
     title="Document Management System", 
-    description="Intelligent document management system with LLM-powered agents"
+    description="Intelligent document management system with LLM-powered agents",
+    lifespan=lifespan
 )
 
 origins = [
@@ -27,6 +49,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(chat.router, tags=["chat"])
 
 @app.get("/")
@@ -38,7 +62,20 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "chat": chat.chat_admission.stats()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 if __name__ == "__main__":
     import uvicorn
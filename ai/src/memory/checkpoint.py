@@ -0,0 +1,246 @@
+import asyncio
+import contextvars
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from src.utils.logger import setup_logger
+logger = setup_logger(__name__)
+
+# SQLite file holding the conversation checkpoints of every thread
+THREAD_DB_PATH = os.getenv("CHAT_THREAD_DB_PATH", "chat_threads.db")
+# Question/answer turns kept in the state of a thread once they are folded into
+# its summary; turns not summarized yet are always kept
+THREAD_MAX_TURNS = max(1, int(os.getenv("CHAT_THREAD_MAX_TURNS", "10")))
+# Checkpoints kept per thread; only the latest is needed to resume
+THREAD_MAX_CHECKPOINTS = int(os.getenv("CHAT_THREAD_MAX_CHECKPOINTS", "10"))
+# Threads idle for longer than this are evicted
+THREAD_TTL_SECONDS = float(os.getenv("CHAT_THREAD_TTL_SECONDS", str(24 * 3600)))
+# Upper bound on stored threads; the least recently used are evicted first
+THREAD_MAX_COUNT = int(os.getenv("CHAT_THREAD_MAX_COUNT", "10000"))
+THREAD_EVICT_INTERVAL_SECONDS = float(os.getenv("CHAT_THREAD_EVICT_INTERVAL_SECONDS", "300"))
+
+
+def prune_turns(through: int) -> Dict[str, Any]:
+    """History update that drops the turns up to and including turn number through"""
+    return {"prune_through": through}
+
+
+def append_turns(left: Optional[List[Dict[str, Any]]], right: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    State reducer that appends turns.
+
+    Turns are only dropped by a prune_turns() update, which update_thread_summary
+    sends once it has folded them into the summary; the last THREAD_MAX_TURNS
+    are kept either way so the next turn number is known.
+    """
+    turns = list(left or [])
+    for turn in right or []:
+        if "prune_through" not in turn:
+            turns.append(turn)
+            continue
+        keep_from = len(turns) - THREAD_MAX_TURNS
+        turns = [
+            kept for i, kept in enumerate(turns)
+            if i >= keep_from or kept.get("turn", 0) > turn["prune_through"]
+        ]
+    return turns
+
+
+class ThreadStore:
+    """
+    Local SQLite storage for conversation threads.
+
+    Wraps LangGraph's AsyncSqliteSaver (WAL mode, so readers never block the
+    writer) and adds what the saver does not do on its own: a per-thread lock
+    so turns of one thread run one at a time, background jobs that update a
+    thread between turns, pruning of old checkpoints after every turn and
+    eviction of threads that have gone stale.
+    """
+
+    def __init__(self, db_path: str = THREAD_DB_PATH):
+        self.db_path = db_path
+        self.saver: Optional[AsyncSqliteSaver] = None
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._evict_task: Optional[asyncio.Task] = None
+        self._jobs: Set[asyncio.Task] = set()
+
+    async def open(self) -> AsyncSqliteSaver:
+        """Open the database, create the tables and start the eviction loop"""
+        if self.saver is not None:
+            return self.saver
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = await aiosqlite.connect(self.db_path)
+        await self._conn.execute("PRAGMA journal_mode=WAL")
+        await self._conn.execute("PRAGMA synchronous=NORMAL")
+        await self._conn.execute("PRAGMA busy_timeout=5000")
+        self.saver = AsyncSqliteSaver(self._conn)
+        await self.saver.setup()
+        async with self.saver.lock:
+            await self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS thread_activity (
+                    thread_id TEXT PRIMARY KEY,
+                    last_seen REAL NOT NULL
+                )
+                """
+            )
+            await self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_thread_activity_last_seen ON thread_activity (last_seen)"
+            )
+            await self._conn.commit()
+
+        self._evict_task = asyncio.create_task(self._evict_loop())
+        logger.info("Thread checkpoints stored in %s", self.db_path)
+        return self.saver
+
+    async def close(self) -> None:
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            self._evict_task = None
+        for job in list(self._jobs):
+            job.cancel()
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        self.saver = None
+
+    @asynccontextmanager
+    async def turn(self, thread_id: str) -> AsyncIterator[None]:
+        """
+        Run one conversation turn of a thread.
+
+        Concurrent turns of the same thread wait for each other so they never
+        resume from the same checkpoint. Once the turn is over the thread is
+        marked as active and its older checkpoints are pruned.
+        """
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[thread_id] = lock
+        async with lock:
+            try:
+                yield
+            finally:
+                try:
+                    await self._finish_turn(thread_id)
+                except Exception as e:
+                    logger.error("Error pruning thread %s: %s", thread_id, e)
+
+    def schedule(self, thread_id: str, job: Callable[[], Awaitable[None]]) -> None:
+        """
+        Run job in the background as a turn of its own.
+
+        The job waits for the current turn of the thread to end and the next
+        turn waits for the job, so it can safely read and update the thread
+        state. It runs in a fresh context: it does not inherit the deadline of
+        the request that scheduled it.
+        """
+        async def run():
+            async with self.turn(thread_id):
+                try:
+                    await job()
+                except Exception as e:
+                    logger.error("Error in background job of thread %s: %s", thread_id, e)
+
+        task = asyncio.create_task(run(), context=contextvars.Context())
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+
+    async def _finish_turn(self, thread_id: str) -> None:
+        if self.saver is None:
+            return
+        async with self.saver.lock:
+            await self._conn.execute(
+                "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (thread_id, time.time()),
+            )
+            # sub-graph checkpoints are only needed while the turn is running
+            await self._conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns != ''",
+                (thread_id,),
+            )
+            # checkpoint ids are time ordered, so the newest sort last
+            await self._conn.execute(
+                """
+                DELETE FROM checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = '' AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ''
+                    ORDER BY checkpoint_id DESC LIMIT ?
+                )
+                """,
+                (thread_id, thread_id, THREAD_MAX_CHECKPOINTS),
+            )
+            await self._conn.execute(
+                """
+                DELETE FROM writes
+                WHERE thread_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """,
+                (thread_id,),
+            )
+            await self._conn.commit()
+
+    async def evict_stale(self) -> int:
+        """
+        Delete threads idle for longer than THREAD_TTL_SECONDS and, beyond
+        THREAD_MAX_COUNT threads, the least recently used ones.
+
+        Returns:
+            Number of threads evicted
+        """
+        if self.saver is None:
+            return 0
+        cutoff = time.time() - THREAD_TTL_SECONDS
+        async with self.saver.lock:
+            async with self._conn.execute(
+                """
+                SELECT thread_id FROM thread_activity WHERE last_seen < ?
+                UNION
+                SELECT thread_id FROM (
+                    SELECT thread_id FROM thread_activity
+                    ORDER BY last_seen DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (cutoff, THREAD_MAX_COUNT),
+            ) as cursor:
+                stale = [(row[0],) for row in await cursor.fetchall()]
+            if not stale:
+                return 0
+            for table in ("checkpoints", "writes", "thread_activity"):
+                await self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", stale)
+            await self._conn.commit()
+        logger.info("Evicted %s stale chat threads", len(stale))
+        return len(stale)
+
+    async def _evict_loop(self) -> None:
+        while True:
+            try:
+                await self.evict_stale()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error evicting stale chat threads: %s", e)
+            await asyncio.sleep(THREAD_EVICT_INTERVAL_SECONDS)
+
+
+@lru_cache(maxsize=1)
+def get_thread_store() -> ThreadStore:
+    """Return the process-wide thread store (opened by the application lifespan)"""
+    return ThreadStore()
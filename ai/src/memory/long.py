@@ -1,10 +1,14 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Sequence
 import uuid
 import json
 import os
 from datetime import datetime
+from src.memory.record import MemoryRecord
 from src.memory.vectordb import VectorStore
-from src.llm.embed import embed_text
+from src.llm.embed import aembed_text, aembed_texts
+from src.utils.deadline import current_timeout
+from src.utils.metrics import MILVUS_OPERATION_SECONDS
+from src.utils.tracing import span
 from src.llm.runner import get_llm_model, call_llm, call_llm_sync
 
 from src.utils.logger import setup_logger
@@ -13,6 +17,11 @@ logger = setup_logger(__name__)
 # Milvus Configuration
 MEMORY_COLLECTION_NAME = "ltm"
 VECTOR_DIM = 768  # Dimension for text embeddings
+MEMORY_METRIC_TYPE = os.getenv("MEMORY_METRIC_TYPE", "L2")
+
+# Scalar fields stored with each memory; callers request only what they read
+MEMORY_FIELDS = ("question", "answer", "response_id", "created_at", "metadata", "upvotes", "downvotes")
+DEFAULT_MEMORY_FIELDS = ("question", "answer", "response_id")
 
 class LongTermMemory:
     """
@@ -38,29 +47,30 @@ class LongTermMemory:
     def _init_milvus(self) -> bool:
         """Initialize connection to Milvus and create collection if needed"""
         try:            
-            logger.info(f"Initialized Milvus connection for customer {self.customer}")
+            logger.info("Initialized Milvus connection for customer %s", self.customer)
             return True
         except Exception as e:
-            logger.error(f"Error initializing Milvus: {str(e)}")
+            logger.error("Error initializing Milvus: %s", e)
             return False
     
-    def _get_embedding(self, text: str) -> List[float]:
+    async def _get_embedding(self, text: str) -> List[float]:
         """Get text embedding using LLM service"""
         try:
-            embedding = embed_text(text)
+            embedding = await aembed_text(text)
             return embedding
         except Exception as e:
-            logger.error(f"Error getting embedding: {str(e)}")
+            logger.error("Error getting embedding: %s", e)
             # Return a zero vector as fallback
             return [0.0] * VECTOR_DIM
     
-    def save_question_answer(
+    async def save_question_answer(
         self, 
         question: str, 
         answer: str, 
         response_id: Optional[str] = None,
         user_id: Optional[str] = None,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        embedding: Optional[List[float]] = None
     ) -> str:
         """
         Save a question-answer pair to long-term memory.
@@ -71,17 +81,20 @@ class LongTermMemory:
             response_id: Unique identifier for the response (generated if not provided)
             user_id: Identifier for the user who asked the question
             metadata: Additional metadata to store with the memory
+            embedding: Embedding of the question, if the caller already has it
             
         Returns:
             The ID of the saved memory
         """
         try:
-            milvus_client = VectorStore.get_vector_store_connection(self.customer)
+            milvus_client = VectorStore.get_async_vector_store_connection(self.customer)
             if not response_id:
                 response_id = str(uuid.uuid4())
             
-            # Get embedding for the question
-            embedding = self._get_embedding(question)
+            # Get embedding for the question unless it was computed already
+            embedding_cached = embedding is not None
+            if embedding is None:
+                embedding = await self._get_embedding(question)
             
             # Prepare metadata
             metadata_str = "{}"
@@ -89,92 +102,151 @@ class LongTermMemory:
                 metadata_str = json.dumps(metadata)
             
             # Insert data using the dictionary format expected by the MilvusClient
-            milvus_client.insert(
-                collection_name=MEMORY_COLLECTION_NAME,
-                data={
-                    "response_id": response_id,
-                    "question": question,
-                    "answer": answer,
-                    "user_id": user_id or "unknown",
-                    "created_at": datetime.now().isoformat(),
-                    "metadata": metadata_str,
-                    "upvotes": 0,
-                    "downvotes": 0,
-                    "embedding": embedding
-                }
-            )
+            with span("milvus.insert", collection=MEMORY_COLLECTION_NAME, embedding_cached=embedding_cached), \
+                    MILVUS_OPERATION_SECONDS.labels("insert").time():
+                await milvus_client.insert(
+                    collection_name=MEMORY_COLLECTION_NAME,
+                    data={
+                        "response_id": response_id,
+                        "question": question,
+                        "answer": answer,
+                        "user_id": user_id or "unknown",
+                        "created_at": datetime.now().isoformat(),
+                        "metadata": metadata_str,
+                        "upvotes": 0,
+                        "downvotes": 0,
+                        "embedding": embedding
+                    },
+                    timeout=current_timeout()
+                )
             
-            logger.info(f"Saved memory for response ID: {response_id}")
+            logger.info("Saved memory for response ID: %s", response_id)
             return response_id
         except Exception as e:
-            logger.error(f"Error saving memory: {str(e)}")
+            logger.error("Error saving memory: %s", e)
             return ""
     
-    def get_similar_questions(
+    def _range_search_params(self, min_score: float) -> Dict[str, Any]:
+        """
+        Build range search parameters so Milvus drops hits below min_score.
+
+        For similarity metrics (COSINE/IP) the radius is the score itself. For
+        L2, Milvus reports squared distances; the embeddings are unit length,
+        so a similarity of s corresponds to a squared distance of 2 * (1 - s).
+        """
+        if MEMORY_METRIC_TYPE == "L2":
+            radius = 2.0 * (1.0 - min_score)
+        else:
+            radius = min_score
+        return {"metric_type": MEMORY_METRIC_TYPE, "params": {"radius": radius}}
+
+    def _to_similarity(self, distance: float) -> float:
+        """Convert a Milvus distance into a similarity score"""
+        if MEMORY_METRIC_TYPE == "L2":
+            return 1.0 - distance / 2.0
+        return distance
+
+    async def get_similar_questions(
         self, 
         question: str, 
         limit: int = 5,
-        min_score: float = 0.7
-    ) -> List[Dict[str, Any]]:
+        min_score: float = 0.7,
+        output_fields: Sequence[str] = DEFAULT_MEMORY_FIELDS,
+        embedding: Optional[List[float]] = None
+    ) -> List[MemoryRecord]:
         """
         Search for similar questions in long-term memory.
         
+        The score threshold is applied server-side with a range search, so
+        hits below min_score are never transferred.
+        
         Args:
             question: The question to search for similar memories
             limit: Maximum number of results to return
             min_score: Minimum similarity score threshold
+            output_fields: Scalar fields to fetch for each hit (see MEMORY_FIELDS)
+            embedding: Embedding of the question, if the caller already has it
             
         Returns:
             List of similar memories with their similarity scores
         """
         try:
-            milvus_client = VectorStore.get_vector_store_connection(self.customer)
-            collection_name = f"{MEMORY_COLLECTION_NAME}_{self.customer}"
+            # Get embedding for the query unless it was computed already
+            query_embedding = embedding if embedding is not None else await self._get_embedding(question)
             
-            # Get embedding for the query
-            query_embedding = self._get_embedding(question)
+            results = await self._search_embeddings([query_embedding], limit, min_score, output_fields)
+            return results[0]
+        except Exception as e:
+            logger.error("Error searching for similar questions: %s", e)
+            return []
+    
+    async def get_similar_questions_batch(
+        self,
+        questions: List[str],
+        limit: int = 5,
+        min_score: float = 0.7,
+        output_fields: Sequence[str] = DEFAULT_MEMORY_FIELDS,
+        embeddings: Optional[List[List[float]]] = None
+    ) -> List[List[MemoryRecord]]:
+        """
+        Search for similar questions for many questions at once.
+        
+        All questions are embedded in one batch and searched with a single
+        multi-vector Milvus search.
+        
+        Args:
+            questions: The questions to search for
+            limit: Maximum number of results per question
+            min_score: Minimum similarity score threshold
+            output_fields: Scalar fields to fetch for each hit (see MEMORY_FIELDS)
+            embeddings: Embeddings of the questions, if the caller already has them
             
-            # Perform search using the updated API
-            results = milvus_client.search(
+        Returns:
+            One list of similar memories per question, in input order
+        """
+        if not questions:
+            return []
+        try:
+            if embeddings is None:
+                embeddings = await aembed_texts(questions)
+            return await self._search_embeddings(embeddings, limit, min_score, output_fields)
+        except Exception as e:
+            logger.error("Error searching for similar questions in batch: %s", e)
+            return [[] for _ in questions]
+    
+    async def _search_embeddings(
+        self,
+        embeddings: List[List[float]],
+        limit: int,
+        min_score: float,
+        output_fields: Sequence[str]
+    ) -> List[List[MemoryRecord]]:
+        """Run one range search for a list of query vectors"""
+        milvus_client = VectorStore.get_async_vector_store_connection(self.customer)
+        collection_name = f"{MEMORY_COLLECTION_NAME}_{self.customer}"
+        
+        with span("milvus.search", collection=collection_name, queries=len(embeddings), limit=limit) as search_span, \
+                MILVUS_OPERATION_SECONDS.labels("search").time():
+            results = await milvus_client.search(
                 collection_name=collection_name,
-                query_vector=query_embedding,
+                data=embeddings,
                 limit=limit,
-                output_fields=["question", "answer", "response_id", "created_at", "metadata", "upvotes", "downvotes"]
+                output_fields=list(output_fields),
+                search_params=self._range_search_params(min_score),
+                timeout=current_timeout()
             )
-            
-            # Process results
-            similar_questions = []
-            if results:
-                for hit in results:
-                    score = hit.get("score", 0.0)
-                    if score < min_score:
-                        continue
-                        
-                    # Extract metadata
-                    metadata = {}
-                    try:
-                        metadata_str = hit.get("metadata", "{}")
-                        metadata = json.loads(metadata_str)
-                    except:
-                        logger.error(f"Failed to parse metadata JSON: {hit.get('metadata')}")
-                    
-                    # Format the result
-                    similar_question = {
-                        "question": hit.get("question", ""),
-                        "answer": hit.get("answer", ""),
-                        "response_id": hit.get("response_id", ""),
-                        "created_at": hit.get("created_at", ""),
-                        "metadata": metadata,
-                        "upvotes": hit.get("upvotes", 0),
-                        "downvotes": hit.get("downvotes", 0),
-                        "similarity": score
-                    }
-                    similar_questions.append(similar_question)
-            
-            return similar_questions
-        except Exception as e:
-            logger.error(f"Error searching for similar questions: {str(e)}")
-            return []
+            search_span.set(hits=sum(len(hits) for hits in (results or [])))
+        
+        records = [
+            [
+                MemoryRecord.from_hit(hit.get("entity", {}), self._to_similarity(hit.get("distance", 0.0)))
+                for hit in hits
+            ]
+            for hits in (results or [])
+        ]
+        # Milvus returns one hit list per query vector; pad if it returned none
+        records.extend([] for _ in range(len(embeddings) - len(records)))
+        return records
     
     def update_votes(self, response_id: str, upvote: bool) -> bool:
         """
@@ -200,7 +272,7 @@ class LongTermMemory:
             )
             
             if not results:
-                logger.warning(f"No memory found with response_id {response_id}")
+                logger.warning("No memory found with response_id %s", response_id)
                 return False
             
             # Get the memory ID and current votes
@@ -225,10 +297,10 @@ class LongTermMemory:
                 }
             )
             
-            logger.info(f"Updated votes for memory with response_id {response_id}")
+            logger.info("Updated votes for memory with response_id %s", response_id)
             return True
         except Exception as e:
-            logger.error(f"Error updating votes: {str(e)}")
+            logger.error("Error updating votes: %s", e)
             return False
     
     def clear_memories(self) -> bool:
@@ -245,11 +317,11 @@ class LongTermMemory:
             # Check if collection exists then drop it
             if milvus_client.has_collection(collection_name):
                 milvus_client.drop_collection(collection_name)
-                logger.info(f"Cleared all memories for customer {self.customer}")
+                logger.info("Cleared all memories for customer %s", self.customer)
                 return True
             
-            logger.info(f"No memories collection found for customer {self.customer}")
+            logger.info("No memories collection found for customer %s", self.customer)
             return False
         except Exception as e:
-            logger.error(f"Error clearing memories: {str(e)}")
+            logger.error("Error clearing memories: %s", e)
             return False 
\ No newline at end of file
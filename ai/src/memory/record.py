@@ -0,0 +1,77 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from src.utils.logger import setup_logger
+logger = setup_logger(__name__)
+
+
+@dataclass(slots=True)
+class MemoryRecord:
+    """
+    A single hit from the long-term memory collection.
+
+    Only the scalar fields that were requested from Milvus are populated; the
+    rest keep their defaults. The ``metadata`` column is stored as a JSON
+    string and is only decoded the first time it is read.
+
+    Attributes:
+        question: The stored user question
+        answer: The stored system answer
+        response_id: Unique identifier of the stored response
+        created_at: ISO timestamp of when the memory was saved
+        upvotes: Number of upvotes for the response
+        downvotes: Number of downvotes for the response
+        similarity: Similarity score of the hit (higher is more similar)
+        metadata_json: Raw JSON string of the metadata column
+    """
+    question: str = ""
+    answer: str = ""
+    response_id: str = ""
+    created_at: str = ""
+    upvotes: int = 0
+    downvotes: int = 0
+    similarity: float = 0.0
+    metadata_json: Optional[str] = None
+    _metadata: Optional[Dict[str, Any]] = field(default=None, repr=False, compare=False)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Decode the metadata column on first access"""
+        if self._metadata is None:
+            self._metadata = {}
+            if self.metadata_json:
+                try:
+                    decoded = json.loads(self.metadata_json)
+                    if isinstance(decoded, dict):
+                        self._metadata = decoded
+                except (TypeError, ValueError) as e:
+                    logger.error("Failed to parse metadata JSON for response %s: %s", self.response_id, e)
+        return self._metadata
+
+    @classmethod
+    def from_hit(cls, entity: Dict[str, Any], similarity: float) -> "MemoryRecord":
+        """Build a record from the entity of a Milvus search hit"""
+        return cls(
+            question=entity.get("question", ""),
+            answer=entity.get("answer", ""),
+            response_id=entity.get("response_id", ""),
+            created_at=entity.get("created_at", ""),
+            upvotes=entity.get("upvotes", 0),
+            downvotes=entity.get("downvotes", 0),
+            similarity=similarity,
+            metadata_json=entity.get("metadata"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the record as a plain dictionary (decodes metadata)"""
+        return {
+            "question": self.question,
+            "answer": self.answer,
+            "response_id": self.response_id,
+            "created_at": self.created_at,
+            "metadata": self.metadata,
+            "upvotes": self.upvotes,
+            "downvotes": self.downvotes,
+            "similarity": self.similarity,
+        }
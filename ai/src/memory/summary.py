@@ -0,0 +1,173 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import tiktoken
+from langchain_core.runnables import RunnableConfig
+
+from src.llm.runner import get_llm_model
+from src.llm.usage import usage_node
+from src.memory.checkpoint import prune_turns
+from src.utils.logger import setup_logger
+from src.utils.tracing import span
+logger = setup_logger(__name__)
+
+# Most recent turns that are always kept verbatim (when they fit the budget)
+SUMMARY_RECENT_TURNS = int(os.getenv("CHAT_SUMMARY_RECENT_TURNS", "4"))
+# Token budget for the conversation part of the prompt: summary plus recent turns
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+# Upper bound on the rolling summary itself
+SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400"))
+# Rough size of a token, used when no tiktoken encoding can be loaded
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(os.getenv("OPENAI_MODEL_NAME", ""))
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # the encoding files are downloaded on first use
+        logger.warning("Could not load tiktoken encoding, estimating token counts: %s", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens text takes in the chat model's encoding"""
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens"""
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def format_turn(turn: Dict[str, Any]) -> str:
+    # failed turns hold what the user saw before the answer broke off
+    interrupted = " [answer interrupted by an error]" if turn.get("failed") else ""
+    return f"User: {turn.get('question', '')}\nAssistant: {turn.get('answer', '')}{interrupted}\n"
+
+
+def _pending_turns(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Turns of the thread that are not folded into the summary yet"""
+    summarized = state.get("summary_through") or 0
+    return [turn for turn in state.get("history") or [] if turn.get("turn", 0) > summarized]
+
+
+def _recent_turns(turns: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """The newest turns (at most SUMMARY_RECENT_TURNS) that fit in budget tokens"""
+    recent: List[Dict[str, Any]] = []
+    for turn in reversed(turns[-SUMMARY_RECENT_TURNS:]):
+        budget -= count_tokens(format_turn(turn))
+        if budget < 0:
+            break
+        recent.append(turn)
+    recent.reverse()
+    return recent
+
+
+def build_conversation_context(state: Dict[str, Any]) -> str:
+    """
+    Conversation context for the answer prompt.
+
+    The rolling summary followed by the most recent turns, kept within
+    HISTORY_TOKEN_BUDGET: older turns that do not fit are left out here and
+    folded into the summary after the answer by update_thread_summary.
+    """
+    summary = state.get("conversation_summary") or ""
+    recent = _recent_turns(_pending_turns(state), HISTORY_TOKEN_BUDGET - count_tokens(summary))
+    if not summary and not recent:
+        return ""
+
+    context = "Earlier in this conversation:\n"
+    if summary:
+        context += f"Summary: {summary}\n\n"
+    for turn in recent:
+        context += format_turn(turn) + "\n"
+    return context
+
+
+async def summarize_turns(summary: str, turns: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Fold turns into the rolling summary.
+
+    Returns:
+        The new summary, or None if the LLM call failed
+    """
+    transcript = "\n".join(format_turn(turn) for turn in turns)
+    prompt = f"""
+    Update the running summary of a conversation with the new turns below.
+    Keep the facts, names, numbers and open questions a follow-up question
+    might refer to, drop small talk, and answer with the summary only, in at
+    most {SUMMARY_MAX_TOKENS} tokens.
+
+    Current summary:
+    {summary or "(empty)"}
+
+    New turns:
+    {transcript}
+    """
+    try:
+        response = await get_llm_model().ainvoke(prompt)
+    except Exception as e:
+        logger.error("Error summarizing conversation: %s", e)
+        return None
+    return truncate_tokens(str(response.content).strip(), SUMMARY_MAX_TOKENS)
+
+
+async def update_thread_summary(app, config: RunnableConfig) -> None:
+    """
+    Fold the turns that no longer fit into the recent window into the summary.
+
+    Runs after a turn has been answered, as a background job of the thread
+    (see ThreadStore.schedule), so the summarization call never adds to the
+    latency of an answer. Only the turns that fell out of the window since
+    the last update are sent, which keeps each update small. Turns leave the
+    history only once they are in the summary, so a failed update loses
+    nothing: they are folded by the next one.
+
+    Args:
+        app: The checkpointed supervisor graph
+        config: Run config with the thread_id
+    """
+    snapshot = await app.aget_state(config)
+    state = snapshot.values
+    if not state:
+        return
+
+    summary = state.get("conversation_summary") or ""
+    pending = _pending_turns(state)
+    recent = _recent_turns(pending, HISTORY_TOKEN_BUDGET - SUMMARY_MAX_TOKENS)
+    to_fold = pending[:len(pending) - len(recent)]
+    if not to_fold:
+        return
+
+    with span("chat.summary", turns=len(to_fold)), usage_node("update_thread_summary"):
+        new_summary = await summarize_turns(summary, to_fold)
+    if new_summary is None:
+        return
+    await app.aupdate_state(
+        config,
+        {
+            "conversation_summary": new_summary,
+            "summary_through": to_fold[-1].get("turn", 0),
+            "history": [prune_turns(to_fold[-1].get("turn", 0))],
+        },
+        as_node="save_memories",
+    )
+    logger.info(
+        "Folded %s turns into the summary of thread %s",
+        len(to_fold), config.get("configurable", {}).get("thread_id"),
+    )
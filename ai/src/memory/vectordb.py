@@ -1,7 +1,7 @@
 import os
 from typing import Any, Dict, List
 from pydantic import BaseModel
-from pymilvus import MilvusClient
+from pymilvus import AsyncMilvusClient, MilvusClient
 from src.utils.logger import setup_logger
 logger = setup_logger(__name__)
 
@@ -12,6 +12,7 @@ class VectorStoreConnection(BaseModel):
 
 
 VECTOR_STORE_CONNECTIONS: list[VectorStoreConnection] = []
+ASYNC_VECTOR_STORE_CONNECTIONS: Dict[str, AsyncMilvusClient] = {}
 
 
 class VectorStore:
@@ -28,7 +29,7 @@ class VectorStore:
                 VectorStoreConnection(customer=customer, client=self.client)
             )
         except Exception as e:
-            logger.error(f"Failed to initialize Milvus client: {e}")
+            logger.error("Failed to initialize Milvus client: %s", e)
             raise
 
     @staticmethod
@@ -43,11 +44,30 @@ class VectorStore:
         )
 
         if existing_connection:
-            logger.info(
-                f"Using existing vectorstore connection for customer {customer}"
-            )
+            logger.debug("Using existing vectorstore connection for customer %s", customer)
             return existing_connection
         else:
-            logger.info(f"Creating new vectorstore connection for customer {customer}")
+            logger.info("Creating new vectorstore connection for customer %s", customer)
             new_connection = VectorStore(customer=customer)
             return new_connection.client
+
+    @staticmethod
+    def get_async_vector_store_connection(customer: str) -> AsyncMilvusClient:
+        """
+        Return the asyncio Milvus client for a customer.
+
+        Requests use this client so that cancelling a request (e.g. when the
+        client disconnects) also cancels its in-flight Milvus calls. It must
+        be first requested from within the running event loop.
+        """
+        client = ASYNC_VECTOR_STORE_CONNECTIONS.get(customer)
+        if client is None:
+            logger.info("Creating new async vectorstore connection for customer %s", customer)
+            client = AsyncMilvusClient(
+                uri=f"http://{os.getenv('MILVUS_HOST')}:{os.getenv('MILVUS_PORT')}",
+                db_name=customer,
+                user=os.getenv("MILVUS_USER"),
+                password=os.getenv("MILVUS_PASSWORD"),
+            )
+            ASYNC_VECTOR_STORE_CONNECTIONS[customer] = client
+        return client
@@ -1,26 +1,276 @@
 from datetime import datetime
+import asyncio
 import os
 import json
-from time import sleep
+import time
 import uuid
 import requests
-from typing import Any, AsyncGenerator, Dict, List, Optional
-from fastapi import APIRouter, Body, Depends
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Body, Depends, Request
 from fastapi.responses import StreamingResponse
-from src.agents.supervisor import SupervisorAgent
-from src.dto.chat import ChatInput, ChatOutput
+from starlette.background import BackgroundTask
+from fastapi import HTTPException
+from src.agents.batch import BATCH_CONCURRENCY, run_batch
+from src.agents.supervisor import get_supervisor_agent
+from src.dto.chat import BatchChatInput, ChatInput, ChatOutput
+from src.llm.embed import track_embedding_calls
+from src.llm.usage import DEFAULT_TENANT, UsageLedger, track_usage
+from src.memory.checkpoint import get_thread_store
+from src.memory.summary import update_thread_summary
+from src.utils.admission import AdmissionController
+from src.utils.deadline import DeadlineExceeded, get_deadline, reset_deadline, start_deadline
+from src.utils.trace import format_trace
+from src.utils.tracing import span
 from pydantic import BaseModel
-from src.utils.logger import setup_logger
+from src.utils.logger import Lazy, setup_logger
 logger = setup_logger(__name__)
 
 
 router = APIRouter()
 
+# Time budget for a whole /chat request; every LLM, embedding and Milvus call
+# made for the request uses what is left of it as its timeout
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "60"))
+# How often the stream checks whether the client is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("CHAT_DISCONNECT_POLL_SECONDS", "0.5"))
+
+# Each admitted stream fans out into several LLM calls, so concurrency is
+# bounded and overflow is shed early instead of timing everyone out
+chat_admission = AdmissionController(
+    max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+    max_queue_wait=float(os.getenv("CHAT_MAX_QUEUE_WAIT_SECONDS", "5")),
+)
+
+CHAT_BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "1000"))
+
+
+def build_chat_run(input: ChatInput) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Build the graph input and run config for a chat question.
+
+    Questions with a thread_id run on the checkpointed graph: the thread's
+    saved state (previous turns and their summary) is restored and the
+    per-turn keys, including the memories and plan of the last question, are
+    reset here.
+    """
+    task = {
+        "original": input.question,
+        "session_id": input.session_id or "",
+        "thread_id": input.thread_id or "",
+    }
+    configurable = {"question": input.question}
+    if not input.thread_id or get_supervisor_agent().threaded_app is None:
+        return {"task": task}, {"configurable": configurable}
+
+    configurable["thread_id"] = input.thread_id
+    graph_input = {
+        "task": task,
+        "answer": None,
+        "memories": None,
+        "plan": None,
+        "question_embedding": None,
+        "next_step": None,
+        "task_complete": False,
+        "node_timings": None,
+    }
+    return graph_input, {"configurable": configurable}
+
+
+async def stream_graph_events(
+    request: Request,
+    graph_input: Dict[str, Any],
+    config: Dict[str, Any],
+    deadline_seconds: float = CHAT_DEADLINE_SECONDS,
+    stream_mode: Optional[List[str]] = None,
+    usage: Optional[UsageLedger] = None,
+) -> AsyncGenerator[Any, None]:
+    """
+    Run the supervisor graph in a background task and yield its events.
+
+    Without stream_mode this yields astream_events(version="v2") events. With
+    a list of LangGraph stream modes (e.g. ["custom", "updates"]) it yields
+    (mode, chunk) tuples from astream(), which skips building and serializing
+    an event for every chain/tool/model step.
+
+    The run is cancelled as soon as the client disconnects, the deadline
+    passes, or the consumer stops iterating; cancellation propagates into the
+    in-flight async LLM, embedding and Milvus calls of the graph.
+
+    When config carries a thread_id the checkpointed graph is used and the run
+    holds that thread's turn (see ThreadStore.turn). Once the turn has been
+    answered, the thread summary is updated in the background.
+
+    The token usage of the run is recorded into usage (see src.llm.usage),
+    which the caller reports once the stream is over.
+    """
+    deadline_token = start_deadline(deadline_seconds)
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    thread_id = config.get("configurable", {}).get("thread_id")
+
+    async def run_graph(app):
+        if stream_mode:
+            events = app.astream(graph_input, config=config, stream_mode=stream_mode)
+        else:
+            events = app.astream_events(graph_input, version="v2", config=config)
+        async for event in events:
+            queue.put_nowait(event)
+
+    async def produce():
+        agent = get_supervisor_agent()
+        try:
+            with span("chat.request", thread=bool(thread_id), stream_mode=",".join(stream_mode or [])) as root, \
+                    track_embedding_calls() as embedding_calls, track_usage(ledger=usage) as run_usage:
+                if thread_id:
+                    thread_store = get_thread_store()
+                    async with thread_store.turn(thread_id):
+                        await run_graph(agent.threaded_app)
+                    thread_store.schedule(
+                        thread_id,
+                        lambda: update_thread_summary(
+                            agent.threaded_app, {"configurable": {"thread_id": thread_id}}
+                        ),
+                    )
+                else:
+                    await run_graph(agent.app)
+                root.set(
+                    tenant=run_usage.tenant,
+                    embedding_calls=embedding_calls.calls,
+                    input_tokens=run_usage.totals["input_tokens"],
+                    output_tokens=run_usage.totals["output_tokens"],
+                    cost_usd=run_usage.totals["cost_usd"],
+                )
+            logger.info("Chat graph run made %s embedding calls", embedding_calls.calls)
+            logger.info(
+                "Chat request usage: tenant=%s input_tokens=%s output_tokens=%s cost_usd=%.6f",
+                run_usage.tenant, run_usage.totals["input_tokens"],
+                run_usage.totals["output_tokens"], run_usage.totals["cost_usd"],
+            )
+        finally:
+            queue.put_nowait(done)
+
+    # the task copies the current context, so it inherits the deadline
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            # checked on every event too, so a run that keeps producing events
+            # cannot outlive its deadline
+            if get_deadline().expired:
+                raise DeadlineExceeded(f"Chat request exceeded its {deadline_seconds}s deadline")
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=DISCONNECT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, cancelling chat graph run")
+                    return
+                continue
+            if event is done:
+                break
+            yield event
+        # surface errors raised inside the graph run
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+        reset_deadline(deadline_token)
+
+
+def sse_frame(event: str, data: Dict[str, Any]) -> str:
+    """Encode one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def chat_message_stream(input: ChatInput, request: Request) -> AsyncGenerator[str, None]:
+    """
+    Low-overhead chat stream.
+
+    Subscribes only to the answer tokens that generate_answer writes to the
+    stream writer ("custom" mode) and to node state updates, instead of every
+    graph event. The output is SSE with one JSON payload per event: "meta"
+    first, a "token" per answer chunk, then "done" with the response_id and
+    the token usage of the request, or "error" (after any partial tokens)
+    when the request or the answer generation failed.
+    """
+    request_start = time.perf_counter()
+    first_token_ms = None
+    node_timings: List[Dict[str, Any]] = []
+    done: Dict[str, Any] = {}
+    answer_error = None
+    usage = UsageLedger(input.tenant or DEFAULT_TENANT)
+
+    yield sse_frame("meta", {"session_id": input.session_id, "thread_id": input.thread_id})
+    graph_input, config = build_chat_run(input)
+    try:
+        async for mode, chunk in stream_graph_events(
+            request,
+            graph_input,
+            config=config,
+            stream_mode=["custom", "updates"],
+            usage=usage,
+        ):
+            if mode == "custom":
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - request_start) * 1000
+                    logger.info("Chat time to first token: %.0f ms", first_token_ms)
+                yield sse_frame("token", {"text": chunk["token"]})
+                continue
+
+            # "updates": {node_name: partial state} after each node
+            for node, update in chunk.items():
+                if not isinstance(update, dict):
+                    continue
+                node_timings.extend(update.get("node_timings", []))
+                answer = update.get("answer")
+                if node in ("generate_answer", "document_agent") and answer and not answer.get("streamed"):
+                    # fallback and document agent answers arrive in one piece
+                    yield sse_frame("token", {"text": answer.get("summary") or answer.get("response", "")})
+                if node == "generate_answer" and answer and answer.get("error"):
+                    answer_error = answer["error"]
+                if node == "save_memories" and answer:
+                    done["response_id"] = answer.get("response_id")
+
+        done["ttft_ms"] = first_token_ms
+        done["usage"] = usage.summary()
+        if answer_error:
+            # the tokens sent so far are all the client gets for this turn
+            yield sse_frame("error", {"error": answer_error, "partial_response": first_token_ms is not None, **done})
+        else:
+            yield sse_frame("done", done)
+        logger.info("Chat request trace: %s", Lazy(format_trace, node_timings))
+
+    except DeadlineExceeded as e:
+        logger.warning("Chat stream cancelled: %s", e)
+        yield sse_frame("error", {"error": "Request deadline exceeded", "partial_response": True})
+
+    except Exception as e:
+        logger.exception("Fatal error in chat message stream: %s", e)
+        yield sse_frame("error", {"error": "Error processing response", "partial_response": True})
+
 
 @router.post("/chat")
 async def chat(
     input: ChatInput,
+    request: Request,
 ):
+    # Raises AdmissionRejected (429/503 with Retry-After) before streaming starts
+    ticket = await chat_admission.acquire()
+
+    if input.stream_mode == "messages":
+        async def message_stream():
+            try:
+                async for frame in chat_message_stream(input, request):
+                    yield frame
+            finally:
+                ticket.release()
+
+        return StreamingResponse(
+            message_stream(),
+            media_type="text/event-stream",
+            background=BackgroundTask(ticket.release),
+        )
+
     async def chat_stream(input: ChatInput):
 
 
@@ -29,18 +279,19 @@ async def chat(
 
         response_complete: str = response_start
         error_msg = f'{{"error": "Error processing response", "partial_response": true}}'
+        request_start = time.perf_counter()
+        first_token_ms = None
+        usage = UsageLedger(input.tenant or DEFAULT_TENANT)
 
         try:
             yield response_start
 
-            async for event in SupervisorAgent().app.astream_events(
-                {
-                    "task": {
-                        "original": input.question,
-                    },
-                },
-                version="v2",
-                config={"configurable": {"question": input.question}},
+            graph_input, config = build_chat_run(input)
+            async for event in stream_graph_events(
+                request,
+                graph_input,
+                config=config,
+                usage=usage,
             ):
                 try:
                     kind = event["event"]
@@ -52,20 +303,31 @@ async def chat(
                         ev = event["data"]
 
                         if ev["chunk"].content:
+                            if first_token_ms is None:
+                                first_token_ms = (time.perf_counter() - request_start) * 1000
+                                logger.info("Chat time to first token: %.0f ms", first_token_ms)
                             response_complete += ev["chunk"].content
                             yield ev["chunk"].content
 
-                    # get response_id from state on chain_end for generate_answer
+                    # tokens were already streamed above; only emit the summary
+                    # when generate_answer produced it without streaming (fallbacks)
                     if kind == "on_chain_end" and event["name"] == "generate_answer":
                         if "output" in event["data"] and "answer" in event["data"]["output"]:
                             answer_data = event["data"]["output"]["answer"]
-                            if "summary" in answer_data:
-                                response_complete += answer_data["summary"]
-                                yield answer_data["summary"]
-                            elif "response" in answer_data:
-                                # Fallback to response if summary doesn't exist
-                                response_complete += answer_data["response"]
-                                yield answer_data["response"]
+                            if not answer_data.get("streamed"):
+                                fallback = answer_data.get("summary") or answer_data.get("response", "")
+                                response_complete += fallback
+                                yield fallback
+                            elif answer_data.get("error"):
+                                # the stream broke off after the tokens above
+                                error_str = f',"error":{json.dumps(answer_data["error"])},"partial_response":true'
+                                response_complete += error_str
+                                yield error_str
+
+                    # log the per-request trace once the whole graph has finished
+                    if kind == "on_chain_end" and event["name"] == "LangGraph" and not event.get("parent_ids"):
+                        output = event["data"].get("output") or {}
+                        logger.info("Chat request trace: %s", Lazy(format_trace, output.get("node_timings", [])))
 
                     if kind == "on_chain_end" and event["name"] == "save_memories":
                         if "output" in event["data"] and "answer" in event["data"]["output"] and "response_id" in event["data"]["output"]["answer"]:
@@ -76,18 +338,70 @@ async def chat(
                 except Exception as e:
                     import traceback
                     error_trace = traceback.format_exc()
-                    logger.error(f"Error processing event: {str(e)}")
-                    logger.error(f"Error traceback: {error_trace}")
+                    logger.error("Error processing event: %s", e)
+                    logger.error("Error traceback: %s", error_trace)
                     yield error_msg + "}"
                     return
 
+            yield f',"usage":{json.dumps(usage.summary())}'
             yield response_end
 
+        except DeadlineExceeded as e:
+            logger.warning("Chat stream cancelled: %s", e)
+            yield '{"error": "Request deadline exceeded", "partial_response": true}}'
+
         except Exception as e:            
             import traceback
             error_trace = traceback.format_exc()
-            logger.error(f"Fatal error in chat stream: {str(e)}")
-            logger.error(f"Error traceback: {error_trace}")
+            logger.error("Fatal error in chat stream: %s", e)
+            logger.error("Error traceback: %s", error_trace)
             yield error_msg + "}"
 
-    return StreamingResponse(chat_stream(input), media_type="text/event-stream")
\ No newline at end of file
+        finally:
+            ticket.release()
+
+    # the background task covers streams that end before the generator starts
+    return StreamingResponse(
+        chat_stream(input),
+        media_type="text/event-stream",
+        background=BackgroundTask(ticket.release),
+    )
+
+
+@router.post("/chat/batch")
+async def chat_batch(
+    input: BatchChatInput,
+    request: Request,
+):
+    """
+    Answer many questions in one request.
+
+    Results are streamed back as NDJSON, one line per question, in completion
+    order. The whole batch holds a single admission slot.
+    """
+    if len(input.questions) > CHAT_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch may contain at most {CHAT_BATCH_MAX_QUESTIONS} questions",
+        )
+    concurrency = min(input.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+
+    ticket = await chat_admission.acquire()
+
+    async def batch_stream():
+        results = run_batch(input.questions, concurrency=concurrency, tenant=input.tenant)
+        try:
+            async for result in results:
+                yield json.dumps(result) + "\n"
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, cancelling chat batch")
+                    return
+        finally:
+            await results.aclose()
+            ticket.release()
+
+    return StreamingResponse(
+        batch_stream(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(ticket.release),
+    )
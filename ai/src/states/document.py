@@ -1,4 +1,5 @@
 from typing import Dict, Any, TypedDict, Optional, List
+from src.memory.record import MemoryRecord
 
 class DocumentState(TypedDict, total=False):
     """
@@ -6,6 +7,9 @@ class DocumentState(TypedDict, total=False):
     
     Attributes:
         task: The original task or query from the user
+        question_embedding: Embedding of the task passed in by the supervisor;
+            Milvus searches should use it instead of embedding the task again
+        memories: Long-term memories the supervisor already retrieved for the task
         operation: The operation to perform (create, update, fetch, search, comment)
         document_data: Data for documents
         document_id: ID of the specific document to operate on
@@ -22,8 +26,11 @@ class DocumentState(TypedDict, total=False):
         error: Error message if an operation fails
         result: Result of the operation
         answer: Final answer to return to the user
+        task_complete: Whether the answer is final and needs no further processing
     """
     task: str
+    question_embedding: Optional[List[float]]
+    memories: Optional[List[MemoryRecord]]
     operation: str
     document_data: Optional[Dict[str, Any]]
     document_id: Optional[str]
@@ -39,4 +46,5 @@ class DocumentState(TypedDict, total=False):
     milvus_search_results: Optional[List[Dict[str, Any]]]
     error: Optional[str]
     result: Optional[Dict[str, Any]]
-    answer: Optional[Dict[str, Any]] 
\ No newline at end of file
+    answer: Optional[Dict[str, Any]]
+    task_complete: Optional[bool] 
\ No newline at end of file
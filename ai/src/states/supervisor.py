@@ -1,6 +1,9 @@
 from typing import Dict, Any, TypedDict, Optional, List, Literal
 from langgraph.graph.message import add_messages
 from typing import Annotated
+from src.memory.checkpoint import append_turns
+from src.memory.record import MemoryRecord
+from src.utils.trace import merge_timings
 
 class SupervisorState(TypedDict, total=False):
     """
@@ -9,7 +12,9 @@ class SupervisorState(TypedDict, total=False):
     Attributes:
         user: Information about the user making the request
         task: The original task from the user and its enriched form
-        memories: Relevant memories retrieved from long-term storage
+        memories: Relevant memories (MemoryRecord) retrieved from long-term storage
+        question_embedding: Embedding of the current question, computed once per
+            request and reused by every node that needs it
         entities: Entities extracted from the conversation
         context: Context information extracted from the conversation
         next_step: The next step in the workflow (document, generate_answer)
@@ -18,10 +23,18 @@ class SupervisorState(TypedDict, total=False):
         answer: The final answer to return to the user
         messages: Messages for langgraph communication
         executed_steps: Steps that have been executed in the workflow
+        task_complete: Set by sub-agents when their answer needs no further processing
+        node_timings: Start/end times of each node run, used for the request trace
+            (reset at the start of each turn by passing None)
+        history: Previous question/answer turns of the thread; turns folded into
+            the summary are pruned down to the most recent CHAT_THREAD_MAX_TURNS
+        conversation_summary: Rolling summary of the turns folded out of history
+        summary_through: Number of the last turn folded into the summary
     """
     user: Dict[str, Any]
     task: Dict[str, str]
-    memories: Optional[List[Dict[str, Any]]]
+    memories: Optional[List[MemoryRecord]]
+    question_embedding: Optional[List[float]]
     entities: Optional[Dict[str, Any]]
     context: Optional[str]
     next_step: Optional[str]
@@ -31,4 +44,10 @@ class SupervisorState(TypedDict, total=False):
     messages: Annotated[list, add_messages]
     executed_steps: Annotated[
         Literal["document", "generate_answer"], add_messages
-    ] 
\ No newline at end of file
+    ]
+    task_complete: Optional[bool]
+    node_timings: Annotated[List[Dict[str, Any]], merge_timings]
+    history: Annotated[List[Dict[str, Any]], append_turns]
+    conversation_summary: Optional[str]
+    summary_through: Optional[int]
+ 
\ No newline at end of file
@@ -1,75 +1,78 @@
 import json
+import time
 import uuid
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-from src.llm.runner import get_llm_model, call_llm, call_llm_sync
+from langchain_core.runnables import RunnableConfig
+from langgraph.types import StreamWriter
+from src.llm.embed import aembed_text
+from src.llm.runner import get_llm_model, call_llm, call_llm_sync, acall_llm_sync, astream_llm
 from src.memory.long import LongTermMemory
+from src.memory.summary import build_conversation_context
 from src.utils.logger import setup_logger
+from src.utils.metrics import record_cache_lookup
+from src.utils.tracing import current_span
 logger = setup_logger(__name__)
 ltm = LongTermMemory(customer="default")
 
-def retrieve_memories(state: Dict[str, Any]) -> Dict[str, Any]:
+def _get_original_task(state: Dict[str, Any]) -> str:
+    """Extract the original task text from the state"""
+    task = state.get("task", {})
+    if isinstance(task, dict):
+        return task.get("original", "")
+    elif isinstance(task, str):
+        return task
+    return str(task)
+
+async def retrieve_memories(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Retrieve relevant memories from long-term memory.
     
     This tool queries the long-term memory to find relevant information
-    based on the user's task.
+    based on the user's task. It runs in parallel with route_request and
+    draft_plan, so it only returns the keys it updates. Memories passed in
+    with the input (e.g. by the batch runner) are used as-is; chat turns
+    reset them to None so every question gets its own.
+    
+    The question embedding is kept in the state so save_memories and the
+    document agent reuse it instead of embedding the question again.
     """
-
-    logger.info(f"Retrieving memories for task: {state.get('original', '')}")
-    original_task = state.get("original", "")
+    if state.get("memories") is not None:
+        current_span().set(cache_hit=True)
+        record_cache_lookup("memories", hit=True)
+        return {}
+    
+    original_task = _get_original_task(state)
+    logger.debug("Retrieving memories for task: %s", original_task)
+    memories = []
+    embedding = state.get("question_embedding")
+    current_span().set(cache_hit=False, embedding_cached=embedding is not None)
+    record_cache_lookup("memories", hit=False)
+    record_cache_lookup("question_embedding", hit=embedding is not None)
     if original_task:
         try:
-            memories = ltm.get_similar_questions(original_task)
-            state["memories"] = memories
+            if embedding is None:
+                embedding = await aembed_text(original_task)
+            memories = await ltm.get_similar_questions(original_task, embedding=embedding)
         except Exception as e:
-            logger.error(f"Error retrieving memories: {str(e)}")
-            state["memories"] = []
+            logger.error("Error retrieving memories: %s", e)
     
-    return state
+    return {"memories": memories, "question_embedding": embedding}
 
-def create_plan(state: Dict[str, Any]) -> Dict[str, Any]:
+async def route_request(state: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Create a plan for handling the task.
+    Classify the task and choose the agent that should handle it.
+    
+    Routing only needs the task itself, so it runs in parallel with
+    retrieve_memories and draft_plan.
     """
     # Check if we already have enough information to give an answer directly
-    if "ticket_data" in state or "answer" in state:
+    if "ticket_data" in state or state.get("answer"):
         logger.info("Already have ticket data or answer, skipping to generate_answer")
-        state["next_step"] = "generate_answer"
-        state["plan"] = "Answer directly with the information already available."
-        
-        # Add to executed steps
-        if "executed_steps" not in state:
-            state["executed_steps"] = []
-        state["executed_steps"].append("create_plan")
-        
-        return state
-    
-    logger.info(f"Creating plan for task: {state.get('task')}")
+        return {"next_step": "generate_answer"}
     
-    # Get the task in the most usable format
-    task = state.get("task", {})
-    enriched_task = ""
-    
-    if isinstance(task, dict):
-        # If task is a dictionary, try to get original key or use the whole dict
-        enriched_task = task.get("original", str(task))
-    elif isinstance(task, str):
-        enriched_task = task
-    else:
-        # Convert anything else to string
-        enriched_task = str(task)
-    
-    # Enrich with memories if available
-    memories = state.get("memories", [])
-    if memories:
-        enriched_task += "\n\nRelevant context from memories:"
-        for i, memory in enumerate(memories[:3], 1):  # Use top 3 memories
-            if isinstance(memory, dict):
-                q = memory.get("question", "")
-                a = memory.get("answer", "")
-                if q and a:
-                    enriched_task += f"\n{i}. Q: {q}\nA: {a}"
+    enriched_task = _get_original_task(state)
+    logger.debug("Routing task: %s", enriched_task)
     
     # Determine the appropriate agent
     prompt = f"""
@@ -83,10 +86,9 @@ def create_plan(state: Dict[str, Any]) -> Dict[str, Any]:
     Return ONLY one of these values: 'document', or 'generate_answer'.
     """
     
-    # Get initial response
     try:
         logger.info("Calling LLM to determine agent")
-        response = call_llm_sync(prompt)
+        response = await acall_llm_sync(prompt)
         next_step = ""
         
         # Extract content from response
@@ -101,28 +103,50 @@ def create_plan(state: Dict[str, Any]) -> Dict[str, Any]:
         else:
             next_step = "generate_answer"
             
-        logger.info(f"Determined next_step: {next_step}")
+        logger.info("Determined next_step: %s", next_step)
         
     except Exception as e:
-        logger.error(f"Error determining agent: {str(e)}")
+        logger.error("Error determining agent: %s", e)
         # Default to generate_answer if there's an error
         next_step = "generate_answer"
     
-    # Create a detailed plan
+    return {"next_step": next_step}
+
+async def draft_plan(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Draft a step-by-step plan for handling the task.
+    
+    The plan is drafted from the task alone so it can run in parallel with
+    retrieve_memories and route_request; memories are added to the prompt
+    when the answer is generated. A plan passed in with the input is used
+    as-is; chat turns reset it so every question gets its own.
+    """
+    if state.get("plan"):
+        current_span().set(cache_hit=True)
+        record_cache_lookup("plan", hit=True)
+        return {}
+
+    if "ticket_data" in state or state.get("answer"):
+        return {"plan": "Answer directly with the information already available."}
+    
+    record_cache_lookup("plan", hit=False)
+    enriched_task = _get_original_task(state)
+    
     prompt_plan = f"""
     Create a detailed plan for handling this task:
     
     Task: {enriched_task}
     
-    Selected agent: {next_step}
+    Available agents:
+    1. Document Agent - For analyzing documents, managing documents, etc.
+    2. Direct answer - When no agent is clearly appropriate.
     
-    Provide a step-by-step plan for how this agent should address the task.
+    Provide a step-by-step plan for how the task should be addressed.
     """
     
-    # Get plan
     try:
         logger.info("Calling LLM to create plan")
-        response_plan = call_llm_sync(prompt_plan)
+        response_plan = await acall_llm_sync(prompt_plan)
         plan = ""
         
         # Extract content from response
@@ -134,29 +158,24 @@ def create_plan(state: Dict[str, Any]) -> Dict[str, Any]:
         logger.info("Plan created successfully")
         
     except Exception as e:
-        logger.error(f"Error creating plan: {str(e)}")
+        logger.error("Error creating plan: %s", e)
         # Use a simple fallback plan
-        plan = f"Process the request using the {next_step} agent."
-    
-    # Update the state
-    state["next_step"] = next_step
-    state["plan"] = plan
-    
-    # Add to executed steps
-    if "executed_steps" not in state:
-        state["executed_steps"] = []
-    state["executed_steps"].append("create_plan")
-    
-    logger.info(f"Created plan with next step: {next_step}")
+        plan = "Answer the request directly and concisely."
     
-    return state
+    return {"plan": plan}
 
-def generate_answer(state: Dict[str, Any]) -> Dict[str, Any]:
+async def generate_answer(state: Dict[str, Any], config: RunnableConfig, writer: StreamWriter) -> Dict[str, Any]:
     """
     Generate an answer to the user's task.
+    
+    The completion is streamed: tokens surface as on_chat_model_stream events
+    and, for the low-overhead "custom" stream mode, are written directly to
+    the stream writer while they arrive. The answer text is assembled from the
+    same chunks for save_memories. If the stream fails midway the answer keeps
+    the partial text the client received and carries an "error".
     """
     try:
-        logger.info(f"Generating answer with state keys: {list(state.keys())}")
+        logger.debug("Generating answer with state keys: %s", list(state.keys()))
         
         task = state.get("task", {})
         memories = state.get("memories", [])
@@ -177,18 +196,18 @@ def generate_answer(state: Dict[str, Any]) -> Dict[str, Any]:
             logger.warning("No question found in task for generate_answer")
             original_question = "No question provided"
         else:
-            logger.info(f"Found question: {original_question}")
+            logger.debug("Found question: %s", original_question)
         
         # Format memories as relevant context
         memory_context = ""
         if memories:
             memory_context = "Based on previous interactions:\n"
             for i, memory in enumerate(memories[:3], 1):  # Use top 3 memories
-                if isinstance(memory, dict):
-                    q = memory.get("question", "")
-                    a = memory.get("answer", "")
-                    if q and a:
-                        memory_context += f"{i}. Question: {q}\n   Answer: {a}\n\n"
+                if memory.question and memory.answer:
+                    memory_context += f"{i}. Question: {memory.question}\n   Answer: {memory.answer}\n\n"
+        
+        # Rolling summary and recent turns of the thread, within a fixed token budget
+        history_context = build_conversation_context(state)
         
         # Generate a response
         prompt = f"""
@@ -196,6 +215,8 @@ def generate_answer(state: Dict[str, Any]) -> Dict[str, Any]:
         
         Question: {original_question}
         
+        {history_context}
+        
         {memory_context}
         
         {plan}
@@ -206,24 +227,32 @@ def generate_answer(state: Dict[str, Any]) -> Dict[str, Any]:
         logger.info("Calling LLM to generate answer")
         
         # Use try-except block for LLM call
+        started = time.perf_counter()
+        ttft_ms = None
+        chunks: List[str] = []
+        error = None
         try:
-            # Use call_llm_sync instead of call_llm to get a direct result instead of a generator
-            response = call_llm_sync(prompt)
+            async for chunk in astream_llm(prompt, config=config):
+                if not chunk.content:
+                    continue
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                chunks.append(chunk.content)
+                writer({"token": chunk.content})
             
-            # Extract the content from the response
-            response_content = ""
-            if hasattr(response, "content"):
-                response_content = response.content
-            else:
-                # If we're dealing with a message object instead
-                response_content = str(response)
-                
-            logger.info("Successfully generated response content")
+            response_content = "".join(chunks)
+            logger.info("Successfully generated response content (time to first token: %s ms)", ttft_ms)
                 
         except Exception as e:
-            logger.error(f"Error in LLM call: {str(e)}")
-            # Provide a fallback response
-            response_content = "I'm sorry, I wasn't able to process your request at this time. Please try again later."
+            logger.error("Error in LLM call: %s", e)
+            error = "Error generating response"
+            if chunks:
+                # the client already received these tokens: keep what it saw
+                # rather than replacing it with the fallback
+                response_content = "".join(chunks)
+            else:
+                # Provide a fallback response
+                response_content = "I'm sorry, I wasn't able to process your request at this time. Please try again later."
         
         # Generate a unique response ID
         response_id = str(uuid.uuid4())
@@ -233,40 +262,45 @@ def generate_answer(state: Dict[str, Any]) -> Dict[str, Any]:
             "response": response_content,
             "summary": response_content,  # Needed for chat.py to display
             "response_id": response_id,
+            "streamed": bool(chunks),  # chat.py only re-emits the summary when nothing was streamed
+            "ttft_ms": ttft_ms,
+            "error": error,  # chat.py ends the stream with an error instead of done
             "timestamp": datetime.now().isoformat()
         }
         
-        # Update the state
-        state["answer"] = answer
-        
-        logger.info(f"Generated answer with response_id: {response_id}")
+        logger.info("Generated answer with response_id: %s", response_id)
         
     except Exception as e:
         # Catch any exceptions in the generate_answer function
-        logger.error(f"Fatal error in generate_answer: {str(e)}")
+        logger.error("Fatal error in generate_answer: %s", e)
         import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Traceback: %s", traceback.format_exc())
         
         # Create a fallback answer
         response_id = str(uuid.uuid4())
         fallback_content = "I encountered an error while processing your request. Please try again."
         
-        state["answer"] = {
+        answer = {
             "response": fallback_content,
             "summary": fallback_content,
             "response_id": response_id,
+            "streamed": False,
+            "error": "Error generating response",
             "timestamp": datetime.now().isoformat()
         }
     
-    return state
+    return {"answer": answer}
 
-def save_memories(state: Dict[str, Any]) -> Dict[str, Any]:
+async def save_memories(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Save the conversation and extracted information to long-term memory.
     
     This tool saves the user's task, the system's response, and any extracted
-    entities and context to long-term memory for future reference.
+    entities and context to long-term memory for future reference. It also
+    appends the turn to the thread history, so only the keys it changes are
+    returned (returning the whole state would append the history twice).
     """
+    update: Dict[str, Any] = {}
     try:
         task = state.get("task", {})
         answer = state.get("answer", {})
@@ -274,7 +308,7 @@ def save_memories(state: Dict[str, Any]) -> Dict[str, Any]:
         context = state.get("context", "")
         
         # Log state for debugging
-        logger.info(f"Save memories called with state keys: {list(state.keys())}")
+        logger.debug("Save memories called with state keys: %s", list(state.keys()))
         
         # Extract the original task, handling different possible structures
         original_task = ""
@@ -299,51 +333,62 @@ def save_memories(state: Dict[str, Any]) -> Dict[str, Any]:
         
         if not original_task or not response:
             # Log the state for debugging
-            logger.warning(f"Missing task or response for memory saving. State keys: {list(state.keys())}")
-            logger.warning(f"Task type: {type(task)}, content: {task}")
-            logger.warning(f"Answer type: {type(answer)}, content: {answer}")
+            logger.warning("Missing task or response for memory saving. State keys: %s", list(state.keys()))
+            logger.warning("Task type: %s, answer type: %s", type(task), type(answer))
             
-            # Don't fail the chain, just return the state as is
-            return state
+            # Don't fail the chain, just leave the state as is
+            return update
+        
+        # Update the answer in the state with the response_id
+        if isinstance(answer, dict):
+            update["answer"] = {**answer, "response_id": response_id}
+        else:
+            update["answer"] = {
+                "response": response,
+                "response_id": response_id,
+                "timestamp": datetime.now().isoformat()
+            }
         
-        # Initialize long-term memory
-        ltm = LongTermMemory(customer="default")
+        failed = isinstance(answer, dict) and bool(answer.get("error"))
         
-        # Save to long-term memory
+        # Save to the shared long-term memory; failed turns only go to the
+        # thread history (marked as failed) so they are never recalled as answers
         try:
-            ltm.save_question_answer(
-                question=original_task,
-                answer=response,
-                response_id=response_id,
-                metadata={
-                    "entities": entities,
-                    "context": context,
-                    "session_id": task.get("session_id", "") if isinstance(task, dict) else "",
-                    "thread_id": task.get("thread_id", "") if isinstance(task, dict) else ""
-                }
-            )
-            
-            logger.info(f"Saved memory with response_id: {response_id}")
-            
-            # Update the answer in the state with the response_id
-            if isinstance(answer, dict):
-                answer["response_id"] = response_id
-                state["answer"] = answer
+            if failed:
+                logger.info("Not saving failed answer %s to long-term memory", response_id)
             else:
-                state["answer"] = {
-                    "response": response,
-                    "response_id": response_id,
-                    "timestamp": datetime.now().isoformat()
-                }
+                await ltm.save_question_answer(
+                    question=original_task,
+                    answer=response,
+                    response_id=response_id,
+                    metadata={
+                        "entities": entities,
+                        "context": context,
+                        "session_id": task.get("session_id", "") if isinstance(task, dict) else "",
+                        "thread_id": task.get("thread_id", "") if isinstance(task, dict) else ""
+                    },
+                    embedding=state.get("question_embedding")
+                )
+                
+                logger.info("Saved memory with response_id: %s", response_id)
             
         except Exception as e:
-            logger.error(f"Error saving memory to LongTermMemory: {str(e)}")
-            logger.error(f"Error details: {str(e)}")
+            logger.error("Error saving memory to LongTermMemory: %s", e)
+            logger.error("Error details: %s", e)
+        
+        history = state.get("history") or []
+        update["history"] = [{
+            "turn": history[-1].get("turn", 0) + 1 if history else 1,
+            "question": original_task,
+            "answer": response,
+            "response_id": response_id,
+            "failed": failed,
+        }]
     
     except Exception as e:
         # Catch any other exceptions during the memory saving process
-        logger.error(f"Fatal error in save_memories: {str(e)}")
+        logger.error("Fatal error in save_memories: %s", e)
         import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Traceback: %s", traceback.format_exc())
     
-    return state 
\ No newline at end of file
+    return update
@@ -0,0 +1,125 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+from src.utils.logger import setup_logger
+logger = setup_logger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of being admitted"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A held admission slot; release() is idempotent"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(time.monotonic() - self._acquired_at)
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a bounded FIFO wait queue.
+
+    Up to max_concurrency requests run at once. Further requests wait in a
+    queue of at most max_queue entries for up to max_queue_wait seconds.
+    A full queue is rejected immediately with 429; a request that waits too
+    long is rejected with 503. Both carry a Retry-After estimate based on the
+    recent average time a slot is held.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_queue_wait: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._avg_hold_seconds = 1.0
+        self.admitted_total = 0
+        self.rejected_total = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _retry_after(self) -> int:
+        backlog = (self.queued + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(self._avg_hold_seconds * backlog))
+
+    def _reject(self, status_code: int, detail: str) -> AdmissionRejected:
+        self.rejected_total += 1
+        logger.warning(
+            "Shedding request (%s): in_flight=%s queued=%s", detail, self.in_flight, self.queued
+        )
+        return AdmissionRejected(status_code, detail, self._retry_after())
+
+    async def acquire(self) -> AdmissionTicket:
+        """
+        Wait for a slot.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted_total += 1
+            return AdmissionTicket(self)
+
+        if self.queued >= self.max_queue:
+            raise self._reject(429, "Too many requests queued")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_queue_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as we gave up; pass it on
+                self._release(0.0, count=False)
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject(503, "Timed out waiting for capacity")
+
+        self.admitted_total += 1
+        return AdmissionTicket(self)
+
+    def _release(self, held_seconds: float, count: bool = True) -> None:
+        if count:
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * held_seconds
+        # hand the slot straight to the oldest waiter, otherwise free it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Live admission counters"""
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+        }
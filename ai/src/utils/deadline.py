@@ -0,0 +1,70 @@
+import time
+from contextvars import ContextVar, Token
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request has used up its time budget"""
+
+
+class Deadline:
+    """
+    A request-wide time budget.
+
+    The active deadline lives in a context variable, so graph nodes, LLM,
+    embedding and Milvus calls made for a request (including those running in
+    executor threads) can size their timeouts from what is left of it.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (negative once expired)"""
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def start_deadline(seconds: float) -> Token:
+    """Start a deadline for the current request context"""
+    return _current_deadline.set(Deadline(seconds))
+
+
+def reset_deadline(token: Token) -> None:
+    """Restore the deadline that was active before start_deadline"""
+    _current_deadline.reset(token)
+
+
+def get_deadline() -> Optional[Deadline]:
+    """Return the deadline of the current request, if any"""
+    return _current_deadline.get()
+
+
+def current_timeout(default: Optional[float] = None) -> Optional[float]:
+    """
+    Timeout to use for an outbound call made on behalf of the current request.
+
+    Args:
+        default: Timeout to use (or cap at) when no deadline is active
+
+    Returns:
+        The smaller of the remaining budget and default, or default when the
+        request has no deadline
+
+    Raises:
+        DeadlineExceeded: If the request deadline has already passed
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"Request deadline of {deadline.seconds}s exceeded")
+    return remaining if default is None else min(remaining, default)
@@ -1,19 +1,76 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
 from colorlog import ColoredFormatter
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# "json" for one JSON object per line, "console" for colored human-readable lines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Records buffered between the application and the writer thread; when the
+# writer falls behind, further records are dropped instead of blocking
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Default per-logger limit on DEBUG/INFO records per second (0 disables it)
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "200"))
+# Default fraction of DEBUG records that are kept
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "suppressed"}
+
+
+class Lazy:
+    """
+    Log argument computed only when the record is written.
+
+    logger.info("trace: %s", Lazy(format_trace, timings)) calls format_trace in
+    the writer thread, and not at all if the record is filtered out.
+    """
+
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.fn(*self.args))
 
-def setup_logger(name):
-    # Create a logger
-    logger = logging.getLogger(name)
-    logger.setLevel(os.getenv("LOG_LEVEL"))
 
-    # Create a console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(os.getenv("LOG_LEVEL"))
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any fields passed with extra="""
 
-    # Define the color format
-    formatter = ColoredFormatter(
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def _console_formatter() -> logging.Formatter:
+    return ColoredFormatter(
         "%(log_color)s%(levelname)-8s%(reset)s %(blue)s%(name)s:%(lineno)d - %(message)s",
         datefmt=None,
         reset=True,
@@ -28,11 +85,135 @@ def setup_logger(name):
         style="%",
     )
 
-    # Add the formatter to the handler
-    console_handler.setFormatter(formatter)
 
-    # Add the handler to the logger
-    if not logger.hasHandlers():
-        logger.addHandler(console_handler)
+class RateLimitFilter(logging.Filter):
+    """
+    Per-logger token bucket for DEBUG/INFO records, with DEBUG sampling.
+
+    WARNING and above always pass. The number of records dropped since the
+    last one that passed is attached to that record as ``suppressed``.
+    """
+
+    def __init__(self, rate: float = LOG_RATE_LIMIT, debug_sample_rate: float = LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+        self.debug_sample_rate = debug_sample_rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return self._passed(record)
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return self._dropped()
+        if self.rate <= 0:
+            return self._passed(record)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                self._suppressed += 1
+                return False
+            self._tokens -= 1
+        return self._passed(record)
+
+    def _dropped(self) -> bool:
+        with self._lock:
+            self._suppressed += 1
+        return False
+
+    def _passed(self, record: logging.LogRecord) -> bool:
+        if self._suppressed:
+            with self._lock:
+                record.suppressed, self._suppressed = self._suppressed, 0
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without formatting them.
+
+    The stock QueueHandler formats the message in the calling thread; here
+    only the exception text is rendered up front (tracebacks reference live
+    frames) and %-style arguments are merged into the message by the writer
+    thread. Arguments must therefore not be mutated after the call; pass
+    values or small snapshots, not live state objects. A full queue drops
+    the record instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # SimpleQueue is thread-safe, so the per-handler lock is not needed
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def _get_queue_handler() -> NonBlockingQueueHandler:
+    """Create the shared queue handler and start its writer thread once per process"""
+    global _queue_handler, _listener
+    with _setup_lock:
+        if _queue_handler is None:
+            log_queue: queue.SimpleQueue = queue.SimpleQueue()
+            output = logging.StreamHandler(sys.stderr)
+            output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else _console_formatter())
+            _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+            _listener.start()
+            atexit.register(_listener.stop)
+            _queue_handler = NonBlockingQueueHandler(log_queue)
+        return _queue_handler
+
+
+def setup_logger(name, rate_limit: Optional[float] = None, debug_sample_rate: Optional[float] = None):
+    """
+    Return a logger that writes through the shared background queue.
+
+    Use %-style arguments (logger.info("saved %s", response_id)) rather than
+    f-strings: nothing is formatted unless the record is emitted, and then
+    only in the writer thread.
+
+    Args:
+        name: Logger name, usually __name__
+        rate_limit: DEBUG/INFO records per second for this logger (default LOG_RATE_LIMIT)
+        debug_sample_rate: Fraction of DEBUG records kept (default LOG_DEBUG_SAMPLE_RATE)
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(LOG_LEVEL)
+
+    handler = _get_queue_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+        logger.addFilter(RateLimitFilter(
+            rate=LOG_RATE_LIMIT if rate_limit is None else rate_limit,
+            debug_sample_rate=LOG_DEBUG_SAMPLE_RATE if debug_sample_rate is None else debug_sample_rate,
+        ))
+        # records are written once, by the queue; do not repeat them on the root logger
+        logger.propagate = False
 
     return logger
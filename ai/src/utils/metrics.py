@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# How often the event loop monitor wakes up; the lag is how late it wakes
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))
+
+# Latency buckets (seconds) for remote calls and whole requests; chat
+# streams can run for a minute
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Finer buckets for in-process work
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the end of the response body, by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled",
+    multiprocess_mode="livesum",
+)
+MODEL_CALLS = Counter(
+    "model_calls_total",
+    "LLM and embedding requests, by outcome",
+    ["kind", "model", "outcome"],
+)
+MODEL_CALL_SECONDS = Histogram(
+    "model_call_duration_seconds",
+    "Latency of LLM and embedding requests",
+    ["kind", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time until the first streamed token of a chat completion",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_TOKENS = Counter(
+    "model_tokens_total",
+    "Tokens of LLM and embedding requests by type (input excludes cached_input)",
+    ["tenant", "node", "model", "type"],
+)
+MODEL_COST_USD = Counter(
+    "model_cost_usd_total",
+    "Estimated cost of LLM and embedding requests in USD",
+    ["tenant", "node", "model"],
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Lookups of reusable results (memories, plans), by hit or miss",
+    ["cache", "result"],
+)
+MILVUS_OPERATION_SECONDS = Histogram(
+    "milvus_operation_duration_seconds",
+    "Latency of Milvus operations",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+GRAPH_NODE_SECONDS = Histogram(
+    "graph_node_duration_seconds",
+    "Time spent in each agent graph node",
+    ["node"],
+    buckets=LATENCY_BUCKETS,
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop runs a timer; high values mean blocking code on the loop",
+    buckets=FAST_BUCKETS,
+)
+
+
+def record_model_call(kind: str, model: Optional[str], seconds: float, error: bool = False) -> None:
+    """Count one LLM or embedding request and observe its latency"""
+    model = model or "unknown"
+    MODEL_CALLS.labels(kind, model, "error" if error else "ok").inc()
+    MODEL_CALL_SECONDS.labels(kind, model).observe(seconds)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+@contextmanager
+def model_call(kind: str, model: Optional[str]) -> Iterator[None]:
+    """Time the enclosed model request and record it with record_model_call"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record_model_call(kind, model, time.perf_counter() - start, error=True)
+        raise
+    record_model_call(kind, model, time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing request latency and in-flight requests.
+
+    Requests are labelled with the route template (e.g. /chat/feedback), not
+    the raw path, so the number of series stays bounded; requests that match
+    no route share the "unmatched" label. The duration runs until the last
+    byte of the response body, which for streamed chat responses is the end
+    of the stream.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # the router stores the matched route in the (shared) scope
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL) -> None:
+    """
+    Observe event loop lag until cancelled.
+
+    Sleeps for interval and records how much later than that the loop woke
+    it up. Run it as a task for the lifetime of the app.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Current metrics in the Prometheus text format.
+
+    With several worker processes, set PROMETHEUS_MULTIPROC_DIR to a shared
+    empty directory and every worker reports the aggregate of all of them.
+
+    Returns:
+        Tuple of (body, content type)
+    """
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
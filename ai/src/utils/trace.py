@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from src.llm.usage import usage_node
+from src.utils.logger import setup_logger
+from src.utils.metrics import GRAPH_NODE_SECONDS
+from src.utils.tracing import span
+logger = setup_logger(__name__)
+
+
+def traced_node(name: str, fn: Callable) -> Callable:
+    """
+    Wrap a graph node in a "node.<name>" span (see src.utils.tracing).
+
+    LLM, embedding and Milvus calls made by the node become children of the
+    span, the node's duration is observed in the graph node metrics and the
+    token usage of those calls is attributed to the node (see src.llm.usage).
+    Works for sync and async functions and for runnables (e.g. tools).
+    """
+    node_seconds = GRAPH_NODE_SECONDS.labels(name)
+    if isinstance(fn, Runnable):
+        runnable = fn
+
+        async def runnable_wrapper(state: Dict[str, Any], config: RunnableConfig) -> Any:
+            with span(f"node.{name}"), node_seconds.time(), usage_node(name):
+                return await runnable.ainvoke(state, config)
+        runnable_wrapper.__name__ = name
+        return runnable_wrapper
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state: Dict[str, Any], *args, **kwargs) -> Any:
+            with span(f"node.{name}"), node_seconds.time(), usage_node(name):
+                return await fn(state, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state: Dict[str, Any], *args, **kwargs) -> Any:
+        with span(f"node.{name}"), node_seconds.time(), usage_node(name):
+            return fn(state, *args, **kwargs)
+    return wrapper
+
+
+def timed_node(name: str, fn: Callable) -> Callable:
+    """
+    Wrap a graph node so it records its start and end time.
+
+    The wrapped node returns a partial update whose ``node_timings`` holds a
+    single entry for this run; the state reducer appends it to the request
+    trace. The node also runs in a span (see traced_node). Works for both
+    sync and async nodes.
+    """
+    fn = traced_node(name, fn)
+    def _record(result: Any, start: float) -> Dict[str, Any]:
+        end = time.perf_counter()
+        update = dict(result) if isinstance(result, dict) else {}
+        update["node_timings"] = [{
+            "node": name,
+            "start": start,
+            "end": end,
+            "duration_ms": (end - start) * 1000,
+        }]
+        return update
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state: Dict[str, Any], *args, **kwargs) -> Dict[str, Any]:
+            start = time.perf_counter()
+            result = await fn(state, *args, **kwargs)
+            return _record(result, start)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state: Dict[str, Any], *args, **kwargs) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = fn(state, *args, **kwargs)
+        return _record(result, start)
+    return wrapper
+
+
+def merge_timings(left: Optional[List[Dict[str, Any]]], right: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    State reducer for node timings.
+
+    Appends like operator.add, but an explicit None clears the list so a new
+    turn of a checkpointed thread starts with an empty trace.
+    """
+    if right is None:
+        return []
+    return (left or []) + right
+
+
+def critical_path(timings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reconstruct the critical path of a request from its node timings.
+
+    Starting from the node that finished last, repeatedly step back to the
+    node that finished latest before the current one started: that is the
+    branch the current node was waiting on.
+
+    Args:
+        timings: Entries recorded by timed_node
+
+    Returns:
+        The timing entries on the critical path, in execution order
+    """
+    if not timings:
+        return []
+    remaining = sorted(timings, key=lambda t: t["end"])
+    path = [remaining.pop()]
+    while True:
+        predecessors = [t for t in remaining if t["end"] <= path[-1]["start"]]
+        if not predecessors:
+            break
+        previous = predecessors.pop()
+        path.append(previous)
+        remaining = predecessors
+    path.reverse()
+    return path
+
+
+def format_trace(timings: List[Dict[str, Any]]) -> str:
+    """Render node timings and the critical path as a compact string"""
+    if not timings:
+        return "no node timings recorded"
+    origin = min(t["start"] for t in timings)
+    total_ms = (max(t["end"] for t in timings) - origin) * 1000
+    nodes = ", ".join(
+        f"{t['node']}@{(t['start'] - origin) * 1000:.0f}ms+{t['duration_ms']:.0f}ms"
+        for t in sorted(timings, key=lambda t: t["start"])
+    )
+    path = " -> ".join(t["node"] for t in critical_path(timings))
+    return f"total={total_ms:.0f}ms nodes=[{nodes}] critical_path=[{path}]"
@@ -0,0 +1,243 @@
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.utils.logger import setup_logger
+logger = setup_logger(__name__)
+
+# Spans are appended to this file, one OTLP/JSON ExportTraceServiceRequest
+# per line (the layout of the OpenTelemetry collector's file exporter).
+# Tracing is off unless a path is set: the file is not rotated, so point it
+# at a collector-tailed location or keep TRACE_SAMPLE_RATE low
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+# Fraction of requests (root spans) that are traced
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "vaultsense-ai")
+# Spans buffered for the writer thread; further spans are dropped
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "1.0"))
+
+
+class Span:
+    """
+    A timed operation within a trace.
+
+    Attributes set with set() end up as OTLP span attributes; "duration_ms"
+    is added when the span ends.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float) -> None:
+        """Add value to a numeric attribute (e.g. token counts over several calls)"""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def elapsed_ms(self) -> float:
+        return (time.time_ns() - self.start_ns) / 1e6
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.attributes["duration_ms"] = (self.end_ns - self.start_ns) / 1e6
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _exporter().export(self)
+
+
+class _NoopSpan:
+    """Stands in for a span when the trace is not sampled or tracing is off"""
+
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def add(self, key: str, value: float) -> None:
+        pass
+
+    def elapsed_ms(self) -> float:
+        return 0.0
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+def start_span(name: str, **attributes: Any):
+    """
+    Start a span as a child of the current one without making it current.
+
+    Use this for work that spans several steps of a caller (e.g. a streamed
+    completion); call end() on the result when done.
+    """
+    parent = _current_span.get()
+    if parent is NOOP_SPAN or not TRACE_EXPORT_PATH:
+        return NOOP_SPAN
+    if parent is None:
+        if random.random() >= TRACE_SAMPLE_RATE:
+            return NOOP_SPAN
+        return Span(name, os.urandom(16).hex(), None, attributes)
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    Time the enclosed block as a span and make it the current span.
+
+    Spans started inside the block, including in tasks and executor threads
+    it spawns, become its children.
+    """
+    current = start_span(name, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def current_span():
+    """The current span (a no-op span outside of any trace)"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s: Span) -> Dict[str, Any]:
+    entry = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [
+            {"key": key, "value": _otlp_value(value)}
+            for key, value in s.attributes.items()
+            if value is not None
+        ],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        entry["parentSpanId"] = s.parent_id
+    return entry
+
+
+class JsonlSpanExporter:
+    """
+    Writes finished spans to a local file from a background thread.
+
+    Spans are batched for up to TRACE_FLUSH_SECONDS and each batch is
+    written as one OTLP/JSON line, so the file can be replayed into an
+    OpenTelemetry collector as well as read by scripts/trace_report.py.
+    """
+
+    def __init__(self, path: str, service_name: str = TRACE_SERVICE_NAME):
+        self.path = path
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def export(self, s: Span) -> None:
+        if self._queue.qsize() >= TRACE_QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self._queue.put_nowait(s)
+
+    def shutdown(self) -> None:
+        self._queue.put_nowait(None)
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Span] = []
+            stop = False
+            deadline = time.monotonic() + TRACE_FLUSH_SECONDS
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[Span]) -> None:
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "vaultsense"},
+                    "spans": [_otlp_span(s) for s in batch],
+                }],
+            }]
+        }
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(request) + "\n")
+        except Exception as e:
+            logger.error("Error writing %s spans to %s: %s", len(batch), self.path, e)
+
+
+_exporter_instance: Optional[JsonlSpanExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def _exporter() -> JsonlSpanExporter:
+    global _exporter_instance
+    if _exporter_instance is None:
+        with _exporter_lock:
+            if _exporter_instance is None:
+                _exporter_instance = JsonlSpanExporter(TRACE_EXPORT_PATH)
+    return _exporter_instance
@@ -1,3 +1,6 @@
+from pathlib import Path
+from typing import Optional
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 import os
@@ -6,6 +9,8 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+REPO_ROOT = Path(__file__).resolve().parents[3]
+
 class Settings(BaseSettings):
     """Application settings"""
     API_V1_STR: str = "/api/v1"
@@ -13,9 +18,90 @@ class Settings(BaseSettings):
     
     # Mistral AI settings
     MISTRAL_API_KEY: str = Field(default=os.getenv("MISTRAL_API_KEY", ""))
+    # Override the API endpoint, e.g. to point load tests at a local stand-in server
+    MISTRAL_SERVER_URL: Optional[str] = Field(default=os.getenv("MISTRAL_SERVER_URL") or None)
+    # Per-request timeout of Mistral calls
+    MISTRAL_TIMEOUT_MS: int = Field(default=int(os.getenv("MISTRAL_TIMEOUT_MS", "120000")))
+    # Pooled HTTP connections shared by all concurrent requests
+    MISTRAL_MAX_CONNECTIONS: int = Field(default=int(os.getenv("MISTRAL_MAX_CONNECTIONS", "50")))
+    # Exponential backoff for 429/5xx responses and connection errors
+    MISTRAL_RETRY_INITIAL_INTERVAL_MS: int = Field(default=int(os.getenv("MISTRAL_RETRY_INITIAL_INTERVAL_MS", "500")))
+    MISTRAL_RETRY_MAX_INTERVAL_MS: int = Field(default=int(os.getenv("MISTRAL_RETRY_MAX_INTERVAL_MS", "10000")))
+    MISTRAL_RETRY_MAX_ELAPSED_MS: int = Field(default=int(os.getenv("MISTRAL_RETRY_MAX_ELAPSED_MS", "60000")))
     
     # OCR model settings
     OCR_MODEL: str = Field(default=os.getenv("OCR_MODEL", "mistral-ocr-latest"))
     EXTRACTION_MODEL: str = Field(default=os.getenv("EXTRACTION_MODEL", "pixtral-12b-latest"))
+    
+    # Upload decoding and resizing (prepare_image), run in a pool of IMAGE_WORKERS
+    # processes ("process") or threads ("thread")
+    IMAGE_EXECUTOR: str = Field(default=os.getenv("IMAGE_EXECUTOR", "process"))
+    IMAGE_WORKERS: int = Field(default=int(os.getenv("IMAGE_WORKERS", str(os.cpu_count() or 1))))
+    # Uploads with more pixels are rejected before decoding (decompression bomb guard)
+    MAX_IMAGE_PIXELS: int = Field(default=int(os.getenv("MAX_IMAGE_PIXELS", "50000000")))
+    
+    # Tiling of images larger than 4000 px: OCR overlapping full-width strips of
+    # OCR_TILE_HEIGHT in parallel instead of one downscaled request (more OCR calls);
+    # images wider than 4000 px are narrowed to 4000 px first, and only images still
+    # taller than 4000 px are tiled
+    OCR_TILING_ENABLED: bool = Field(default=os.getenv("OCR_TILING_ENABLED", "false").lower() == "true")
+    OCR_TILE_HEIGHT: int = Field(default=int(os.getenv("OCR_TILE_HEIGHT", "2000")))
+    # The overlap should span several lines of text so the stitcher can match them
+    OCR_TILE_OVERLAP: int = Field(default=int(os.getenv("OCR_TILE_OVERLAP", "300")))
+    OCR_TILE_CONCURRENCY: int = Field(default=int(os.getenv("OCR_TILE_CONCURRENCY", "8")))
+    
+    # Convert OCR markdown that is plainly tables and key: value lines to JSON locally,
+    # skipping the extraction model call; other documents still go to the model.
+    # Changing it purges the OCR cache, whose entries may hold the parser's output
+    LOCAL_EXTRACTION_ENABLED: bool = Field(default=os.getenv("LOCAL_EXTRACTION_ENABLED", "true").lower() == "true")
+    
+    # Multi-page documents (PDF, TIFF): longest accepted document and pages processed at once per upload
+    MAX_DOCUMENT_PAGES: int = Field(default=int(os.getenv("MAX_DOCUMENT_PAGES", "500")))
+    DOCUMENT_PAGE_CONCURRENCY: int = Field(default=int(os.getenv("DOCUMENT_PAGE_CONCURRENCY", "4")))
+    
+    # Local SQLite database (schema in sqlite/vaultsense.sql at the repository root)
+    SQLITE_DB_PATH: str = Field(default=os.getenv("SQLITE_DB_PATH", str(REPO_ROOT / "sqlite" / "vaultsense.db")))
+    SQLITE_SCHEMA_PATH: str = Field(default=os.getenv("SQLITE_SCHEMA_PATH", str(REPO_ROOT / "sqlite" / "vaultsense.sql")))
+    
+    # Reuse OCR and extraction results for images that were processed before
+    OCR_CACHE_ENABLED: bool = Field(default=os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true")
+    # Also reuse extractions for near-duplicates (re-compressed, resized or re-screenshotted copies)
+    # whose perceptual hash differs in at most this many of 64 bits; negative disables (default).
+    # Same-template forms hash alike, so a match is only reused when the copy's OCR text is the same
+    NEAR_DUPLICATE_MAX_DISTANCE: int = Field(default=int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "-1")))
+    
+    # Asynchronous OCR jobs (/ocr/jobs): workers processing the SQLite-backed queue, of which
+    # OCR_JOB_INTERACTIVE_WORKERS only take interactive jobs so bulk uploads cannot starve them;
+    # 0 workers accepts jobs for another process to run
+    OCR_JOB_WORKERS: int = Field(default=int(os.getenv("OCR_JOB_WORKERS", "4")))
+    OCR_JOB_INTERACTIVE_WORKERS: int = Field(default=int(os.getenv("OCR_JOB_INTERACTIVE_WORKERS", "1")))
+    # Starts of a job (interrupted by restarts) before it is failed, and how long finished jobs are kept
+    OCR_JOB_MAX_ATTEMPTS: int = Field(default=int(os.getenv("OCR_JOB_MAX_ATTEMPTS", "3")))
+    OCR_JOB_RETENTION_HOURS: float = Field(default=float(os.getenv("OCR_JOB_RETENTION_HOURS", "24")))
+    # Seconds between checks of the queue for jobs submitted by other processes
+    OCR_JOB_POLL_INTERVAL: float = Field(default=float(os.getenv("OCR_JOB_POLL_INTERVAL", "1.0")))
+    # Running jobs are leased to their process, which renews the lease every third of this
+    # many seconds; a job whose lease runs out (its process died) is queued again by any process
+    OCR_JOB_LEASE_SECONDS: float = Field(default=float(os.getenv("OCR_JOB_LEASE_SECONDS", "60")))
+    
+    # Batch folder processing (MistralBatchService)
+    BATCH_WORKERS: int = Field(default=int(os.getenv("BATCH_WORKERS", "8")))
+    # Calls per second started by a batch for each stage; 0 disables the limit
+    BATCH_OCR_RATE_LIMIT: float = Field(default=float(os.getenv("BATCH_OCR_RATE_LIMIT", "5")))
+    BATCH_EXTRACTION_RATE_LIMIT: float = Field(default=float(os.getenv("BATCH_EXTRACTION_RATE_LIMIT", "5")))
+    # Attempts per image and the delay before the first retry (doubled each time)
+    BATCH_MAX_ATTEMPTS: int = Field(default=int(os.getenv("BATCH_MAX_ATTEMPTS", "4")))
+    BATCH_RETRY_BASE_DELAY: float = Field(default=float(os.getenv("BATCH_RETRY_BASE_DELAY", "1.0")))
+    
+    # Offline batch folder processing through Mistral batch jobs (--batch-jobs): requests are
+    # written to JSONL shards of at most this many requests / bytes, one job per shard
+    BATCH_JOB_SHARD_MAX_REQUESTS: int = Field(default=int(os.getenv("BATCH_JOB_SHARD_MAX_REQUESTS", "1000")))
+    BATCH_JOB_SHARD_MAX_BYTES: int = Field(default=int(os.getenv("BATCH_JOB_SHARD_MAX_BYTES", "100000000")))
+    # Seconds between job status checks, and the time the provider has to finish a job
+    BATCH_JOB_POLL_INTERVAL: float = Field(default=float(os.getenv("BATCH_JOB_POLL_INTERVAL", "30")))
+    BATCH_JOB_TIMEOUT_HOURS: int = Field(default=int(os.getenv("BATCH_JOB_TIMEOUT_HOURS", "24")))
+    
+    # Metrics settings
+    EVENT_LOOP_LAG_INTERVAL: float = Field(default=float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5")))
 
 settings = Settings() 
\ No newline at end of file
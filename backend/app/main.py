@@ -1,14 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 from app.core.config import settings
 from app.routers import ocr
+from app.services.job_service import OCRJobWorkers, get_job_queue
+from app.services.mistral_service import get_mistral_service
+from app.utils.image_utils import get_image_executor, start_image_workers
+from app.utils.metrics import MetricsMiddleware, monitor_event_loop_lag, render_metrics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Measure event loop lag for the lifetime of the app
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    # Spawn the image processing workers up front so the first uploads don't wait for them
+    start_image_workers()
+    # Process queued OCR jobs, including those left over from the last run
+    job_workers = OCRJobWorkers(get_job_queue(), get_mistral_service())
+    await job_workers.start()
+    yield
+    lag_monitor.cancel()
+    # Stop the OCR job workers; their running jobs are queued for the next start
+    await job_workers.stop()
+    get_job_queue().close()
+    # Close the shared Mistral client's connection pool if it was created
+    if get_mistral_service.cache_info().currsize:
+        await get_mistral_service().aclose()
+    # Stop the image processing workers if any were started
+    if get_image_executor.cache_info().currsize:
+        get_image_executor().shutdown(cancel_futures=True)
 
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Configure CORS middleware
@@ -20,6 +49,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency and in-flight metrics, served on /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(ocr.router, prefix=f"{settings.API_V1_STR}/ocr", tags=["OCR"])
 
@@ -31,6 +63,15 @@ async def health_check():
     """
     return {"status": "ok"}
 
+# Prometheus metrics endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Runtime metrics in the Prometheus text format
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
-from fastapi.responses import JSONResponse
-from typing import Dict, Any
+import json
 
-from app.services.mistral_service import MistralService
-from app.utils.image_utils import validate_image, preprocess_image
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Dict, Any, Literal
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.document_service import process_document_pages
+from app.services.job_service import FINISHED_STATUSES, OCRJobQueue, get_job_queue, process_upload
+from app.services.mistral_service import MistralService, get_mistral_service
+from app.utils.document_utils import open_document
+
+# Seconds between keep-alive comments on an idle job event stream
+JOB_EVENTS_KEEPALIVE = 15
 
 router = APIRouter()
 
@@ -11,14 +21,14 @@ router = APIRouter()
 
 async def process_image(
     file: UploadFile = File(...),
-    mistral_service: MistralService = Depends(lambda: MistralService())
+    mistral_service: MistralService = Depends(get_mistral_service)
 ) -> Dict[str, Any]:
     """
     API endpoint to process an image using Mistral OCR and extract structured data
     
     Args:
         file: Uploaded image file
-        mistral_service: MistralService instance for OCR processing
+        mistral_service: Shared MistralService instance for OCR processing
         
     Returns:
         Structured data extracted from the image
@@ -26,26 +36,164 @@ async def process_image(
     # Read file content
     file_content = await file.read()
     
-    # Validate image
-    is_valid, error_message = validate_image(file_content)
-    if not is_valid:
+    try:
+        # Validate and preprocess the image, then process it with Mistral OCR
+        return await process_upload(mistral_service, file_content, file.filename)
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=error_message
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing image: {str(e)}"
         )
+
+@router.post("/process-document", status_code=status.HTTP_200_OK)
+
+async def process_document(
+    file: UploadFile = File(...),
+    mistral_service: MistralService = Depends(get_mistral_service)
+) -> StreamingResponse:
+    """
+    API endpoint to process a multi-page PDF or TIFF (or a single image) page by page
+    
+    Pages are OCR'd and extracted in parallel and streamed back as NDJSON as
+    they complete, one {"page": n, "result": {...}} or {"page": n, "error": "..."}
+    line per page in completion order, followed by a final
+    {"done": true, "pages": n, "failed": k} line.
     
-    # Preprocess image
-    processed_image = preprocess_image(file_content)
+    Args:
+        file: Uploaded PDF, TIFF or image file
+        mistral_service: Shared MistralService instance for OCR processing
+        
+    Returns:
+        NDJSON stream of per-page results
+    """
+    # Read file content
+    file_content = await file.read()
     
+    # Read the page index (not the pages) so invalid uploads fail before streaming starts
     try:
-        # Process image with Mistral OCR
-        result = await mistral_service.process_image(
-            image_content=processed_image,
-            image_name=file.filename
+        page_count, get_page = await run_in_threadpool(open_document, file_content)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-        return result
-    except Exception as e:
+    
+    async def stream():
+        failed = 0
+        async for page_result in process_document_pages(mistral_service, page_count, get_page):
+            failed += "error" in page_result
+            yield json.dumps(page_result) + "\n"
+        yield json.dumps({"done": True, "pages": page_count, "failed": failed}) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+
+async def submit_job(
+    request: Request,
+    file: UploadFile = File(...),
+    lane: Literal["interactive", "bulk"] = Form("interactive"),
+    job_queue: OCRJobQueue = Depends(get_job_queue)
+) -> JSONResponse:
+    """
+    API endpoint to queue an image for OCR and return without waiting for it
+    
+    The job is stored in the SQLite job queue and processed by the server's
+    worker pool; follow it with GET /jobs/{job_id} or GET /jobs/{job_id}/events.
+    Interactive jobs are started before bulk ones.
+    
+    Args:
+        file: Uploaded image file
+        lane: "interactive" for uploads a user is waiting on, "bulk" for backfills
+        job_queue: Shared OCR job queue
+        
+    Returns:
+        202 with the job's status, and its URL in the Location header
+    """
+    # Read file content
+    file_content = await file.read()
+    
+    job_id = await job_queue.submit(file_content, file.filename, lane)
+    job = await job_queue.get(job_id)
+    location = str(request.url_for("get_job", job_id=job_id))
+    return JSONResponse(job, status_code=status.HTTP_202_ACCEPTED, headers={"Location": location})
+
+@router.get("/jobs/{job_id}", response_model=Dict[str, Any], status_code=status.HTTP_200_OK)
+
+async def get_job(
+    job_id: str,
+    job_queue: OCRJobQueue = Depends(get_job_queue)
+) -> Dict[str, Any]:
+    """
+    API endpoint to poll an OCR job
+    
+    Args:
+        job_id: Id returned when the job was submitted
+        job_queue: Shared OCR job queue
+        
+    Returns:
+        The job's status ("queued", "running", "done" or "failed"), its
+        position in the queue while queued, and its result or error once finished
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing image: {str(e)}"
-        ) 
\ No newline at end of file
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+@router.get("/jobs/{job_id}/events", status_code=status.HTTP_200_OK)
+
+async def job_events(
+    job_id: str,
+    job_queue: OCRJobQueue = Depends(get_job_queue)
+) -> StreamingResponse:
+    """
+    API endpoint to stream an OCR job's status as server-sent events
+    
+    Sends a "status" event with the job (as GET /jobs/{job_id} returns it)
+    now and whenever its status or queue position changes, and closes the
+    stream after the event for the finished job.
+    
+    Args:
+        job_id: Id returned when the job was submitted
+        job_queue: Shared OCR job queue
+        
+    Returns:
+        text/event-stream of status events
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    async def stream():
+        last = None
+        idle = 0.0
+        while True:
+            changed = job_queue.changes()
+            job = await job_queue.get(job_id)
+            if job is None:
+                return
+            if job != last:
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+                last = job
+                idle = 0.0
+            if job["status"] in FINISHED_STATUSES:
+                return
+            # Changes made by another process only show up when polled
+            if not await job_queue.wait_for_change(changed, settings.OCR_JOB_POLL_INTERVAL):
+                idle += settings.OCR_JOB_POLL_INTERVAL
+                if idle >= JOB_EVENTS_KEEPALIVE:
+                    yield ": keep-alive\n\n"
+                    idle = 0.0
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
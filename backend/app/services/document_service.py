@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.services.mistral_service import MistralService
+from app.utils.document_utils import PDF_MIME_TYPE, Page
+from app.utils.metrics import OCR_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+async def process_document_pages(
+    mistral_service: MistralService,
+    page_count: int,
+    get_page: Callable[[int], Page],
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    OCR and extract the pages of a document, yielding each result as it completes
+
+    Pages are split and started in order with at most concurrency in flight,
+    so the first result arrives after about one page's processing time
+    whatever the document's length, and memory is bounded by the pages in
+    flight rather than the whole document. A page that fails yields an
+    error without stopping the others. Closing the iterator early (e.g. the
+    client disconnected) cancels the remaining pages.
+
+    Args:
+        mistral_service: Shared MistralService instance for OCR processing
+        page_count: Number of pages, from open_document
+        get_page: Page splitter, from open_document
+        concurrency: Pages processed at once (default settings.DOCUMENT_PAGE_CONCURRENCY)
+
+    Yields:
+        {"page": n, "result": {...}} or {"page": n, "error": "..."} per page
+        (numbered from 1), in completion order
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.DOCUMENT_PAGE_CONCURRENCY)
+    results: asyncio.Queue = asyncio.Queue()
+    tasks = set()
+
+    async def run_page(number: int, page: Page) -> None:
+        content, mime_type = page
+        try:
+            if mime_type == PDF_MIME_TYPE:
+                result = await mistral_service.process_pdf(content)
+            else:
+                result = await mistral_service.process_image(content, f"page-{number}")
+            await results.put({"page": number, "result": result})
+        except Exception as e:
+            logger.error("Failed to process page %s: %s", number, e)
+            await results.put({"page": number, "error": f"Error processing page: {str(e)}"})
+        finally:
+            semaphore.release()
+
+    async def split_pages() -> None:
+        for number in range(1, page_count + 1):
+            await semaphore.acquire()
+            try:
+                # get_page is not thread safe; this loop is its only caller
+                with OCR_STAGE_SECONDS.labels("split").time():
+                    page = await asyncio.to_thread(get_page, number - 1)
+            except Exception as e:
+                semaphore.release()
+                await results.put({"page": number, "error": str(e)})
+                continue
+            task = asyncio.create_task(run_page(number, page))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    splitter = asyncio.create_task(split_pages())
+    try:
+        for _ in range(page_count):
+            yield await results.get()
+    finally:
+        splitter.cancel()
+        for task in list(tasks):
+            task.cancel()
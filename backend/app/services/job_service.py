@@ -0,0 +1,492 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.services.mistral_service import MistralService
+from app.utils.image_utils import get_image_executor, prepare_image
+from app.utils.metrics import OCR_JOB_WAIT_SECONDS, OCR_JOBS, OCR_STAGE_SECONDS
+from app.utils.tiling import prepare_image_tiles
+
+logger = logging.getLogger(__name__)
+
+# Priority of each lane; workers take lower values first
+LANES = {"interactive": 0, "bulk": 1}
+LANE_NAMES = {priority: lane for lane, priority in LANES.items()}
+FINISHED_STATUSES = {"done", "failed"}
+# Attempts to record a job's outcome while the database is locked or failing,
+# with the delay before the first retry (doubled each time)
+FINISH_ATTEMPTS = 4
+FINISH_RETRY_DELAY = 0.5
+
+# SQLite timestamps with milliseconds, for queue wait times
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+async def process_upload(mistral_service: MistralService, file_content: bytes, filename: Optional[str]) -> Dict[str, Any]:
+    """
+    Prepare an uploaded image and extract its structured data
+
+    The image is validated and preprocessed with one decode in the image
+    pool, so the CPU work never runs on the event loop; large images are
+    split into tiles when tiling is enabled.
+
+    Args:
+        mistral_service: Shared MistralService instance for OCR processing
+        file_content: Binary content of the upload
+        filename: Name of the uploaded file
+
+    Returns:
+        Structured data extracted from the image
+
+    Raises:
+        ValueError: If the upload is not a supported image or is too large
+    """
+    tiles = None
+    loop = asyncio.get_running_loop()
+    with OCR_STAGE_SECONDS.labels("prepare").time():
+        if settings.OCR_TILING_ENABLED:
+            processed_image, tiles = await loop.run_in_executor(
+                get_image_executor(), prepare_image_tiles, file_content
+            )
+        else:
+            processed_image = await loop.run_in_executor(
+                get_image_executor(), prepare_image, file_content
+            )
+
+    if tiles:
+        return await mistral_service.process_tiled_image(processed_image, tiles)
+    return await mistral_service.process_image(image_content=processed_image, image_name=filename)
+
+
+class OCRJobQueue:
+    """
+    Persistent queue of asynchronous OCR jobs in the ocr_jobs SQLite table
+
+    Jobs keep their upload until they finish, so queued jobs survive a
+    restart. claim() takes the queued job with the lowest priority, oldest
+    first, and only marks it running if it is still queued, so several
+    processes can share one database. A running job is leased to the queue
+    that claimed it (owner), which renews the lease with heartbeat() while
+    it works on the job; requeue() queues the jobs whose lease ran out
+    again, whichever process left them (up to OCR_JOB_MAX_ATTEMPTS starts),
+    so a process that starts never takes back jobs another one is still
+    running. Finished jobs are purged after OCR_JOB_RETENTION_HOURS when
+    the queue is opened.
+
+    Database calls run in a worker thread on one shared connection. Every
+    change in this process sets the changes() event.
+    """
+
+    def __init__(self, db_path: str, schema_path: str):
+        self.db_path = db_path
+        self.schema_path = schema_path
+        # Marks the jobs this queue (process) claimed
+        self.owner = uuid.uuid4().hex
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._changed = asyncio.Event()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database on first use: apply the schema and purge old jobs"""
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(Path(self.schema_path).read_text())
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(ocr_jobs)")}
+            for column in ("owner TEXT", "heartbeat_ts DATETIME"):
+                if column.split()[0] not in columns:
+                    # Databases created before jobs were leased
+                    conn.execute(f"ALTER TABLE ocr_jobs ADD COLUMN {column}")
+            purged = conn.execute(
+                "DELETE FROM ocr_jobs WHERE status IN ('done', 'failed') "
+                "AND finished_ts < datetime('now', ?)",
+                (f"-{settings.OCR_JOB_RETENTION_HOURS} hours",),
+            ).rowcount
+            conn.commit()
+            if purged:
+                logger.info("Purged %s finished OCR jobs", purged)
+            self._conn = conn
+        return self._conn
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def changes(self) -> asyncio.Event:
+        """
+        Event set by the next change to the queue (a job submitted, started or finished)
+
+        Take it before reading the queue, then wait_for_change() on it, so a
+        change made in between is not missed.
+        """
+        return self._changed
+
+    async def wait_for_change(self, changed: asyncio.Event, timeout: float) -> bool:
+        """Wait until changed is set or timeout seconds pass; True if it was set"""
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _submit(self, file_content: bytes, filename: Optional[str], priority: int) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO ocr_jobs (job_id, priority, status, filename, upload, created_ts) "
+                f"VALUES (?, ?, 'queued', ?, ?, {_NOW})",
+                (job_id, priority, filename, file_content),
+            )
+            conn.commit()
+        return job_id
+
+    def _claim(self, max_priority: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connection()
+            while True:
+                row = conn.execute(
+                    "SELECT job_id FROM ocr_jobs WHERE status = 'queued' AND priority <= ? "
+                    "ORDER BY priority, seq LIMIT 1",
+                    (max_priority,),
+                ).fetchone()
+                if row is None:
+                    return None
+                # Another process may have taken it since the SELECT
+                claimed = conn.execute(
+                    "UPDATE ocr_jobs SET status = 'running', attempts = attempts + 1, owner = ?, "
+                    f"started_ts = {_NOW}, heartbeat_ts = {_NOW} WHERE job_id = ? AND status = 'queued'",
+                    (self.owner, row["job_id"]),
+                ).rowcount
+                conn.commit()
+                if claimed:
+                    break
+            job = conn.execute(
+                "SELECT job_id, priority, filename, upload, "
+                "(julianday(started_ts) - julianday(created_ts)) * 86400 AS waited "
+                "FROM ocr_jobs WHERE job_id = ?",
+                (row["job_id"],),
+            ).fetchone()
+        return dict(job)
+
+    def _finish(self, job_id: str, result: Optional[Dict[str, Any]], error: Optional[str]) -> bool:
+        with self._lock:
+            conn = self._connection()
+            finished = conn.execute(
+                f"UPDATE ocr_jobs SET status = ?, result_json = ?, error = ?, upload = NULL, finished_ts = {_NOW} "
+                "WHERE job_id = ? AND status = 'running' AND owner = ?",
+                (
+                    "failed" if error is not None else "done",
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    job_id,
+                    self.owner,
+                ),
+            ).rowcount
+            conn.commit()
+        return bool(finished)
+
+    def _heartbeat(self, job_ids: List[str]) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                f"UPDATE ocr_jobs SET heartbeat_ts = {_NOW} WHERE status = 'running' AND owner = ? "
+                f"AND job_id IN ({','.join('?' * len(job_ids))})",
+                [self.owner, *job_ids],
+            )
+            conn.commit()
+
+    def _requeue(self, job_ids: Optional[List[str]]) -> int:
+        if job_ids is not None:
+            where = f"status = 'running' AND owner = ? AND job_id IN ({','.join('?' * len(job_ids))})"
+            params: List[Any] = [self.owner, *job_ids]
+        else:
+            where = (
+                "status = 'running' AND (heartbeat_ts IS NULL "
+                "OR heartbeat_ts < strftime('%Y-%m-%d %H:%M:%f', 'now', ?))"
+            )
+            params = [f"-{settings.OCR_JOB_LEASE_SECONDS} seconds"]
+        with self._lock:
+            conn = self._connection()
+            if job_ids is None:
+                conn.execute(
+                    "UPDATE ocr_jobs SET status = 'failed', error = 'Interrupted too many times', "
+                    f"upload = NULL, finished_ts = {_NOW} WHERE {where} AND attempts >= ?",
+                    [*params, settings.OCR_JOB_MAX_ATTEMPTS],
+                )
+            requeued = conn.execute(
+                "UPDATE ocr_jobs SET status = 'queued', owner = NULL, started_ts = NULL, heartbeat_ts = NULL "
+                f"WHERE {where}",
+                params,
+            ).rowcount
+            conn.commit()
+        return requeued
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT seq, job_id, priority, status, filename, result_json, error, attempts, "
+                "created_ts, started_ts, finished_ts FROM ocr_jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row["status"] == "queued":
+                position = conn.execute(
+                    "SELECT COUNT(*) FROM ocr_jobs WHERE status = 'queued' "
+                    "AND (priority < ? OR (priority = ? AND seq < ?))",
+                    (row["priority"], row["priority"], row["seq"]),
+                ).fetchone()[0]
+        job = {
+            "job_id": row["job_id"],
+            "status": row["status"],
+            "lane": LANE_NAMES.get(row["priority"], str(row["priority"])),
+            "filename": row["filename"],
+            "attempts": row["attempts"],
+            "created_at": row["created_ts"],
+            "started_at": row["started_ts"],
+            "finished_at": row["finished_ts"],
+        }
+        if position is not None:
+            # Queued jobs ahead of this one
+            job["position"] = position
+        if row["result_json"] is not None:
+            job["result"] = json.loads(row["result_json"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    async def submit(self, file_content: bytes, filename: Optional[str], lane: str) -> str:
+        """
+        Queue an upload for processing
+
+        Args:
+            file_content: Binary content of the upload
+            filename: Name of the uploaded file
+            lane: "interactive" or "bulk"
+
+        Returns:
+            The new job's id
+        """
+        job_id = await asyncio.to_thread(self._submit, file_content, filename, LANES[lane])
+        self._notify()
+        return job_id
+
+    async def claim(self, max_priority: int = max(LANES.values())) -> Optional[Dict[str, Any]]:
+        """
+        Start the next queued job
+
+        Args:
+            max_priority: Only take jobs of this priority or lower (more urgent)
+
+        Returns:
+            {"job_id", "priority", "filename", "upload", "waited"} of the
+            job, now running, or None if there is none
+        """
+        job = await asyncio.to_thread(self._claim, max_priority)
+        if job is not None:
+            self._notify()
+        return job
+
+    async def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> bool:
+        """
+        Record a job's result, or its error, and drop its upload
+
+        Args:
+            job_id: Job to finish
+            result: Structured data extracted for the job
+            error: Why the job failed; marks it failed instead of done
+
+        Returns:
+            False if the job is no longer leased to this queue (its lease ran
+            out and it was queued again), so nothing was recorded
+        """
+        finished = await asyncio.to_thread(self._finish, job_id, result, error)
+        self._notify()
+        return finished
+
+    async def heartbeat(self, job_ids: List[str]) -> None:
+        """
+        Renew the lease of running jobs claimed by this queue
+
+        Args:
+            job_ids: Jobs still being worked on
+        """
+        if job_ids:
+            await asyncio.to_thread(self._heartbeat, job_ids)
+
+    async def requeue(self, job_ids: Optional[List[str]] = None) -> int:
+        """
+        Queue interrupted jobs again
+
+        Without job_ids, the running jobs whose lease was not renewed for
+        OCR_JOB_LEASE_SECONDS were cut off by a crash or kill of the process
+        running them; those already started OCR_JOB_MAX_ATTEMPTS times are
+        failed instead, so an upload that brings the server down is not
+        retried forever.
+
+        Args:
+            job_ids: Jobs claimed by this queue to queue again (default the expired ones of any process)
+
+        Returns:
+            Number of jobs queued again
+        """
+        requeued = await asyncio.to_thread(self._requeue, job_ids)
+        self._notify()
+        return requeued
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a job's status
+
+        Args:
+            job_id: Job to look up
+
+        Returns:
+            The job's status, lane, timestamps, queue position while queued,
+            and result or error once finished; None if there is no such job
+        """
+        return await asyncio.to_thread(self._get, job_id)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class OCRJobWorkers:
+    """
+    Bounded pool of coroutines processing the OCR job queue
+
+    settings.OCR_JOB_WORKERS jobs run at once whatever the number queued,
+    so slow documents wait in the queue instead of holding HTTP
+    connections. OCR_JOB_INTERACTIVE_WORKERS of the workers only take
+    interactive jobs; the others take interactive jobs first and bulk jobs
+    when there are none.
+
+    While a job runs its lease is renewed every third of
+    OCR_JOB_LEASE_SECONDS; at the same interval the jobs whose lease ran
+    out, left by a process that crashed, are queued again. Several
+    processes can run workers on one database.
+    """
+
+    def __init__(self, queue: OCRJobQueue, mistral_service: MistralService, workers: Optional[int] = None):
+        self.queue = queue
+        self.mistral_service = mistral_service
+        self.workers = workers if workers is not None else settings.OCR_JOB_WORKERS
+        self._tasks: List[asyncio.Task] = []
+        # Jobs being worked on, whose leases are renewed
+        self._running: Set[str] = set()
+
+    async def start(self) -> None:
+        """Start the workers and the task renewing their leases"""
+        if self.workers <= 0:
+            return
+        interactive = min(settings.OCR_JOB_INTERACTIVE_WORKERS, self.workers - 1)
+        for number in range(self.workers):
+            max_priority = LANES["interactive"] if number < interactive else max(LANES.values())
+            self._tasks.append(asyncio.create_task(self._work(max_priority)))
+        self._tasks.append(asyncio.create_task(self._keep_leases()))
+
+    async def _keep_leases(self) -> None:
+        """Renew the leases of running jobs and queue expired ones again"""
+        while True:
+            try:
+                await self.queue.heartbeat(list(self._running))
+                requeued = await self.queue.requeue()
+                if requeued:
+                    logger.info("Queued %s interrupted OCR jobs again", requeued)
+            except sqlite3.Error as e:
+                logger.error("Failed to renew OCR job leases: %s", e)
+            await asyncio.sleep(settings.OCR_JOB_LEASE_SECONDS / 3)
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs they were running are queued for the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self, max_priority: int) -> None:
+        while True:
+            changed = self.queue.changes()
+            try:
+                job = await self.queue.claim(max_priority)
+            except sqlite3.Error as e:
+                logger.error("Failed to take an OCR job from the queue: %s", e)
+                job = None
+            if job is None:
+                await self.queue.wait_for_change(changed, settings.OCR_JOB_POLL_INTERVAL)
+                continue
+            self._running.add(job["job_id"])
+            try:
+                await self._run(job)
+            except Exception as e:
+                # Keep the worker alive and give the job back; if even that fails,
+                # its lease is no longer renewed and it is queued again when it runs out
+                logger.error("Failed to record the outcome of OCR job %s: %s", job["job_id"], e)
+                try:
+                    await self.queue.requeue([job["job_id"]])
+                except sqlite3.Error as e:
+                    logger.error("Failed to queue OCR job %s again: %s", job["job_id"], e)
+            finally:
+                self._running.discard(job["job_id"])
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        lane = LANE_NAMES.get(job["priority"], str(job["priority"]))
+        OCR_JOB_WAIT_SECONDS.labels(lane).observe(job["waited"])
+        result = error = None
+        try:
+            result = await process_upload(self.mistral_service, job["upload"], job["filename"])
+        except asyncio.CancelledError:
+            # Shutting down: leave the job for the next start
+            await asyncio.shield(self.queue.requeue([job["job_id"]]))
+            raise
+        except ValueError as e:
+            error = str(e)
+        except Exception as e:
+            logger.error("OCR job %s failed: %s", job["job_id"], e)
+            error = f"Error processing image: {str(e)}"
+        error = await self._finish(job["job_id"], result, error)
+        OCR_JOBS.labels(lane, "failed" if error is not None else "done").inc()
+
+    async def _finish(self, job_id: str, result: Optional[Dict[str, Any]], error: Optional[str]) -> Optional[str]:
+        """Record a job's outcome, retrying database errors; returns the error recorded"""
+        attempt = 1
+        while True:
+            try:
+                if not await self.queue.finish(job_id, result, error):
+                    logger.warning("Lease of OCR job %s ran out and it was queued again; outcome dropped", job_id)
+                return error
+            except (TypeError, ValueError) as e:
+                if result is None:
+                    raise
+                # The result cannot be stored as JSON; record the job as failed instead
+                logger.error("OCR job %s returned a result that cannot be stored: %s", job_id, e)
+                result, error = None, f"Error storing result: {str(e)}"
+            except sqlite3.Error as e:
+                if attempt >= FINISH_ATTEMPTS:
+                    raise
+                logger.warning("Failed to record OCR job %s (attempt %s): %s", job_id, attempt, e)
+                await asyncio.sleep(FINISH_RETRY_DELAY * 2 ** (attempt - 1))
+                attempt += 1
+
+
+@lru_cache(maxsize=1)
+def get_job_queue() -> OCRJobQueue:
+    """Return the process-wide OCR job queue; used as a FastAPI dependency"""
+    return OCRJobQueue(db_path=settings.SQLITE_DB_PATH, schema_path=settings.SQLITE_SCHEMA_PATH)
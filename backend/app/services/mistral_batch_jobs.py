@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.mistral_service import MistralService
+
+# Final states of a batch job; its output and error files are complete
+TERMINAL_STATUSES = {"SUCCESS", "FAILED", "TIMEOUT_EXCEEDED", "CANCELLED"}
+
+# (custom_id, response body or None, error or None) for each request of a job
+BatchResult = Tuple[str, Optional[Dict[str, Any]], Optional[str]]
+
+
+def write_shards(
+    requests: Iterable[Tuple[str, Dict[str, Any]]],
+    directory: Path,
+    prefix: str,
+    max_requests: int,
+    max_bytes: int,
+) -> List[Tuple[Path, List[str]]]:
+    """
+    Write requests to JSONL batch files of bounded size
+
+    Requests are consumed one at a time, so only the current line is held
+    in memory whatever the number of requests.
+
+    Args:
+        requests: (custom_id, request body) pairs
+        directory: Where to write the files
+        prefix: File name prefix; files are named <prefix>-000.jsonl, ...
+        max_requests: Most requests per file
+        max_bytes: Largest file size; a single larger request gets a file of its own
+
+    Returns:
+        Each file with the custom_ids it holds, in order
+    """
+    shards: List[Tuple[Path, List[str]]] = []
+    handle = None
+    size = 0
+    try:
+        for custom_id, body in requests:
+            line = (json.dumps({"custom_id": custom_id, "body": body}) + "\n").encode()
+            if handle is None or len(shards[-1][1]) >= max_requests or size + len(line) > max_bytes:
+                if handle is not None:
+                    handle.close()
+                path = directory / f"{prefix}-{len(shards):03d}.jsonl"
+                handle = open(path, "wb")
+                shards.append((path, []))
+                size = 0
+            handle.write(line)
+            shards[-1][1].append(custom_id)
+            size += len(line)
+    finally:
+        if handle is not None:
+            handle.close()
+    return shards
+
+
+class MistralBatchJobRunner:
+    """
+    Run requests as Mistral batch jobs instead of one live call each
+
+    Batch jobs are billed below live calls and do not count against the
+    per-second rate limits; in exchange results arrive when the provider
+    gets to them (within BATCH_JOB_TIMEOUT_HOURS). Requests are written to
+    sharded JSONL files, each shard is uploaded and submitted as a job, and
+    the jobs are polled until they finish; each job's output is streamed
+    back line by line as soon as it completes.
+
+    With jobs_path set, every submitted job is recorded there with its
+    custom_ids, and marked collected once all its results were yielded. A
+    run interrupted while waiting (a crash or Ctrl-C) leaves its jobs
+    uncollected, and the next run() for the same endpoint polls them again
+    instead of paying for the requests twice.
+    """
+
+    def __init__(
+        self,
+        service: MistralService,
+        shard_max_requests: Optional[int] = None,
+        shard_max_bytes: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        jobs_path: Optional[Path] = None,
+    ):
+        """
+        Initialize the runner
+
+        Args:
+            service: Mistral client whose connection pool and retries are used
+            shard_max_requests: Most requests per job (default settings.BATCH_JOB_SHARD_MAX_REQUESTS)
+            shard_max_bytes: Largest JSONL file per job (default settings.BATCH_JOB_SHARD_MAX_BYTES)
+            poll_interval: Seconds between status checks (default settings.BATCH_JOB_POLL_INTERVAL)
+            jobs_path: JSONL record of submitted jobs, to resume them after an interrupted run
+        """
+        self.client = service.client
+        self.shard_max_requests = shard_max_requests or settings.BATCH_JOB_SHARD_MAX_REQUESTS
+        self.shard_max_bytes = shard_max_bytes or settings.BATCH_JOB_SHARD_MAX_BYTES
+        self.poll_interval = poll_interval if poll_interval is not None else settings.BATCH_JOB_POLL_INTERVAL
+        self.jobs_path = jobs_path
+
+    def uncollected(self, endpoint: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        Jobs recorded in jobs_path whose results were not collected yet
+
+        Args:
+            endpoint: Only the jobs for this endpoint (default all of them)
+
+        Returns:
+            The custom_ids of each job by job id
+        """
+        jobs: Dict[str, Tuple[str, List[str]]] = {}
+        if self.jobs_path is None or not self.jobs_path.exists():
+            return {}
+        with open(self.jobs_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry.get("collected"):
+                        jobs.pop(entry["job_id"], None)
+                    else:
+                        jobs[entry["job_id"]] = (entry["endpoint"], entry["custom_ids"])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # a line cut short by a crash
+                    continue
+        return {
+            job_id: custom_ids
+            for job_id, (job_endpoint, custom_ids) in jobs.items()
+            if endpoint is None or job_endpoint == endpoint
+        }
+
+    def uncollected_custom_ids(self) -> Set[str]:
+        """custom_ids of the uncollected jobs of every endpoint; run() will answer them again"""
+        return {custom_id for custom_ids in self.uncollected().values() for custom_id in custom_ids}
+
+    def _record_job(self, entry: Dict[str, Any]) -> None:
+        if self.jobs_path is None:
+            return
+        with open(self.jobs_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def run(
+        self,
+        endpoint: str,
+        model: str,
+        requests: Iterable[Tuple[str, Dict[str, Any]]],
+        metadata: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[BatchResult]:
+        """
+        Submit requests as batch jobs and yield their results as jobs finish
+
+        Every request yields exactly one result: its response body, or an
+        error if the request failed or its job ended without answering it.
+        The uncollected jobs for endpoint of an earlier run are polled too
+        and their results yielded the same way; leave their requests out of
+        requests (see uncollected_custom_ids).
+
+        Args:
+            endpoint: API path the requests are for, e.g. "/v1/ocr"
+            model: Model of every request
+            requests: (custom_id, request body) pairs; custom_ids must be unique
+            metadata: Labels attached to the jobs
+
+        Yields:
+            (custom_id, response body, None) or (custom_id, None, error)
+        """
+        name = endpoint.strip("/").replace("/", "-")
+        with tempfile.TemporaryDirectory(prefix="vaultsense-batch-") as directory:
+            shards = await asyncio.to_thread(
+                write_shards, requests, Path(directory), name, self.shard_max_requests, self.shard_max_bytes
+            )
+            jobs = self.uncollected(endpoint)
+            for job_id, custom_ids in jobs.items():
+                print(f"Resuming batch job {job_id}: {len(custom_ids)} {endpoint} requests")
+            for path, custom_ids in shards:
+                job_id = await self._submit(path, endpoint, model, metadata)
+                jobs[job_id] = custom_ids
+                self._record_job({"job_id": job_id, "endpoint": endpoint, "custom_ids": custom_ids})
+                print(f"Submitted batch job {job_id}: {len(custom_ids)} {endpoint} requests")
+
+        while jobs:
+            await asyncio.sleep(self.poll_interval)
+            for job_id in list(jobs):
+                job = await self.client.batch.jobs.get_async(job_id=job_id)
+                if job.status not in TERMINAL_STATUSES:
+                    continue
+                print(
+                    f"Batch job {job_id} {job.status}: {job.succeeded_requests} succeeded, "
+                    f"{job.failed_requests} failed of {job.total_requests}"
+                )
+                answered = set()
+                for file_id in (job.output_file, job.error_file):
+                    if file_id:
+                        async for result in self._read_results(file_id):
+                            answered.add(result[0])
+                            yield result
+                for custom_id in jobs.pop(job_id):
+                    if custom_id not in answered:
+                        yield custom_id, None, f"No result from batch job {job_id} ({job.status})"
+                self._record_job({"job_id": job_id, "collected": True})
+
+        if self.jobs_path is not None and self.jobs_path.exists() and not self.uncollected():
+            self.jobs_path.unlink()
+
+    async def _submit(self, path: Path, endpoint: str, model: str, metadata: Optional[Dict[str, str]]) -> str:
+        with open(path, "rb") as handle:
+            uploaded = await self.client.files.upload_async(
+                file={"file_name": path.name, "content": handle},
+                purpose="batch",
+            )
+        job = await self.client.batch.jobs.create_async(
+            input_files=[uploaded.id],
+            endpoint=endpoint,
+            model=model,
+            metadata=metadata,
+            timeout_hours=settings.BATCH_JOB_TIMEOUT_HOURS,
+        )
+        return job.id
+
+    async def _read_results(self, file_id: str) -> AsyncIterator[BatchResult]:
+        """Stream the lines of a job's output or error file as results"""
+        response = await self.client.files.download_async(file_id=file_id)
+        try:
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    custom_id = record["custom_id"]
+                    reply = record.get("response") or {}
+                except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+                    # Its request is reported as unanswered once the file is read
+                    print(f"Skipping malformed line of batch file {file_id}: {e!r}")
+                    continue
+                if reply.get("status_code") == 200 and not record.get("error"):
+                    yield custom_id, reply.get("body"), None
+                else:
+                    error = record.get("error") or reply.get("body") or f"HTTP {reply.get('status_code')}"
+                    yield custom_id, None, str(error)
+        finally:
+            await response.aclose()
@@ -1,128 +1,505 @@
-import base64
+import argparse
 import json
-from pathlib import Path
-from typing import Dict, Any, Optional, List, Union
 import os
+import random
 import sys
 import asyncio
-
-from mistralai import Mistral
-from mistralai.models import OCRResponse
-from mistralai import DocumentURLChunk, ImageURLChunk, TextChunk
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 
 backend_path = str(Path(__file__).parent.parent.parent)
 if backend_path not in sys.path:
     sys.path.append(backend_path)
 
+from mistralai.models import OCRResponse
+
 from app.core.config import settings
+from app.services.mistral_batch_jobs import MistralBatchJobRunner
+from app.services.mistral_service import (
+    MistralService,
+    extraction_messages,
+    get_mistral_service,
+    ocr_markdown,
+    parse_extraction,
+    to_data_url,
+)
+from app.services.ocr_cache import image_sha256
+from app.utils.image_utils import get_image_executor, prepare_image
+from app.utils.rate_limit import AsyncRateLimiter
+
+IMAGE_MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+MANIFEST_NAME = "manifest.jsonl"
+# Batch jobs submitted by process_folder_with_batch_jobs, resumed by the next run if it is interrupted
+BATCH_JOBS_NAME = "batch_jobs.jsonl"
+
+
+class BatchManifest:
+    """
+    Append-only progress record of a batch output directory
+
+    Every finished image adds one JSON line (status "done" or "failed"),
+    flushed to disk as soon as the image completes, so an interrupted run
+    loses at most the images that were in flight. The last line for an image
+    wins. An image counts as processed while its size and modification time
+    match the "done" entry and its output file still exists.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+        self._file = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        if not self.path.exists():
+            return entries
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by a crash
+                    continue
+                entries[entry["image"]] = entry
+        return entries
+
+    def is_done(self, image_path: Path) -> bool:
+        entry = self.entries.get(image_path.name)
+        if not entry or entry.get("status") != "done":
+            return False
+        stat = image_path.stat()
+        return (
+            entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+            and (self.path.parent / entry.get("output", "")).is_file()
+        )
+
+    def record(self, image_path: Path, status: str, **fields: Any) -> None:
+        stat = image_path.stat()
+        entry = {
+            "image": image_path.name,
+            "status": status,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "finished_at": time.time(),
+            **fields,
+        }
+        self.entries[image_path.name] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def __enter__(self) -> "BatchManifest":
+        self._file = open(self.path, "a")
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._file.close()
+
+
+def _write_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    """Write JSON through a temporary file so a crash never leaves a partial output"""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Client errors other than 429 fail the same way on every attempt"""
+    status_code = getattr(error, "status_code", None)
+    return not (status_code is not None and 400 <= status_code < 500 and status_code != 429)
+
 
 class MistralBatchService:
     """Service for batch processing images and saving structured JSON outputs"""
-    
-    def __init__(self):
-        """Initialize Mistral client with API key from settings"""
-        self.client = Mistral(api_key=settings.MISTRAL_API_KEY)
-        self.ocr_model = settings.OCR_MODEL
-        self.extraction_model = settings.EXTRACTION_MODEL
-        self.output_dir = Path("structured_jsons")
+
+    def __init__(
+        self,
+        output_dir: Union[str, Path] = "structured_jsons",
+        workers: Optional[int] = None,
+        mistral_service: Optional[MistralService] = None,
+    ):
+        """
+        Initialize the batch pipeline
+
+        Args:
+            output_dir: Directory for the structured JSON outputs and the manifest
+            workers: Images processed at once (default settings.BATCH_WORKERS)
+            mistral_service: Mistral client to use (default the shared one)
+        """
+        self.service = mistral_service or get_mistral_service()
+        self.ocr_model = self.service.ocr_model
+        self.extraction_model = self.service.extraction_model
+        self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
-    
+        self.workers = workers or settings.BATCH_WORKERS
+        # Separate limits per stage: the OCR and chat endpoints have their own quotas
+        self.ocr_limiter = AsyncRateLimiter(settings.BATCH_OCR_RATE_LIMIT)
+        self.extraction_limiter = AsyncRateLimiter(settings.BATCH_EXTRACTION_RATE_LIMIT)
+        # Images extracted by the local markdown parser instead of the model
+        self.local_extractions = 0
+
     async def process_image(self, image_path: Path) -> Dict[str, Any]:
         """
         Process a single image and return structured data
-        
+
         Args:
             image_path: Path to the image file
-            
+
         Returns:
             Structured data extracted from the image
         """
         # Read image content
-        with open(image_path, 'rb') as f:
-            image_content = f.read()
-            
-        # Encode image as base64 for API
-        encoded = base64.b64encode(image_content).decode()
-        base64_data_url = f"data:image/jpeg;base64,{encoded}"
-        
+        image_content = await asyncio.to_thread(image_path.read_bytes)
+        base64_data_url = to_data_url(image_content, IMAGE_MIME_TYPES.get(image_path.suffix.lower(), "image/jpeg"))
+
         # Process image with OCR
-        image_response = self.client.ocr.process(
-            document=ImageURLChunk(image_url=base64_data_url),
-            model=self.ocr_model
+        image_response = await self._call_with_retries(
+            self.ocr_limiter, lambda: self.service.ocr(base64_data_url), f"OCR of {image_path.name}"
         )
-        
+
         if not image_response.pages:
             return {"error": "No text detected in image"}
-            
-        image_ocr_markdown = image_response.pages[0].markdown
-        
+
+        image_ocr_markdown = ocr_markdown(image_response)
+
+        # Tables and key: value lists convert locally, without taking a model call from the rate limit
+        structured = self.service.extract_local(image_ocr_markdown)
+        if structured is not None:
+            self.local_extractions += 1
+            return structured
+
         # Get structured response from model
-        chat_response = self.client.chat.complete(
-            model=self.extraction_model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        ImageURLChunk(image_url=base64_data_url),
-                        TextChunk(
-                            text=(
-                                f"This is image's OCR in markdown:\n\n{image_ocr_markdown}\n.\n"
-                                "Convert this into a sensible structured json response. "
-                                "The output should be strictly be json with no extra commentary"
-                            )
-                        ),
-                    ],
-                }
-            ],
-            response_format={"type": "json_object"},
-            temperature=0,
+        return await self._call_with_retries(
+            self.extraction_limiter,
+            lambda: self.service.extract(base64_data_url, image_ocr_markdown, local_first=False),
+            f"extraction of {image_path.name}",
         )
-        
-        try:
-            response_dict = json.loads(chat_response.choices[0].message.content)
-            return response_dict
-        except json.JSONDecodeError:
-            return {"raw_content": chat_response.choices[0].message.content}
-    
-    async def process_folder(self, input_folder: Union[str, Path]) -> None:
+
+    async def _call_with_retries(
+        self,
+        limiter: AsyncRateLimiter,
+        call: Callable[[], Awaitable[Any]],
+        description: str,
+    ) -> Any:
+        """
+        Run a stage call under its rate limit, retrying failures with backoff
+
+        The SDK already retries 429/5xx responses within one attempt; this
+        covers what is left (timeouts, exhausted SDK retries, dropped
+        connections) with exponential backoff and jitter.
+        """
+        for attempt in range(settings.BATCH_MAX_ATTEMPTS):
+            await limiter.acquire()
+            try:
+                return await call()
+            except Exception as e:
+                if attempt + 1 >= settings.BATCH_MAX_ATTEMPTS or not _is_retryable(e):
+                    raise
+                delay = settings.BATCH_RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+                print(f"{description} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def process_folder(self, input_folder: Union[str, Path]) -> Dict[str, int]:
         """
-        Process all images in a folder concurrently and save structured JSON outputs
-        
+        Process the images in a folder and save structured JSON outputs
+
+        A pool of workers processes the images concurrently; each output is
+        written to output_dir as soon as its image completes and recorded in
+        the manifest. Images the manifest already lists as processed are
+        skipped, so an interrupted or partly failed run can simply be
+        repeated.
+
         Args:
             input_folder: Path to folder containing images
+
+        Returns:
+            Counts of total, skipped, processed and failed images, and of
+            the processed ones extracted by the local markdown parser
         """
+        image_paths, manifest, pending = self._collect_images(input_folder)
+        counts = {
+            "total": len(image_paths),
+            "skipped": len(image_paths) - len(pending),
+            "processed": 0,
+            "failed": 0,
+            "extracted_locally": 0,
+        }
+        self.local_extractions = 0
+        print(f"Found {len(image_paths)} images to process, {counts['skipped']} already processed")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for path in pending:
+            queue.put_nowait(path)
+
+        async def worker():
+            while True:
+                try:
+                    image_path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._process_and_save(image_path, manifest, counts, len(pending))
+
+        with manifest:
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, len(pending)))))
+
+        counts["extracted_locally"] = self.local_extractions
+        print(
+            f"Processed {counts['processed']}, failed {counts['failed']}, "
+            f"skipped {counts['skipped']} of {counts['total']} images"
+        )
+        if counts["processed"]:
+            print(
+                f"{counts['extracted_locally']} of {counts['processed']} "
+                f"({counts['extracted_locally'] / counts['processed']:.0%}) extracted without the model"
+            )
+        return counts
+
+    async def process_folder_with_batch_jobs(self, input_folder: Union[str, Path]) -> Dict[str, int]:
+        """
+        Process the images in a folder through Mistral batch jobs
+
+        For backfills of many images: instead of two rate-limited live calls
+        per image, the OCR requests of all pending images are submitted as
+        batch jobs (see MistralBatchJobRunner), then extraction requests
+        for the documents the local markdown parser cannot convert. Results
+        are saved to output_dir, the manifest and the OCR cache (if enabled)
+        as each job finishes; images already in the cache need no job.
+        Images are sent as prepare_image output, like uploads to the API,
+        so the cache is keyed by the same bytes. Failed images are recorded
+        as failed and retried by the next run, live or batch.
+
+        Submitted jobs are recorded in output_dir (BATCH_JOBS_NAME). If a
+        run is interrupted while it waits, the next batch run collects the
+        jobs it left instead of submitting their images again; results of
+        resumed extraction jobs are saved but not cached, as their OCR text
+        was not kept.
+
+        Args:
+            input_folder: Path to folder containing images
+
+        Returns:
+            Counts of total, skipped, processed and failed images, of the
+            processed ones extracted by the local markdown parser and of
+            those answered from the cache
+        """
+        image_paths, manifest, pending = self._collect_images(input_folder)
+        counts = {
+            "total": len(image_paths),
+            "skipped": len(image_paths) - len(pending),
+            "processed": 0,
+            "failed": 0,
+            "extracted_locally": 0,
+            "cached": 0,
+        }
+        print(f"Found {len(image_paths)} images to process, {counts['skipped']} already processed")
+
+        cache = self.service.cache
+        runner = MistralBatchJobRunner(self.service, jobs_path=self.output_dir / BATCH_JOBS_NAME)
+        # Images in jobs of an interrupted run; the runner answers them again
+        resumed = runner.uncollected_custom_ids()
+        # Images by custom_id (their file name, unique within the folder)
+        images = {path.name: path for path in pending}
+        hashes: Dict[str, str] = {}
+
+        def unexpected(custom_id: str) -> bool:
+            # A repeated result, or one for an image finished or removed since its job was submitted
+            if custom_id in images:
+                return False
+            print(f"Skipping batch result for {custom_id}: not pending")
+            return True
+
+        def failed(custom_id: str, error: str) -> None:
+            if unexpected(custom_id):
+                return
+            counts["failed"] += 1
+            manifest.record(images.pop(custom_id), "failed", error=error)
+            print(f"Failed to process {custom_id}: {error}")
+
+        async def save(custom_id: str, result: Dict[str, Any], ocr_text: Optional[str] = None, **fields: Any) -> None:
+            if unexpected(custom_id):
+                return
+            # Unparseable model output is not cached so the next run retries it
+            if cache is not None and ocr_text is not None and "raw_content" not in result:
+                await cache.put(hashes[custom_id], ocr_text, result)
+            await self._save_result(images.pop(custom_id), result, manifest, counts, len(pending), **fields)
+
+        loop = asyncio.get_running_loop()
+        executor = get_image_executor()
+
+        async def prepare(path: Path) -> bytes:
+            return await loop.run_in_executor(executor, prepare_image, await asyncio.to_thread(path.read_bytes))
+
+        with manifest:
+            # Validate and hash the prepared images a pool's worth at a time; the
+            # request files prepare them again when written, so none are held
+            custom_ids = list(images)
+            chunk_size = settings.IMAGE_WORKERS * 4
+            for start in range(0, len(custom_ids), chunk_size):
+                chunk = custom_ids[start:start + chunk_size]
+                prepared = await asyncio.gather(
+                    *(prepare(images[custom_id]) for custom_id in chunk), return_exceptions=True
+                )
+                for custom_id, content in zip(chunk, prepared):
+                    if isinstance(content, Exception):
+                        failed(custom_id, str(content))
+                        continue
+                    hashes[custom_id] = image_sha256(content)
+                    cached = await cache.get(hashes[custom_id]) if cache is not None else None
+                    if cached is not None:
+                        counts["cached"] += 1
+                        await save(custom_id, cached["structured"], source="cache")
+
+            # OCR every image; convert what the local parser can right away
+            ocr_texts: Dict[str, str] = {}
+            ocr_results = runner.run(
+                "/v1/ocr",
+                self.ocr_model,
+                self._ocr_requests([path for custom_id, path in images.items() if custom_id not in resumed]),
+                {"stage": "ocr"},
+            )
+            async for custom_id, body, error in ocr_results:
+                if custom_id in ocr_texts:
+                    print(f"Skipping repeated batch result for {custom_id}")
+                    continue
+                if error is not None:
+                    failed(custom_id, error)
+                    continue
+                try:
+                    response = OCRResponse.model_validate(body)
+                except Exception as e:
+                    failed(custom_id, f"Invalid OCR response: {e}")
+                    continue
+                if not response.pages:
+                    await save(custom_id, {"error": "No text detected in image"}, source="batch_job")
+                    continue
+                text = ocr_markdown(response)
+                structured = self.service.extract_local(text)
+                if structured is not None:
+                    counts["extracted_locally"] += 1
+                    await save(custom_id, structured, text, source="batch_job")
+                else:
+                    ocr_texts[custom_id] = text
+
+            # Extract the rest with the model
+            extraction_results = runner.run(
+                "/v1/chat/completions",
+                self.extraction_model,
+                self._extraction_requests(ocr_texts, images),
+                {"stage": "extraction"},
+            )
+            async for custom_id, body, error in extraction_results:
+                if error is not None:
+                    failed(custom_id, error)
+                    continue
+                try:
+                    content = body["choices"][0]["message"]["content"]
+                except (KeyError, IndexError, TypeError) as e:
+                    failed(custom_id, f"Invalid extraction response: {e!r}")
+                    continue
+                # Resumed extraction jobs have no OCR text in this run, so their results are not cached
+                await save(custom_id, parse_extraction(content), ocr_texts.pop(custom_id, None), source="batch_job")
+
+        print(
+            f"Processed {counts['processed']} ({counts['cached']} from the cache, "
+            f"{counts['extracted_locally']} extracted without the model), failed {counts['failed']}, "
+            f"skipped {counts['skipped']} of {counts['total']} images"
+        )
+        return counts
+
+    def _ocr_requests(self, image_paths: List[Path]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Batch OCR request bodies, reading and preparing each image only when its line is written"""
+        for path in image_paths:
+            data_url = to_data_url(prepare_image(path.read_bytes()))
+            yield path.name, {"document": {"type": "image_url", "image_url": data_url}}
+
+    def _extraction_requests(
+        self, ocr_texts: Dict[str, str], images: Dict[str, Path]
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Batch chat request bodies with the same prompt as MistralService.extract"""
+        for custom_id, text in ocr_texts.items():
+            data_url = to_data_url(prepare_image(images[custom_id].read_bytes()))
+            yield custom_id, {
+                "messages": extraction_messages(data_url, text),
+                "response_format": {"type": "json_object"},
+                "temperature": 0,
+            }
+
+    def _collect_images(self, input_folder: Union[str, Path]) -> Tuple[List[Path], BatchManifest, List[Path]]:
+        """The folder's images, its output manifest and the images the manifest does not list as done"""
         input_path = Path(input_folder)
-        
+
         # Collect all image paths
-        image_paths = [
+        image_paths = sorted(
             path for path in input_path.glob("*")
-            if path.suffix.lower() in ['.jpg', '.jpeg', '.png']
-        ]
-        
-        print(f"Found {len(image_paths)} images to process")
-        
-        # Process all images concurrently
-        tasks = [self.process_image(path) for path in image_paths]
-        results = await asyncio.gather(*tasks)
-        
-        # Save all results
-        for image_path, result in zip(image_paths, results):
-            output_path = self.output_dir / f"{image_path.stem}.json"
-            with open(output_path, 'w') as f:
-                json.dump(result, f, indent=2)
-            print(f"Saved structured data to {output_path}")
+            if path.suffix.lower() in IMAGE_MIME_TYPES
+        )
+
+        manifest = BatchManifest(self.output_dir / MANIFEST_NAME)
+        pending = [path for path in image_paths if not manifest.is_done(path)]
+        return image_paths, manifest, pending
+
+    async def _process_and_save(
+        self,
+        image_path: Path,
+        manifest: BatchManifest,
+        counts: Dict[str, int],
+        pending: int,
+    ) -> None:
+        start = time.perf_counter()
+        try:
+            result = await self.process_image(image_path)
+        except Exception as e:
+            counts["failed"] += 1
+            manifest.record(image_path, "failed", error=str(e))
+            print(f"Failed to process {image_path.name}: {e}")
+            return
+
+        await self._save_result(
+            image_path, result, manifest, counts, pending, seconds=round(time.perf_counter() - start, 3)
+        )
+
+    async def _save_result(
+        self,
+        image_path: Path,
+        result: Dict[str, Any],
+        manifest: BatchManifest,
+        counts: Dict[str, int],
+        pending: int,
+        **fields: Any,
+    ) -> None:
+        output_path = self.output_dir / f"{image_path.stem}.json"
+        await asyncio.to_thread(_write_json_atomic, output_path, result)
+        manifest.record(image_path, "done", output=output_path.name, **fields)
+        counts["processed"] += 1
+        print(f"[{counts['processed'] + counts['failed']}/{pending}] Saved structured data to {output_path}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract structured JSON from a folder of images")
+    parser.add_argument("input_folder", type=Path, help="Folder containing .jpg/.jpeg/.png images")
+    parser.add_argument("--output-dir", type=Path, default=Path("structured_jsons"))
+    parser.add_argument("--workers", type=int, default=None, help="Images processed at once")
+    parser.add_argument(
+        "--batch-jobs",
+        action="store_true",
+        help="Submit the requests as Mistral batch jobs (cheaper, not rate limited, results take longer)",
+    )
+    args = parser.parse_args()
+
     async def main():
         # Initialize the service
-        service = MistralBatchService()
-        
-        # Specify your input folder
-        input_folder = Path("/Users/vijayrajgohil/Documents/VaultSense/process_folder/")
-        
-        # Process all images
-        await service.process_folder(input_folder)
-    
-    asyncio.run(main())
\ No newline at end of file
+        service = MistralBatchService(output_dir=args.output_dir, workers=args.workers)
+        try:
+            # Process all images; re-running resumes where the last run stopped
+            if args.batch_jobs:
+                await service.process_folder_with_batch_jobs(args.input_folder)
+            else:
+                await service.process_folder(args.input_folder)
+        finally:
+            await service.service.aclose()
+
+    asyncio.run(main())
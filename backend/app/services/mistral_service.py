@@ -1,27 +1,96 @@
+import asyncio
 import base64
 import json
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any, Optional, List, Union
 
+import httpx
 from mistralai import Mistral
 from mistralai.models import OCRResponse
-from mistralai import DocumentURLChunk, ImageURLChunk, TextChunk
+from mistralai import DocumentURLChunk, ImageURLChunk
+from mistralai.utils import BackoffStrategy, RetryConfig
 
 from app.core.config import settings
+from app.services.ocr_cache import OCRCache, image_sha256
+from app.utils.image_utils import dhash
+from app.utils.markdown_extraction import LOCAL_EXTRACTION_VERSION, parse_structured_markdown
+from app.utils.metrics import EXTRACTIONS, OCR_STAGE_SECONDS, model_call
+from app.utils.tiling import stitch_markdown
+
+# Bump when the extraction prompt changes so cached results are recomputed
+EXTRACTION_PROMPT_VERSION = 1
+
+
+def extraction_cache_key() -> str:
+    """
+    Extraction setting the OCR cache keys entries by
+    
+    Results of the local markdown parser are cached like the model's, so the
+    key names the parser and its version while it is enabled: turning local
+    extraction off or changing the parser purges the entries made before.
+    """
+    if settings.LOCAL_EXTRACTION_ENABLED:
+        return f"{settings.EXTRACTION_MODEL}+local-v{LOCAL_EXTRACTION_VERSION}"
+    return settings.EXTRACTION_MODEL
+
 
 class MistralService:
     """Service for interacting with Mistral AI API"""
     
-    def __init__(self):
-        """Initialize Mistral client with API key from settings"""
-        self.client = Mistral(api_key=settings.MISTRAL_API_KEY)
+    def __init__(self, cache: Optional[OCRCache] = None):
+        """
+        Initialize the Mistral client from settings
+        
+        Requests go through a pooled httpx.AsyncClient, so one instance can
+        serve many concurrent requests; use get_mistral_service() to share it.
+        
+        Args:
+            cache: Cache of results by image content for process_image
+        """
+        self.cache = cache
+        self.async_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.MISTRAL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.MISTRAL_MAX_CONNECTIONS,
+            ),
+            timeout=settings.MISTRAL_TIMEOUT_MS / 1000,
+        )
+        self.client = Mistral(
+            api_key=settings.MISTRAL_API_KEY,
+            server_url=settings.MISTRAL_SERVER_URL,
+            async_client=self.async_http_client,
+            retry_config=RetryConfig(
+                "backoff",
+                BackoffStrategy(
+                    initial_interval=settings.MISTRAL_RETRY_INITIAL_INTERVAL_MS,
+                    max_interval=settings.MISTRAL_RETRY_MAX_INTERVAL_MS,
+                    exponent=2.0,
+                    max_elapsed_time=settings.MISTRAL_RETRY_MAX_ELAPSED_MS,
+                ),
+                retry_connection_errors=True,
+            ),
+            timeout_ms=settings.MISTRAL_TIMEOUT_MS,
+        )
         self.ocr_model = settings.OCR_MODEL
         self.extraction_model = settings.EXTRACTION_MODEL
     
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections and the cache"""
+        await self.async_http_client.aclose()
+        if self.cache is not None:
+            self.cache.close()
+    
     async def process_image(self, image_content: bytes, image_name: str) -> Dict[str, Any]:
         """
         Process an image using Mistral OCR and extract structured data
         
+        Results are cached by the SHA-256 of image_content, so pass the
+        normalized bytes (prepare_image output): a repeat upload of the
+        same image is answered from the cache without calling Mistral. When
+        near-duplicate lookups are enabled, a near-duplicate of a cached image
+        is still OCR'd, and reuses the cached extraction if the text is the same.
+        
         Args:
             image_content: Binary content of the image
             image_name: Name of the image file
@@ -29,48 +98,284 @@ class MistralService:
         Returns:
             Structured data extracted from the image
         """
+        image_hash = None
+        image_dhash = None
+        similar = []
+        if self.cache is not None:
+            image_hash = image_sha256(image_content)
+            cached = await self.cache.get(image_hash)
+            if cached is not None:
+                return cached["structured"]
+            
+            if self.cache.near_duplicate_distance is not None:
+                image_dhash = await asyncio.to_thread(dhash, image_content)
+                similar = await self.cache.find_similar(image_dhash)
+        
         # Encode image as base64 for API
-        encoded = base64.b64encode(image_content).decode()
-        base64_data_url = f"data:image/jpeg;base64,{encoded}"
+        base64_data_url = to_data_url(image_content)
         
         # Process image with OCR
-        image_response = self.client.ocr.process(
-            document=ImageURLChunk(image_url=base64_data_url),
-            model=self.ocr_model
-        )
+        image_response = await self.ocr(base64_data_url)
         
         # Get OCR results for processing
         if not image_response.pages:
             return {"error": "No text detected in image"}
             
-        image_ocr_markdown = image_response.pages[0].markdown
+        image_ocr_markdown = ocr_markdown(image_response)
+        
+        confirmed = await self.cache.confirm_similar(similar, image_ocr_markdown) if similar else None
+        if confirmed is not None:
+            # Cache the copy under its own hash so its next upload is an exact hit; it is
+            # not indexed by dHash, so matches stay anchored to images that were extracted
+            await self.cache.put(image_hash, image_ocr_markdown, confirmed["structured"])
+            return confirmed["structured"]
         
         # Get structured response from model
-        chat_response = self.client.chat.complete(
-            model=self.extraction_model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        ImageURLChunk(image_url=base64_data_url),
-                        TextChunk(
-                            text=(
-                                f"This is image's OCR in markdown:\n\n{image_ocr_markdown}\n.\n"
-                                "Convert this into a sensible structured json response. "
-                                "The output should be strictly be json with no extra commentary"
-                            )
-                        ),
-                    ],
-                }
-            ],
-            response_format={"type": "json_object"},
-            temperature=0,
-        )
+        structured = await self.extract(base64_data_url, image_ocr_markdown)
+        
+        # Unparseable model output is not cached so the next upload retries it
+        if image_hash is not None and "raw_content" not in structured:
+            await self.cache.put(image_hash, image_ocr_markdown, structured, dhash=image_dhash)
+        return structured
+    
+    async def process_tiled_image(self, image_content: bytes, tiles: List[bytes]) -> Dict[str, Any]:
+        """
+        Process a large image as tiles using Mistral OCR and extract structured data
+        
+        The tiles are OCR'd in parallel (at most settings.OCR_TILE_CONCURRENCY
+        at once) and their markdown is stitched back together; extraction
+        then sees the stitched markdown with the downscaled image. Results
+        are cached by the SHA-256 of the tiles.
+        
+        Args:
+            image_content: The image fitted to the OCR size limit (see prepare_image_tiles)
+            tiles: Overlapping strips of the image from top to bottom
+            
+        Returns:
+            Structured data extracted from the image
+        """
+        tiles_hash = None
+        if self.cache is not None:
+            tiles_hash = image_sha256(b"".join(tiles))
+            cached = await self.cache.get(tiles_hash)
+            if cached is not None:
+                return cached["structured"]
+        
+        semaphore = asyncio.Semaphore(settings.OCR_TILE_CONCURRENCY)
+        
+        async def ocr_tile(tile: bytes) -> str:
+            async with semaphore:
+                return ocr_markdown(await self.ocr(to_data_url(tile)))
+        
+        markdown = await asyncio.gather(*(ocr_tile(tile) for tile in tiles))
+        image_ocr_markdown = stitch_markdown(markdown)
+        
+        if not image_ocr_markdown:
+            return {"error": "No text detected in image"}
+        
+        structured = await self.extract(to_data_url(image_content), image_ocr_markdown)
+        
+        if tiles_hash is not None and "raw_content" not in structured:
+            await self.cache.put(tiles_hash, image_ocr_markdown, structured)
+        return structured
+    
+    async def process_pdf(self, pdf_content: bytes) -> Dict[str, Any]:
+        """
+        Process a PDF (usually one page of a split document) using Mistral OCR
+        and extract structured data from its text
+        
+        Results are cached by the SHA-256 of pdf_content like process_image.
+        
+        Args:
+            pdf_content: Binary content of the PDF
+            
+        Returns:
+            Structured data extracted from the PDF
+        """
+        pdf_hash = None
+        if self.cache is not None:
+            pdf_hash = image_sha256(pdf_content)
+            cached = await self.cache.get(pdf_hash)
+            if cached is not None:
+                return cached["structured"]
+        
+        pdf_response = await self.ocr(to_data_url(pdf_content, "application/pdf"))
+        if not pdf_response.pages:
+            return {"error": "No text detected in document"}
+        
+        pdf_ocr_markdown = ocr_markdown(pdf_response)
         
-        # Parse and return JSON response
-        try:
-            response_dict = json.loads(chat_response.choices[0].message.content)
-            return response_dict
-        except json.JSONDecodeError:
-            # If the response is not valid JSON, return the raw content
-            return {"raw_content": chat_response.choices[0].message.content} 
\ No newline at end of file
+        # There is no page image to show the model, so extract from the text alone
+        structured = await self.extract(None, pdf_ocr_markdown)
+        
+        if pdf_hash is not None and "raw_content" not in structured:
+            await self.cache.put(pdf_hash, pdf_ocr_markdown, structured)
+        return structured
+    
+    async def ocr(self, base64_data_url: str) -> OCRResponse:
+        """
+        Run Mistral OCR on an image or a PDF
+        
+        Args:
+            base64_data_url: The image or PDF as a base64 data URL
+            
+        Returns:
+            The OCR response with one markdown page per page of the document
+        """
+        if base64_data_url.startswith("data:application/pdf"):
+            document = DocumentURLChunk(document_url=base64_data_url)
+        else:
+            document = ImageURLChunk(image_url=base64_data_url)
+        with OCR_STAGE_SECONDS.labels("ocr").time(), model_call("ocr", self.ocr_model):
+            return await self.client.ocr.process_async(
+                document=document,
+                model=self.ocr_model
+            )
+    
+    def extract_local(self, ocr_markdown: str) -> Optional[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        Convert OCR markdown to structured JSON without the extraction model
+        
+        Args:
+            ocr_markdown: OCR output for the image
+            
+        Returns:
+            The structured data, or None if the markdown is not plainly tables and
+            key: value lines (or local extraction is disabled) and needs the model
+        """
+        if not settings.LOCAL_EXTRACTION_ENABLED:
+            return None
+        with OCR_STAGE_SECONDS.labels("local_extraction").time():
+            structured = parse_structured_markdown(ocr_markdown)
+        if structured is not None:
+            EXTRACTIONS.labels("local").inc()
+        return structured
+    
+    async def extract(self, base64_data_url: Optional[str], ocr_markdown: str, local_first: bool = True) -> Dict[str, Any]:
+        """
+        Turn an image and its OCR markdown into structured JSON
+        
+        Args:
+            base64_data_url: The image as a base64 data URL, or None to extract from the markdown alone
+            ocr_markdown: OCR output for the image
+            local_first: Try extract_local before calling the extraction model
+            
+        Returns:
+            The structured data, or {"raw_content": ...} if the model did not return valid JSON
+        """
+        if local_first:
+            structured = self.extract_local(ocr_markdown)
+            if structured is not None:
+                return structured
+        
+        EXTRACTIONS.labels("llm").inc()
+        with OCR_STAGE_SECONDS.labels("extraction").time(), model_call("chat", self.extraction_model):
+            chat_response = await self.client.chat.complete_async(
+                model=self.extraction_model,
+                messages=extraction_messages(base64_data_url, ocr_markdown),
+                response_format={"type": "json_object"},
+                temperature=0,
+            )
+        
+        return parse_extraction(chat_response.choices[0].message.content)
+
+
+def extraction_messages(base64_data_url: Optional[str], ocr_markdown: str) -> List[Dict[str, Any]]:
+    """
+    Chat messages asking the extraction model for an image's structured JSON
+    
+    Shared by MistralService.extract and batch jobs so both send the same
+    prompt (see EXTRACTION_PROMPT_VERSION).
+    
+    Args:
+        base64_data_url: The image as a base64 data URL, or None to extract from the markdown alone
+        ocr_markdown: OCR output for the image
+        
+    Returns:
+        The messages for a chat completion
+    """
+    content = [] if base64_data_url is None else [{"type": "image_url", "image_url": base64_data_url}]
+    content.append(
+        {
+            "type": "text",
+            "text": (
+                f"This is image's OCR in markdown:\n\n{ocr_markdown}\n.\n"
+                "Convert this into a sensible structured json response. "
+                "The output should be strictly be json with no extra commentary"
+            ),
+        }
+    )
+    return [
+        {
+            "role": "user",
+            "content": content,
+        }
+    ]
+
+
+def parse_extraction(content: str) -> Dict[str, Any]:
+    """
+    Parse the extraction model's reply
+    
+    Args:
+        content: Message content of the chat completion
+        
+    Returns:
+        The structured data, or {"raw_content": ...} if the reply is not valid JSON
+    """
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        # If the response is not valid JSON, return the raw content
+        return {"raw_content": content}
+
+
+def ocr_markdown(ocr_response: OCRResponse) -> str:
+    """
+    Join the markdown of every page of an OCR response
+    
+    Args:
+        ocr_response: Response of MistralService.ocr
+        
+    Returns:
+        The pages' markdown separated by blank lines
+    """
+    return "\n\n".join(page.markdown for page in ocr_response.pages)
+
+
+def to_data_url(image_content: bytes, mime_type: str = "image/jpeg") -> str:
+    """
+    Encode an image as a base64 data URL for the Mistral API
+    
+    Args:
+        image_content: Binary content of the image
+        mime_type: MIME type of the image
+        
+    Returns:
+        The data URL
+    """
+    encoded = base64.b64encode(image_content).decode()
+    return f"data:{mime_type};base64,{encoded}"
+
+
+@lru_cache(maxsize=1)
+def get_mistral_service() -> MistralService:
+    """
+    Return the process-wide MistralService
+    
+    Used as a FastAPI dependency so every request shares one client and its
+    connection pool instead of building a new one per request.
+    """
+    cache = None
+    if settings.OCR_CACHE_ENABLED:
+        cache = OCRCache(
+            db_path=settings.SQLITE_DB_PATH,
+            schema_path=settings.SQLITE_SCHEMA_PATH,
+            ocr_model=settings.OCR_MODEL,
+            extraction_model=extraction_cache_key(),
+            prompt_version=EXTRACTION_PROMPT_VERSION,
+            near_duplicate_distance=(
+                settings.NEAR_DUPLICATE_MAX_DISTANCE if settings.NEAR_DUPLICATE_MAX_DISTANCE >= 0 else None
+            ),
+        )
+    return MistralService(cache=cache)
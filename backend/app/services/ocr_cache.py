@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+def image_sha256(image_content: bytes) -> str:
+    """Content hash of an image; pass the normalized bytes (see prepare_image)"""
+    return hashlib.sha256(image_content).hexdigest()
+
+
+def same_text(markdown: str, other: str) -> bool:
+    """Whether two OCR outputs hold the same text, ignoring whitespace and layout"""
+    return markdown.split() == other.split()
+
+
+# 64-bit dHash split into four 16-bit bands, one indexed column each
+DHASH_BANDS = 4
+DHASH_BAND_BITS = 16
+
+
+def dhash_bands(value: int) -> List[int]:
+    """Split a 64-bit dHash into its bands, most significant first"""
+    mask = (1 << DHASH_BAND_BITS) - 1
+    return [
+        (value >> (DHASH_BAND_BITS * (DHASH_BANDS - 1 - i))) & mask
+        for i in range(DHASH_BANDS)
+    ]
+
+
+def _band_probes(band: int, radius: int) -> List[int]:
+    """All band values within Hamming distance radius of band"""
+    probes = []
+    for distance in range(radius + 1):
+        for bits in itertools.combinations(range(DHASH_BAND_BITS), distance):
+            probe = band
+            for bit in bits:
+                probe ^= 1 << bit
+            probes.append(probe)
+    return probes
+
+
+class OCRCache:
+    """
+    Cache of OCR markdown and structured JSON in the local SQLite database
+
+    Entries are keyed by the SHA-256 of the normalized image bytes together
+    with the OCR model, the extraction model and the extraction prompt
+    version, so a repeat upload of the same image skips both Mistral calls.
+    When any of those settings change, the entries produced under the old
+    ones are purged the next time the cache is opened.
+
+    Re-compressed, resized or re-screenshotted copies hash differently, so
+    entries also record a perceptual hash (dHash) of their image. With
+    near_duplicate_distance set, find_similar() returns the entries whose
+    hashes are within that many differing bits, closest first. The lookup uses multi-index
+    hashing: the 64-bit hash is stored as four indexed 16-bit bands and, by
+    the pigeonhole principle, a match within distance d agrees within
+    d // 4 bits on at least one band, so only the rows in those few band
+    buckets are compared instead of the whole table.
+
+    A dHash only captures the layout of a page: forms filled from the same
+    template hash within a bit or two of each other whatever their values.
+    A near-duplicate match is therefore only a candidate; confirm_similar()
+    checks the candidates in turn against the OCR text of the new image and
+    returns the first that holds the same text, so a same-template form
+    closer by hash does not hide a true copy behind it.
+
+    Lookups run in a worker thread on one shared connection.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        schema_path: str,
+        ocr_model: str,
+        extraction_model: str,
+        prompt_version: int,
+        near_duplicate_distance: Optional[int] = None,
+    ):
+        self.db_path = db_path
+        self.schema_path = schema_path
+        self.ocr_model = ocr_model
+        self.extraction_model = extraction_model
+        self.prompt_version = prompt_version
+        # None disables near-duplicate lookups
+        self.near_duplicate_distance = near_duplicate_distance
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database on first use: apply the schema and purge stale entries"""
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(Path(self.schema_path).read_text())
+            purged = conn.execute(
+                "DELETE FROM ocr_cache WHERE ocr_model != ? OR extraction_model != ? OR prompt_version != ?",
+                (self.ocr_model, self.extraction_model, self.prompt_version),
+            ).rowcount
+            conn.execute("DELETE FROM image_dhash WHERE image_sha256 NOT IN (SELECT image_sha256 FROM ocr_cache)")
+            conn.commit()
+            if purged:
+                logger.info("Purged %s OCR cache entries from previous model settings", purged)
+            self._conn = conn
+        return self._conn
+
+    def _get(self, image_hash: str) -> Optional[Dict[str, Any]]:
+        key = (image_hash, self.ocr_model, self.extraction_model, self.prompt_version)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT ocr_markdown, structured_json FROM ocr_cache "
+                "WHERE image_sha256 = ? AND ocr_model = ? AND extraction_model = ? AND prompt_version = ?",
+                key,
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE ocr_cache SET hits = hits + 1, last_hit_ts = CURRENT_TIMESTAMP "
+                    "WHERE image_sha256 = ? AND ocr_model = ? AND extraction_model = ? AND prompt_version = ?",
+                    key,
+                )
+                conn.commit()
+        if row is None:
+            return None
+        return {"ocr_markdown": row[0], "structured": json.loads(row[1])}
+
+    def _find_similar(self, dhash: int) -> List[Tuple[int, Dict[str, Any]]]:
+        bands = dhash_bands(dhash)
+        radius = self.near_duplicate_distance // DHASH_BANDS
+        # One indexed IN lookup per band; the probes are integers, so they are
+        # inlined rather than bound to stay under SQLite's parameter limit
+        candidates = " UNION ".join(
+            f"SELECT image_sha256 FROM image_dhash WHERE band{i} IN "
+            f"({','.join(str(probe) for probe in _band_probes(band, radius))})"
+            for i, band in enumerate(bands)
+        )
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT d.image_sha256, d.band0, d.band1, d.band2, d.band3, c.ocr_markdown, c.structured_json "
+                f"FROM ({candidates}) AS m "
+                "JOIN image_dhash d ON d.image_sha256 = m.image_sha256 "
+                "JOIN ocr_cache c ON c.image_sha256 = d.image_sha256 "
+                "AND c.ocr_model = ? AND c.extraction_model = ? AND c.prompt_version = ?",
+                (self.ocr_model, self.extraction_model, self.prompt_version),
+            ).fetchall()
+        matches = []
+        for row in rows:
+            distance = sum(bin(a ^ b).count("1") for a, b in zip(bands, row[1:5]))
+            if distance <= self.near_duplicate_distance:
+                matches.append((distance, row))
+        matches.sort(key=lambda match: match[0])
+        return [
+            (distance, {"ocr_markdown": row[5], "structured": json.loads(row[6]), "image_sha256": row[0]})
+            for distance, row in matches
+        ]
+
+    def _record_hit(self, image_hash: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE ocr_cache SET hits = hits + 1, last_hit_ts = CURRENT_TIMESTAMP "
+                "WHERE image_sha256 = ? AND ocr_model = ? AND extraction_model = ? AND prompt_version = ?",
+                (image_hash, self.ocr_model, self.extraction_model, self.prompt_version),
+            )
+            conn.commit()
+
+    def _put(
+        self,
+        image_hash: str,
+        ocr_markdown: str,
+        structured: Dict[str, Any],
+        dhash: Optional[int],
+    ) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache "
+                "(image_sha256, ocr_model, extraction_model, prompt_version, ocr_markdown, structured_json) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    image_hash, self.ocr_model, self.extraction_model, self.prompt_version,
+                    ocr_markdown, json.dumps(structured),
+                ),
+            )
+            if dhash is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO image_dhash (image_sha256, band0, band1, band2, band3) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (image_hash, *dhash_bands(dhash)),
+                )
+            conn.commit()
+
+    async def get(self, image_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the cached result for an image
+
+        Args:
+            image_hash: image_sha256() of the normalized image bytes
+
+        Returns:
+            {"ocr_markdown": ..., "structured": ...} or None on a miss
+        """
+        try:
+            entry = await asyncio.to_thread(self._get, image_hash)
+        except sqlite3.Error as e:
+            # the cache is an optimization; fall back to calling Mistral
+            logger.error("OCR cache lookup failed: %s", e)
+            entry = None
+        CACHE_LOOKUPS.labels("ocr", "hit" if entry is not None else "miss").inc()
+        return entry
+
+    async def find_similar(self, dhash: int) -> List[Dict[str, Any]]:
+        """
+        Look up the results of near-duplicates of an image
+
+        Args:
+            dhash: dhash() of the normalized image bytes
+
+        Returns:
+            {"ocr_markdown": ..., "structured": ..., "image_sha256": ...} of
+            every entry within near_duplicate_distance, fewest differing bits
+            first; empty when there is none (or near-duplicate lookups are off)
+        """
+        if self.near_duplicate_distance is None:
+            return []
+        try:
+            matches = await asyncio.to_thread(self._find_similar, dhash)
+        except sqlite3.Error as e:
+            logger.error("OCR cache near-duplicate lookup failed: %s", e)
+            matches = []
+        CACHE_LOOKUPS.labels("ocr_near_duplicate", "hit" if matches else "miss").inc()
+        if matches:
+            logger.info(
+                "Found %s near-duplicate candidates, closest %s (distance %s)",
+                len(matches), matches[0][1]["image_sha256"], matches[0][0],
+            )
+        return [entry for _, entry in matches]
+
+    async def confirm_similar(self, candidates: List[Dict[str, Any]], ocr_markdown: str) -> Optional[Dict[str, Any]]:
+        """
+        Check find_similar() candidates against the OCR output of the new image
+
+        Candidates are tried closest first; the first one holding the same
+        text is counted as a hit of its entry.
+
+        Args:
+            candidates: The matches returned by find_similar()
+            ocr_markdown: OCR output of the new image
+
+        Returns:
+            The first candidate whose image holds the same text, so its
+            extraction applies, or None if none does
+        """
+        confirmed = next((entry for entry in candidates if same_text(entry["ocr_markdown"], ocr_markdown)), None)
+        CACHE_LOOKUPS.labels("ocr_near_duplicate", "confirmed" if confirmed is not None else "rejected").inc()
+        if confirmed is None:
+            logger.info("None of %s near-duplicate candidates holds the same text, not reused", len(candidates))
+            return None
+        try:
+            await asyncio.to_thread(self._record_hit, confirmed["image_sha256"])
+        except sqlite3.Error as e:
+            logger.error("OCR cache write failed: %s", e)
+        return confirmed
+
+    async def put(
+        self,
+        image_hash: str,
+        ocr_markdown: str,
+        structured: Dict[str, Any],
+        dhash: Optional[int] = None,
+    ) -> None:
+        """
+        Store the result for an image
+
+        Args:
+            image_hash: image_sha256() of the normalized image bytes
+            ocr_markdown: OCR output for the image
+            structured: Structured data extracted from it
+            dhash: dhash() of the image, to index it for near-duplicate lookups
+        """
+        try:
+            await asyncio.to_thread(self._put, image_hash, ocr_markdown, structured, dhash)
+        except sqlite3.Error as e:
+            logger.error("OCR cache write failed: %s", e)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,95 @@
+from io import BytesIO
+from typing import Callable, Optional, Tuple
+
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+from app.core.config import settings
+from app.utils.image_utils import SUPPORTED_FORMATS, encode_frame, prepare_image
+
+PDF_MIME_TYPE = "application/pdf"
+JPEG_MIME_TYPE = "image/jpeg"
+
+# A page as (content, mime type): a single-page PDF or a JPEG frame
+Page = Tuple[bytes, str]
+
+
+def open_document(file_content: bytes, max_pages: Optional[int] = None) -> Tuple[int, Callable[[int], Page]]:
+    """
+    Open a PDF, a multi-page TIFF or a single image and split it into pages
+
+    Only the header and page index are read here, so invalid uploads can be
+    rejected before a response starts. Pages are split on demand through the
+    returned get_page(index), so the first page is ready in constant time
+    however long the document is. get_page raises ValueError for a page that
+    cannot be split without affecting the others; it is not thread safe, so
+    call it from one thread at a time.
+
+    Args:
+        file_content: Binary content of the upload
+        max_pages: Largest accepted page count (default settings.MAX_DOCUMENT_PAGES)
+
+    Returns:
+        Tuple of (page_count, get_page)
+
+    Raises:
+        ValueError: If the upload is not a supported document or is too large
+    """
+    max_pages = max_pages or settings.MAX_DOCUMENT_PAGES
+    if file_content[:5] == b"%PDF-":
+        page_count, get_page = _open_pdf(file_content)
+    else:
+        page_count, get_page = _open_image(file_content)
+
+    if page_count > max_pages:
+        raise ValueError(f"Document too long: {page_count} pages exceeds {max_pages}")
+    return page_count, get_page
+
+
+def _open_pdf(file_content: bytes) -> Tuple[int, Callable[[int], Page]]:
+    try:
+        reader = PdfReader(BytesIO(file_content))
+        encrypted = reader.is_encrypted
+        page_count = 0 if encrypted else len(reader.pages)
+    except Exception as e:
+        raise ValueError(f"Invalid PDF file: {str(e)}")
+    if encrypted:
+        raise ValueError("Encrypted PDFs are not supported")
+
+    def get_page(index: int) -> Page:
+        try:
+            writer = PdfWriter()
+            writer.add_page(reader.pages[index])
+            buffer = BytesIO()
+            writer.write(buffer)
+        except Exception as e:
+            raise ValueError(f"Invalid PDF page: {str(e)}")
+        return buffer.getvalue(), PDF_MIME_TYPE
+
+    return page_count, get_page
+
+
+def _open_image(file_content: bytes) -> Tuple[int, Callable[[int], Page]]:
+    try:
+        img = Image.open(BytesIO(file_content))
+    except Exception as e:
+        raise ValueError(f"Invalid image file: {str(e)}")
+
+    if img.format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported image format: {img.format}")
+
+    if img.format != "TIFF":
+        # Frames of an animated GIF are not pages; prepare it like a single-image upload
+        return 1, lambda index: (prepare_image(file_content), JPEG_MIME_TYPE)
+
+    def get_page(index: int) -> Page:
+        img.seek(index)
+        width, height = img.size
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            raise ValueError(f"Image too large: {width}x{height} exceeds {settings.MAX_IMAGE_PIXELS} pixels")
+        try:
+            return encode_frame(img), JPEG_MIME_TYPE
+        except Exception as e:
+            raise ValueError(f"Invalid image page: {str(e)}")
+
+    return getattr(img, "n_frames", 1), get_page
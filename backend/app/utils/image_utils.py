@@ -1,67 +1,158 @@
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from io import BytesIO
-from typing import Tuple
+from typing import Optional
 from PIL import Image
 
-def validate_image(file_content: bytes) -> Tuple[bool, str]:
+from app.core.config import settings
+
+SUPPORTED_FORMATS = ['JPEG', 'PNG', 'TIFF', 'BMP', 'GIF']
+
+def prepare_image(file_content: bytes, max_size: int = 4000, max_pixels: Optional[int] = None) -> bytes:
     """
-    Validate if the file is a supported image type
+    Validate and preprocess an upload with a single decode
+    
+    Reads the header once to reject unsupported formats and decompression
+    bombs before any pixel data is decoded, and decodes the pixels at most
+    once. JPEGs larger than max_size are decoded at reduced scale (draft
+    mode), and JPEGs that already fit are passed through without re-encoding.
+    
+    CPU bound; run it through get_image_executor() rather than on the event loop.
     
     Args:
-        file_content: Binary content of the file
+        file_content: Binary content of the upload
+        max_size: Maximum dimension (width or height) for the image
+        max_pixels: Largest accepted width * height (default settings.MAX_IMAGE_PIXELS)
         
     Returns:
-        Tuple of (is_valid, error_message)
+        Processed image content as JPEG bytes
+        
+    Raises:
+        ValueError: If the upload is not a supported image or is too large
     """
+    max_pixels = max_pixels or settings.MAX_IMAGE_PIXELS
     try:
-        # Try to open the image with PIL
         img = Image.open(BytesIO(file_content))
-        img.verify()  # Verify it's an image
-        
-        # Check supported formats
-        if img.format not in ['JPEG', 'PNG', 'TIFF', 'BMP', 'GIF']:
-            return False, f"Unsupported image format: {img.format}"
-            
-        return True, ""
     except Exception as e:
-        return False, f"Invalid image file: {str(e)}"
+        raise ValueError(f"Invalid image file: {str(e)}")
+    
+    if img.format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported image format: {img.format}")
+    
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ValueError(f"Image too large: {width}x{height} exceeds {max_pixels} pixels")
+    
+    # Already a JPEG of acceptable size: nothing to change
+    if img.format == 'JPEG' and img.mode == 'RGB' and max(width, height) <= max_size:
+        return file_content
+    
+    try:
+        return encode_frame(img, max_size)
+    except Exception as e:
+        raise ValueError(f"Invalid image file: {str(e)}")
 
-def preprocess_image(file_content: bytes, max_size: int = 4000) -> bytes:
+def encode_frame(img: Image.Image, max_size: int = 4000) -> bytes:
     """
-    Preprocess image if needed (resize, format conversion, etc.)
+    Decode the current frame of an opened image and encode it as a JPEG
     
     Args:
-        file_content: Binary content of the image
+        img: Image opened (and, for multi-frame images, seeked) but not yet loaded
         max_size: Maximum dimension (width or height) for the image
         
     Returns:
-        Processed image content as bytes
+        The frame as JPEG bytes, resized to fit max_size
     """
-    try:
-        img = Image.open(BytesIO(file_content))
-        
-        # Resize if image is too large
-        width, height = img.size
-        if width > max_size or height > max_size:
-            # Calculate new dimensions while preserving aspect ratio
-            if width > height:
-                new_width = max_size
-                new_height = int(height * (max_size / width))
-            else:
-                new_height = max_size
-                new_width = int(width * (max_size / height))
-                
-            img = img.resize((new_width, new_height), Image.LANCZOS)
-        
-        # Convert to RGB if needed (removes alpha channel)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-            
-        # Save to buffer
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG', quality=90)
-        buffer.seek(0)
+    width, height = img.size
+    new_width, new_height = width, height
+    if width > max_size or height > max_size:
+        # Calculate new dimensions while preserving aspect ratio
+        if width > height:
+            new_width = max_size
+            new_height = int(height * (max_size / width))
+        else:
+            new_height = max_size
+            new_width = int(width * (max_size / height))
+    
+    # Let the JPEG decoder downscale by up to 8x while decoding; the
+    # result is still at least the target size, so LANCZOS finishes it
+    img.draft('RGB', (new_width, new_height))
+    img.load()
+    
+    if img.size != (new_width, new_height):
+        img = img.resize((new_width, new_height), Image.LANCZOS)
+    
+    # Convert to RGB if needed (removes alpha channel)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+@lru_cache(maxsize=1)
+def get_image_executor() -> Executor:
+    """
+    Return the bounded pool that runs prepare_image
+    
+    A process pool by default, so decoding and resizing use every core and
+    never hold the event loop's GIL; settings.IMAGE_EXECUTOR = "thread"
+    switches to threads (Pillow releases the GIL for most of the work).
+    At most settings.IMAGE_WORKERS uploads are processed at once; the rest
+    wait in the pool's queue.
+    """
+    if settings.IMAGE_EXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image")
+    # spawn rather than fork: the server process runs threads (SQLite, metrics)
+    return ProcessPoolExecutor(
+        max_workers=settings.IMAGE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+def start_image_workers() -> None:
+    """Start the image pool's workers now instead of on the first uploads"""
+    executor = get_image_executor()
+    for _ in range(settings.IMAGE_WORKERS):
+        executor.submit(int)
+
+def dhash(file_content: bytes, hash_size: int = 8) -> int:
+    """
+    Difference hash of an image, robust to re-compression and resizing
+    
+    The image is reduced to a (hash_size + 1) x hash_size grayscale thumbnail
+    and each bit records whether a pixel is brighter than its right-hand
+    neighbour. Near-duplicates differ in only a few bits (Hamming distance).
+    Uniform borders (page margins, the desktop around a re-screenshotted
+    page) are trimmed first so they do not shift the thumbnail.
+    
+    Args:
+        file_content: Binary content of the image
+        hash_size: Bits per row and rows of the hash (8 gives a 64-bit hash)
         
-        return buffer.getvalue()
-    except Exception:
-        # If preprocessing fails, return original content
-        return file_content 
\ No newline at end of file
+    Returns:
+        The hash as an unsigned integer of hash_size * hash_size bits
+    """
+    img = Image.open(BytesIO(file_content))
+    # Let the JPEG decoder downscale while decoding; only a thumbnail is needed
+    img.draft('L', (hash_size * 32, hash_size * 32))
+    img = img.convert('L')
+    
+    # Trim rows and columns that match the corner colour; a second pass
+    # removes the page margin left inside a trimmed screenshot border
+    for _ in range(2):
+        background = img.getpixel((0, 0))
+        bbox = img.point(lambda p: 255 if abs(p - background) > 24 else 0).getbbox()
+        if not bbox or bbox == (0, 0) + img.size:
+            break
+        img = img.crop(bbox)
+    
+    pixels = list(img.resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
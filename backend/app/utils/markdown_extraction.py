@@ -0,0 +1,152 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Structured JSON as the extraction model returns it: an object or a list of records
+Structured = Union[Dict[str, Any], List[Dict[str, Any]]]
+
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*$")
+_TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$")
+_KEY_VALUE = re.compile(r"^(?:[-*+]\s+)?([^:|]{1,60}?)\s*:\s*(.+)$")
+_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_EMPHASIS = re.compile(r"(\*\*|__|\*)(.+?)\1")
+# A leading zero (other than "0" or "0.x") marks an identifier such as an account
+# number or ZIP code, which is kept as text so its zeros are not lost
+_NUMBER = re.compile(r"^-?(0|[1-9]\d{0,2}(,\d{3})+|[1-9]\d*)(\.\d+)?$")
+
+# Bump when the parser's output changes so cached results it extracted are recomputed
+LOCAL_EXTRACTION_VERSION = 2
+
+# Share of the non-blank lines that must be tables, key: value pairs or headings
+MIN_COVERAGE = 0.9
+# Key: value pairs needed when there is no table
+MIN_PAIRS = 3
+# Longest key, in words, that reads as a field name rather than a sentence
+MAX_KEY_WORDS = 6
+
+
+def parse_structured_markdown(markdown: str, min_coverage: float = MIN_COVERAGE) -> Optional[Structured]:
+    """
+    Convert OCR markdown that is plainly tables and key: value lines into structured JSON
+
+    A document that is a single table becomes a list of records keyed by the
+    header cells; otherwise key: value pairs become fields and each table a
+    list of records under its heading (or table_1, table_2, ...), with a
+    leading heading as the title. Numbers become ints or floats; everything
+    else, including digits with a leading zero (000123), is kept as text.
+
+    Returns None when the markdown is not confidently of this shape (prose,
+    ragged tables, duplicate keys, too little structure), so the caller can
+    fall back to LLM extraction.
+
+    Args:
+        markdown: OCR output in markdown
+        min_coverage: Share of non-blank lines the tables and pairs must cover
+
+    Returns:
+        The structured data, or None
+    """
+    lines = [_IMAGE.sub("", line).strip() for line in markdown.splitlines()]
+    pairs: Dict[str, Any] = {}
+    tables: List[Tuple[Optional[str], List[Dict[str, Any]]]] = []
+    headings: List[str] = []
+    heading: Optional[str] = None
+    recognized = total = 0
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line:
+            i += 1
+            continue
+
+        if line.startswith("|") and i + 1 < len(lines) and _TABLE_SEPARATOR.match(lines[i + 1]):
+            end = i + 2
+            while end < len(lines) and lines[end].startswith("|"):
+                end += 1
+            records = _table_records(_cells(line), [_cells(row) for row in lines[i + 2:end]])
+            if records is None:
+                return None
+            tables.append((heading, records))
+            heading = None
+            recognized += end - i
+            total += end - i
+            i = end
+            continue
+
+        total += 1
+        match = _HEADING.match(line)
+        if match:
+            heading = _plain(match.group(1))
+            headings.append(heading)
+            recognized += 1
+        else:
+            pair = _key_value(line)
+            if pair is not None:
+                key, value = pair
+                if key in pairs:
+                    return None
+                pairs[key] = value
+                recognized += 1
+        i += 1
+
+    if not total or recognized / total < min_coverage:
+        return None
+    if not tables and len(pairs) < MIN_PAIRS:
+        return None
+
+    if len(tables) == 1 and not pairs:
+        return tables[0][1]
+
+    result: Dict[str, Any] = {}
+    table_headings = {name for name, _ in tables if name}
+    titles = [name for name in headings if name not in table_headings]
+    if titles and "title" not in pairs:
+        result["title"] = titles[0]
+    result.update(pairs)
+    for number, (name, records) in enumerate(tables, start=1):
+        key = name if name and name not in result else f"table_{number}"
+        result[key] = records
+    return result
+
+
+def _plain(text: str) -> str:
+    """Text without markdown emphasis"""
+    return _EMPHASIS.sub(r"\2", text).strip()
+
+
+def _cells(row: str) -> List[str]:
+    return [_plain(cell) for cell in row.strip().strip("|").split("|")]
+
+
+def _table_records(header: List[str], rows: List[List[str]]) -> Optional[List[Dict[str, Any]]]:
+    """Rows as records keyed by the header, or None for an unusable table"""
+    if len(header) < 2 or not all(header) or len(set(header)) != len(header) or not rows:
+        return None
+    records = []
+    for row in rows:
+        if len(row) != len(header):
+            return None
+        records.append({key: _coerce(value) for key, value in zip(header, row)})
+    return records
+
+
+def _key_value(line: str) -> Optional[Tuple[str, Any]]:
+    match = _KEY_VALUE.match(_plain(line))
+    if match is None:
+        return None
+    key, value = match.group(1).strip(), match.group(2).strip()
+    # Not a field: times and ratios (10:30), URLs (https://...), sentences
+    if not value or value.startswith("//") or len(key.split()) > MAX_KEY_WORDS:
+        return None
+    if key[-1].isdigit() and value[0].isdigit():
+        return None
+    return key, _coerce(value)
+
+
+def _coerce(value: str) -> Any:
+    if not value:
+        return None
+    if _NUMBER.match(value):
+        number = value.replace(",", "")
+        return float(number) if "." in number else int(number)
+    return value
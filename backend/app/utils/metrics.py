@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from app.core.config import settings
+
+# Latency buckets (seconds) for requests and Mistral calls
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Finer buckets for in-process work such as image preprocessing
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the end of the response body, by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled",
+    multiprocess_mode="livesum",
+)
+MODEL_CALLS = Counter(
+    "model_calls_total",
+    "Mistral OCR and chat requests, by outcome",
+    ["kind", "model", "outcome"],
+)
+MODEL_CALL_SECONDS = Histogram(
+    "model_call_duration_seconds",
+    "Latency of Mistral OCR and chat requests",
+    ["kind", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Lookups of reusable results (OCR cache), by hit or miss (near-duplicate hits are then confirmed or rejected)",
+    ["cache", "result"],
+)
+OCR_STAGE_SECONDS = Histogram(
+    "ocr_stage_duration_seconds",
+    "Time spent in each stage of the OCR pipeline (prepare, split, ocr, local_extraction, extraction)",
+    ["stage"],
+    buckets=FAST_BUCKETS + (10, 30, 60),
+)
+EXTRACTIONS = Counter(
+    "ocr_extractions_total",
+    "Structured extractions by path: parsed locally from the OCR markdown or by the LLM",
+    ["path"],
+)
+OCR_JOB_WAIT_SECONDS = Histogram(
+    "ocr_job_wait_seconds",
+    "Time asynchronous OCR jobs spend queued before a worker starts them, by lane",
+    ["lane"],
+    buckets=LATENCY_BUCKETS + (300, 900, 3600),
+)
+OCR_JOBS = Counter(
+    "ocr_jobs_total",
+    "Asynchronous OCR jobs finished, by lane and final status",
+    ["lane", "status"],
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop runs a timer; high values mean blocking code on the loop",
+    buckets=FAST_BUCKETS,
+)
+
+
+@contextmanager
+def model_call(kind: str, model: str) -> Iterator[None]:
+    """
+    Time the enclosed Mistral request and count it by outcome
+
+    Args:
+        kind: "ocr" or "chat"
+        model: Model the request is sent to
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        MODEL_CALLS.labels(kind, model, outcome).inc()
+        MODEL_CALL_SECONDS.labels(kind, model).observe(time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing request latency and in-flight requests
+
+    Requests are labelled with the route template rather than the raw path so
+    the number of series stays bounded; requests that match no route share
+    the "unmatched" label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # the router stores the matched route in the (shared) scope
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+
+
+async def monitor_event_loop_lag(interval: float = settings.EVENT_LOOP_LAG_INTERVAL) -> None:
+    """
+    Observe event loop lag until cancelled
+
+    Sleeps for interval and records how much later than that the loop woke it
+    up. A synchronous Mistral call or image decode on the loop shows up here.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Current metrics in the Prometheus text format
+
+    With several worker processes, set PROMETHEUS_MULTIPROC_DIR to a shared
+    empty directory and every worker reports the aggregate of all of them.
+
+    Returns:
+        Tuple of (body, content type)
+    """
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
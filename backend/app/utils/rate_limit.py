@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket limiting how often an operation may start
+
+    Callers wait in arrival order; up to burst operations may start back to
+    back after an idle period. A rate of 0 or less disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Operations per second
+            burst: Operations that may start at once after an idle period
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until the next operation may start"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
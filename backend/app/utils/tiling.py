@@ -0,0 +1,180 @@
+import math
+import re
+from difflib import SequenceMatcher
+from io import BytesIO
+from typing import List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from app.core.config import settings
+from app.utils.image_utils import SUPPORTED_FORMATS, encode_frame, prepare_image
+
+# Lines compared when looking for the overlap between neighbouring tiles
+STITCH_WINDOW = 40
+# Cut-off lines at a tile edge that may be skipped to find the overlap
+STITCH_EDGE_LINES = 2
+# Matched overlaps shorter than this (in characters) are treated as chance
+STITCH_MIN_CHARS = 12
+# Share of the lines of an overlap that must match
+STITCH_MIN_MATCH = 0.6
+
+
+def prepare_image_tiles(
+    file_content: bytes,
+    max_size: int = 4000,
+    tile_height: Optional[int] = None,
+    overlap: Optional[int] = None,
+) -> Tuple[bytes, Optional[List[bytes]]]:
+    """
+    Validate an upload and, if it is too large to OCR whole, split it into strips
+
+    Images that fit within max_size are prepared as by prepare_image. Larger
+    ones are decoded once and split at full resolution into horizontal
+    strips of tile_height (overlapping by overlap pixels), so small print on
+    tall pages is not lost to downscaling. Strips always span the full
+    width, so every line of text stays within one strip; an image wider
+    than max_size is scaled down to max_size wide, and its strips are taller
+    in the original to make up for it. An image that is no taller than
+    max_size once narrowed gains no detail from strips and is not tiled.
+    CPU bound; run it through get_image_executor().
+
+    Args:
+        file_content: Binary content of the upload
+        max_size: Largest width or height sent to OCR in one request
+        tile_height: Height of a strip (default settings.OCR_TILE_HEIGHT)
+        overlap: Overlap of neighbouring tiles in pixels (default settings.OCR_TILE_OVERLAP)
+
+    Returns:
+        Tuple of (image fitted to max_size as JPEG bytes, strips as JPEG
+        bytes from top to bottom, or None if the image was not tiled)
+
+    Raises:
+        ValueError: If the upload is not a supported image or is too large
+    """
+    tile_height = tile_height or settings.OCR_TILE_HEIGHT
+    overlap = overlap or settings.OCR_TILE_OVERLAP
+    try:
+        img = Image.open(BytesIO(file_content))
+    except Exception as e:
+        raise ValueError(f"Invalid image file: {str(e)}")
+
+    width, height = img.size
+    if img.format not in SUPPORTED_FORMATS or max(width, height) <= max_size or width * height > settings.MAX_IMAGE_PIXELS:
+        # Nothing to tile; prepare_image validates and reports the errors
+        return prepare_image(file_content, max_size), None
+
+    try:
+        img.load()
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        overview = encode_frame(img.copy(), max_size)
+
+        # Side by side columns cannot be stitched back line by line, so wide
+        # images are narrowed instead; tile_height and overlap apply after scaling
+        scale = min(1.0, max_size / width)
+        if height * scale <= max_size:
+            # Square and landscape scans: the overview already has the strips' resolution
+            return overview, None
+        strip_height = round(tile_height / scale)
+        starts = _tile_starts(height, strip_height, round(overlap / scale))
+        if len(starts) == 1:
+            # One strip would be the overview again
+            return overview, None
+
+        tiles = []
+        for top in starts:
+            strip = img.crop((0, top, width, min(height, top + strip_height)))
+            if scale < 1:
+                strip = strip.resize((max_size, max(1, round(strip.height * scale))), Image.LANCZOS)
+            buffer = BytesIO()
+            strip.save(buffer, format='JPEG', quality=90)
+            tiles.append(buffer.getvalue())
+        return overview, tiles
+    except Exception as e:
+        raise ValueError(f"Invalid image file: {str(e)}")
+
+
+def _tile_starts(length: int, tile: int, overlap: int) -> List[int]:
+    """Offsets of tiles of size tile covering length with at least overlap between neighbours"""
+    if length <= tile:
+        return [0]
+    # Fewest tiles that cover length, spread evenly so every overlap is about the same
+    count = math.ceil((length - overlap) / max(1, tile - overlap))
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def stitch_markdown(pieces: Sequence[str]) -> str:
+    """
+    Join the OCR markdown of strips back into one document
+
+    Neighbouring strips overlap, so the lines at the bottom of one strip are
+    repeated at the top of the next. The alignment with the most matching
+    lines (ignoring case, spacing and small OCR differences) is kept once; up to
+    STITCH_EDGE_LINES lines cut off by a strip edge are skipped while
+    matching and dropped from the strip that only saw part of them.
+
+    Args:
+        pieces: Markdown of each strip, from top to bottom
+
+    Returns:
+        The stitched markdown
+    """
+    lines: List[str] = []
+    for piece in pieces:
+        following = piece.splitlines()
+        drop_previous, skip_following = _overlap(lines, following)
+        if drop_previous:
+            del lines[-drop_previous:]
+        lines.extend(following[skip_following:])
+    return "\n".join(lines).strip()
+
+
+def _normalize(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+
+def _same_line(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    matcher = SequenceMatcher(None, a, b)
+    return matcher.real_quick_ratio() >= 0.85 and matcher.quick_ratio() >= 0.85 and matcher.ratio() >= 0.85
+
+
+def _overlap(previous: List[str], following: List[str]) -> Tuple[int, int]:
+    """
+    Find the lines repeated at the end of previous and the start of following
+
+    Returns:
+        Tuple of (lines to drop from the end of previous, lines to skip at
+        the start of following); (0, 0) when no overlap is found
+    """
+    # Compare non-blank lines only, remembering where they are
+    prev_idx = [i for i, line in enumerate(previous) if line.strip()][-STITCH_WINDOW:]
+    next_idx = [i for i, line in enumerate(following) if line.strip()][:STITCH_WINDOW + STITCH_EDGE_LINES]
+    prev = [_normalize(previous[i]) for i in prev_idx]
+    nxt = [_normalize(following[i]) for i in next_idx]
+
+    # Score every alignment of the end of previous with the start of
+    # following by its matching lines; a badly misread line in the middle
+    # of the overlap should not hide the rest of it
+    best = None
+    for cut_prev in range(STITCH_EDGE_LINES + 1):
+        for cut_next in range(STITCH_EDGE_LINES + 1):
+            tail = prev[:len(prev) - cut_prev]
+            head = nxt[cut_next:]
+            for k in range(1, min(len(tail), len(head)) + 1):
+                same = [_same_line(a, b) for a, b in zip(tail[len(tail) - k:], head[:k])]
+                matched = sum(same)
+                if matched < STITCH_MIN_MATCH * k or not same[-1]:
+                    continue
+                if sum(len(line) for line, ok in zip(head, same) if ok) < STITCH_MIN_CHARS:
+                    continue
+                if best is None or matched > best[0]:
+                    best = (matched, k, cut_prev, cut_next)
+
+    if best is None:
+        return 0, 0
+    _, k, cut_prev, cut_next = best
+    # Drop previous's cut-off lines (and anything after them); following has them whole
+    drop_previous = len(previous) - prev_idx[len(prev_idx) - cut_prev] if cut_prev else 0
+    return drop_previous, next_idx[cut_next + k - 1] + 1
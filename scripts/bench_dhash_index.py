@@ -0,0 +1,157 @@
+# Benchmark and check of the near-duplicate (dHash) lookup in the OCR cache.
+#
+# 1. Hash robustness: renders a sample document, derives re-compressed,
+#    resized and re-screenshotted copies, the same form filled in for other
+#    customers and a different document, and prints the Hamming distance of
+#    each to the original. Same-template forms land as close as the copies,
+#    which is why a match is only reused once the OCR text is confirmed
+#    (OCRCache.confirm_similar).
+# 2. Index: fills a temporary cache database with --rows random hashes,
+#    then times OCRCache near-duplicate lookups (multi-index bands) against
+#    a full scan and exits non-zero if the two ever find different candidates.
+#
+#   python scripts/bench_dhash_index.py --rows 1000000 --queries 200 --distance 4
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+backend_path = str(Path(__file__).parent.parent / "backend")
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+from PIL import Image, ImageDraw
+
+from app.services.ocr_cache import OCRCache, dhash_bands
+from app.utils.image_utils import dhash, prepare_image
+
+SCHEMA_PATH = Path(__file__).parent.parent / "sqlite" / "vaultsense.sql"
+
+
+def render_document(lines) -> Image.Image:
+    image = Image.new("RGB", (850, 1100), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40, 40, 810, 140), outline="black", width=3)
+    for i, line in enumerate(lines):
+        draw.text((60, 60 + 40 * i), line, fill="black")
+    draw.rectangle((40, 900, 500, 1060), fill=(220, 220, 220))
+    return image
+
+
+def encode(image: Image.Image, format: str, **params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def check_robustness() -> None:
+    original = render_document(["Invoice 1042", "ACME Corp", "Service ........ 120.00", "Total 120.00"])
+    base = dhash(prepare_image(encode(original, "PNG")))
+    # a screenshot: the page shifted onto a grey canvas, slightly scaled
+    screenshot = Image.new("RGB", (900, 1160), (200, 200, 200))
+    screenshot.paste(original.resize((830, 1074)), (35, 43))
+    copies = {
+        "JPEG quality 40": encode(original, "JPEG", quality=40),
+        "resized to 60%": encode(original.resize((510, 660)), "PNG"),
+        "re-screenshotted": encode(screenshot, "PNG"),
+        "same form, customer B": encode(
+            render_document(["Invoice 1043", "Globex Ltd", "Service ........ 980.00", "Total 980.00"]), "PNG"
+        ),
+        "same form, customer C": encode(
+            render_document(["Invoice 2210", "Initech", "Service ........ 45.10", "Total 45.10"]), "PNG"
+        ),
+        "different document": encode(
+            render_document(["Receipt 77", "Corner Cafe", "Coffee ........ 3.50"]).rotate(180), "PNG"
+        ),
+    }
+    print("dHash distance to the original (64 bits)")
+    for name, content in copies.items():
+        distance = bin(base ^ dhash(prepare_image(content))).count("1")
+        print(f"  {name:22} {distance}")
+
+
+def fill(cache: OCRCache, rows: int) -> list:
+    conn = cache._connection()
+    hashes = [random.getrandbits(64) for _ in range(rows)]
+    batch = 50000
+    for start in range(0, rows, batch):
+        chunk = [(f"{start + i:064x}", value) for i, value in enumerate(hashes[start:start + batch])]
+        conn.executemany(
+            "INSERT INTO ocr_cache (image_sha256, ocr_model, extraction_model, prompt_version, ocr_markdown, structured_json) "
+            "VALUES (?, ?, ?, ?, '', '{}')",
+            [(key, cache.ocr_model, cache.extraction_model, cache.prompt_version) for key, _ in chunk],
+        )
+        conn.executemany(
+            "INSERT INTO image_dhash (image_sha256, band0, band1, band2, band3) VALUES (?, ?, ?, ?, ?)",
+            [(key, *dhash_bands(value)) for key, value in chunk],
+        )
+    conn.commit()
+    return hashes
+
+
+def full_scan(hashes: list, query: int, max_distance: int) -> list:
+    """Distances of every hash within max_distance of query, closest first"""
+    return sorted(
+        distance for distance in (bin(query ^ value).count("1") for value in hashes) if distance <= max_distance
+    )
+
+
+def main(args) -> int:
+    check_robustness()
+
+    random.seed(args.seed)
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    cache = OCRCache(str(db_path), str(SCHEMA_PATH), "ocr", "extraction", 1, near_duplicate_distance=args.distance)
+    start = time.perf_counter()
+    hashes = fill(cache, args.rows)
+    print(f"\nindexed {args.rows} hashes in {time.perf_counter() - start:.1f} s")
+
+    # half the queries are near-duplicates of stored hashes, half are unrelated
+    queries = []
+    for i in range(args.queries):
+        if i % 2 == 0:
+            query = random.choice(hashes)
+            for bit in random.sample(range(64), random.randint(0, args.distance)):
+                query ^= 1 << bit
+        else:
+            query = random.getrandbits(64)
+        queries.append(query)
+
+    index_seconds = []
+    mismatches = 0
+    for query in queries:
+        start = time.perf_counter()
+        matches = cache._find_similar(query)
+        index_seconds.append(time.perf_counter() - start)
+        if args.verify and [distance for distance, _ in matches] != full_scan(hashes, query, args.distance):
+            mismatches += 1
+
+    scan_queries = queries[: max(1, args.queries // 20)]
+    start = time.perf_counter()
+    for query in scan_queries:
+        full_scan(hashes, query, args.distance)
+    scan_mean = (time.perf_counter() - start) / len(scan_queries)
+
+    index_seconds.sort()
+    print(f"multi-index lookup  mean {sum(index_seconds) / len(index_seconds) * 1000:.2f} ms  "
+          f"p95 {index_seconds[int(0.95 * len(index_seconds))] * 1000:.2f} ms")
+    print(f"full scan           mean {scan_mean * 1000:.2f} ms")
+    if args.verify:
+        print(f"mismatches against the full scan: {mismatches} of {len(queries)}")
+    cache.close()
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the near-duplicate image lookup")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--distance", type=int, default=4, help="Maximum Hamming distance of a match")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-verify", dest="verify", action="store_false", help="Skip the full-scan comparison")
+    sys.exit(main(parser.parse_args()))
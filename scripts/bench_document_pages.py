@@ -0,0 +1,71 @@
+# Time to first page of the document endpoint as documents get longer.
+#
+# Uploads generated PDFs (or TIFFs) of increasing page count to
+# /api/v1/ocr/process-document and reports, for each, when the first NDJSON
+# page result arrived, the total time and the failures. With pages
+# processed in parallel and streamed as they complete, time to first page
+# should stay flat while the total grows with page count / concurrency.
+#
+# See scripts/mistral_standin.py for running the backend against a local
+# stand-in of the Mistral API (use OCR_CACHE_ENABLED=false so repeated runs
+# are not answered from the cache).
+#
+#   python scripts/bench_document_pages.py --url http://127.0.0.1:8001 --pages 1 10 50 100
+
+import argparse
+import io
+import json
+import time
+
+import httpx
+from PIL import Image, ImageDraw
+
+DOCUMENT_PATH = "/api/v1/ocr/process-document"
+MIME_TYPES = {"PDF": "application/pdf", "TIFF": "image/tiff"}
+
+
+def sample_document(page_count: int, format: str) -> bytes:
+    pages = []
+    for number in range(1, page_count + 1):
+        image = Image.new("RGB", (850, 1100), "white")
+        draw = ImageDraw.Draw(image)
+        draw.text((50, 50), f"Statement page {number} of {page_count}", fill="black")
+        draw.text((50, 100), f"Balance ........ {number * 100}.00", fill="black")
+        pages.append(image)
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format=format, save_all=True, append_images=pages[1:])
+    return buffer.getvalue()
+
+
+def upload(client: httpx.Client, page_count: int, format: str) -> None:
+    document = sample_document(page_count, format)
+    start = time.perf_counter()
+    first = None
+    summary = {}
+    files = {"file": (f"sample.{format.lower()}", document, MIME_TYPES[format])}
+    with client.stream("POST", DOCUMENT_PATH, files=files) as response:
+        if response.status_code != 200:
+            response.read()
+            print(f"{page_count:5} pages  HTTP {response.status_code} {response.text[:200]}")
+            return
+        for line in response.iter_lines():
+            if first is None:
+                first = time.perf_counter() - start
+            summary = json.loads(line)
+    total = time.perf_counter() - start
+    print(f"{page_count:5} pages  first page {first:6.2f} s  total {total:7.2f} s  failed {summary.get('failed')}")
+
+
+def main(args) -> None:
+    with httpx.Client(base_url=args.url, timeout=args.timeout) as client:
+        for page_count in args.pages:
+            upload(client, page_count, args.format)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure time to first page of the document endpoint")
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--format", choices=list(MIME_TYPES), default="PDF")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    main(parser.parse_args())
@@ -0,0 +1,185 @@
+# Benchmark of upload preprocessing: the former validate_image +
+# preprocess_image (two decodes, full-size LANCZOS resize; kept below as the
+# baseline) against prepare_image (one decode, JPEG draft mode, pass-through
+# of JPEGs that already fit).
+#
+# Renders a set of typical uploads and reports uploads/s on one core for each
+# and for the whole mix; with --workers it also pushes the mix through the
+# image pool (get_image_executor) to show how throughput scales with cores.
+#
+#   python scripts/bench_image_prep.py --rounds 5 --workers 4 --executor process
+
+import argparse
+import io
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Tuple
+
+backend_path = str(Path(__file__).parent.parent / "backend")
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from app.utils.image_utils import SUPPORTED_FORMATS
+
+
+def render(size, format: str, **params) -> bytes:
+    """A page-like image: text lines and boxes over a noisy, shaded background"""
+    width, height = size
+    noise = Image.effect_noise((width // 4, height // 4), 40).resize(size).filter(ImageFilter.GaussianBlur(2))
+    image = Image.merge("RGB", (noise, noise.point(lambda p: p * 0.9), noise.point(lambda p: p * 0.8)))
+    draw = ImageDraw.Draw(image)
+    for y in range(height // 10, height - height // 10, max(12, height // 60)):
+        draw.rectangle((width // 10, y, width - width // 10, y + max(4, height // 200)), fill=(30, 30, 30))
+    if format == "PNG" and params.pop("alpha", False):
+        image = image.convert("RGBA")
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+SAMPLES = {
+    "phone photo JPEG 4032x3024": lambda: render((4032, 3024), "JPEG", quality=90),
+    "48MP phone photo JPEG 8064x6048": lambda: render((8064, 6048), "JPEG", quality=90),
+    "scan JPEG 5100x6600": lambda: render((5100, 6600), "JPEG", quality=85),
+    "screenshot PNG 2560x1440": lambda: render((2560, 1440), "PNG", alpha=True),
+    "receipt JPEG 1200x2400": lambda: render((1200, 2400), "JPEG", quality=85),
+}
+
+
+# The upload path before prepare_image, kept here as the baseline
+def validate_image(file_content: bytes) -> Tuple[bool, str]:
+    """
+    Validate if the file is a supported image type
+
+    Args:
+        file_content: Binary content of the file
+
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    try:
+        # Try to open the image with PIL
+        img = Image.open(io.BytesIO(file_content))
+        img.verify()  # Verify it's an image
+
+        # Check supported formats
+        if img.format not in SUPPORTED_FORMATS:
+            return False, f"Unsupported image format: {img.format}"
+
+        return True, ""
+    except Exception as e:
+        return False, f"Invalid image file: {str(e)}"
+
+
+def preprocess_image(file_content: bytes, max_size: int = 4000) -> bytes:
+    """
+    Preprocess image if needed (resize, format conversion, etc.)
+
+    Args:
+        file_content: Binary content of the image
+        max_size: Maximum dimension (width or height) for the image
+
+    Returns:
+        Processed image content as bytes
+    """
+    try:
+        img = Image.open(io.BytesIO(file_content))
+
+        # Resize if image is too large
+        width, height = img.size
+        if width > max_size or height > max_size:
+            # Calculate new dimensions while preserving aspect ratio
+            if width > height:
+                new_width = max_size
+                new_height = int(height * (max_size / width))
+            else:
+                new_height = max_size
+                new_width = int(width * (max_size / height))
+
+            img = img.resize((new_width, new_height), Image.LANCZOS)
+
+        # Convert to RGB if needed (removes alpha channel)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # Save to buffer
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=90)
+        buffer.seek(0)
+
+        return buffer.getvalue()
+    except Exception:
+        # If preprocessing fails, return original content
+        return file_content
+
+
+def before(content: bytes) -> bytes:
+    is_valid, error_message = validate_image(content)
+    if not is_valid:
+        raise ValueError(error_message)
+    return preprocess_image(content)
+
+
+def after(content: bytes) -> bytes:
+    from app.utils.image_utils import prepare_image
+
+    return prepare_image(content)
+
+
+def per_core(function, samples, rounds: int):
+    rates = {}
+    total = 0.0
+    for name, content in samples.items():
+        function(content)  # warm up
+        start = time.perf_counter()
+        for _ in range(rounds):
+            function(content)
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        rates[name] = rounds / elapsed
+    rates["mix"] = rounds * len(samples) / total
+    return rates
+
+
+def pooled(samples, rounds: int) -> float:
+    from app.utils.image_utils import get_image_executor, prepare_image
+
+    executor = get_image_executor()
+    uploads = list(samples.values()) * rounds
+    list(executor.map(prepare_image, list(samples.values())))  # start the workers
+    start = time.perf_counter()
+    list(executor.map(prepare_image, uploads))
+    rate = len(uploads) / (time.perf_counter() - start)
+    executor.shutdown()
+    return rate
+
+
+def main(args) -> None:
+    samples = {name: make() for name, make in SAMPLES.items()}
+    old = per_core(before, samples, args.rounds)
+    new = per_core(after, samples, args.rounds)
+
+    print(f"{'uploads/s on one core':37} {'before':>8} {'after':>8} {'speedup':>8}")
+    for name in list(samples) + ["mix"]:
+        print(f"  {name:35} {old[name]:8.2f} {new[name]:8.2f} {new[name] / old[name]:7.1f}x")
+
+    if args.workers:
+        from app.core.config import settings
+
+        settings.IMAGE_WORKERS = args.workers
+        settings.IMAGE_EXECUTOR = args.executor
+        rate = pooled(samples, args.rounds)
+        print(f"\nprepare_image through a {settings.IMAGE_EXECUTOR} pool of {args.workers} "
+              f"({os.cpu_count()} cores): {rate:.2f} uploads/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark upload preprocessing")
+    parser.add_argument("--rounds", type=int, default=5, help="Runs of each sample")
+    parser.add_argument("--workers", type=int, default=0, help="Also measure the image pool with this many workers")
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    main(parser.parse_args())
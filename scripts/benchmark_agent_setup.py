@@ -0,0 +1,74 @@
+# Measure the per-request setup cost of the supervisor graph.
+#
+# Compares building a fresh SupervisorAgent for every request (the old /chat
+# behaviour) with reusing the process-wide agent compiled at startup.
+#
+# Construction makes no network calls, so no services are needed: the
+# Milvus connection opened at import time is replaced by a placeholder and
+# the document tools missing from this tree by stand-ins
+# (see document_tool_stubs.py).
+#
+#   python scripts/benchmark_agent_setup.py --iterations 50
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ai_path = str(Path(__file__).parent.parent / "ai")
+if ai_path not in sys.path:
+    sys.path.append(ai_path)
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("OPENAI_MODEL_NAME", "gpt-4o-mini")
+os.environ.setdefault("OPENAI_EMBEDDING_MODEL_NAME", "text-embedding-3-small")
+
+from document_tool_stubs import install_document_tool_stubs
+from src.memory.vectordb import VECTOR_STORE_CONNECTIONS, VectorStoreConnection
+
+install_document_tool_stubs()
+VECTOR_STORE_CONNECTIONS.append(VectorStoreConnection(customer="default", client=object()))
+
+from src.agents.document import get_document_agent
+from src.agents.supervisor import SupervisorAgent, get_supervisor_agent, warm_up
+from src.llm.runner import get_openai
+
+
+def time_ms(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def per_request_build():
+    # Drop the shared instances so every call pays the full construction cost
+    get_openai.cache_clear()
+    get_document_agent.cache_clear()
+    SupervisorAgent()
+
+
+def report(label, samples):
+    print(
+        f"{label:<28} mean={statistics.mean(samples):8.3f} ms  "
+        f"p50={statistics.median(samples):8.3f} ms  max={max(samples):8.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark supervisor graph setup per request")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    report("SupervisorAgent() per request", time_ms(per_request_build, args.iterations))
+
+    start = time.perf_counter()
+    warm_up()
+    print(f"{'startup warm-up':<28} once={((time.perf_counter() - start) * 1000):8.3f} ms")
+
+    report("shared compiled agent", time_ms(get_supervisor_agent, args.iterations))
@@ -0,0 +1,72 @@
+# Compare the per-token overhead and CPU cost of the two /chat stream modes.
+#
+# The LLM is replaced by a fake chat model that emits a fixed number of
+# tokens with no delay, and the embeddings endpoint, Milvus and long-term
+# memory by in-process stubs (see chat_fakes.py), so the numbers measure
+# graph/event plumbing and framing only.
+#
+#   python scripts/benchmark_chat_stream.py --requests 50 --tokens 500
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+import chat_fakes
+
+
+class StubMemory:
+    async def get_similar_questions(self, question, **kwargs):
+        return []
+
+    async def save_question_answer(self, **kwargs):
+        return kwargs.get("response_id", "")
+
+
+def install_fakes(tokens: int):
+    chat_fakes.install_fakes(" ".join(f"tok{i}" for i in range(tokens)))
+
+    import src.tools.supervisor as supervisor_tools
+    supervisor_tools.ltm = StubMemory()
+
+
+async def run_mode(client: httpx.AsyncClient, mode: str, requests: int):
+    wall = cpu = 0.0
+    for i in range(requests):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        async with client.stream(
+            "POST", "/chat", json={"question": f"benchmark question {i}", "stream_mode": mode}
+        ) as response:
+            async for _ in response.aiter_bytes():
+                pass
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+    return wall, cpu
+
+
+async def main(args):
+    install_fakes(args.tokens)
+    from src.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            # warm both paths once
+            for mode in ("events", "messages"):
+                await run_mode(client, mode, 1)
+            for mode in ("events", "messages"):
+                wall, cpu = await run_mode(client, mode, args.requests)
+                per_request_ms = cpu / args.requests * 1000
+                per_token_us = cpu / (args.requests * args.tokens) * 1e6
+                print(
+                    f"{mode:<9} wall/request={wall / args.requests * 1000:8.2f} ms  "
+                    f"cpu/request={per_request_ms:8.2f} ms  cpu/token={per_token_us:7.2f} us"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /chat stream modes")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=300)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+# Compare the caller-side cost of a log call with a synchronous StreamHandler
+# (the previous setup) and with the queue-based logger from src.utils.logger.
+#
+# Output goes to a sink that sleeps for --sink-latency-us per write, standing
+# in for a terminal, pipe or container log driver that is slower than
+# /dev/null. With --sink-latency-us 0 only the CPU work on the calling thread
+# is compared.
+#
+#   python scripts/benchmark_logging.py --records 20000 --sink-latency-us 50
+
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+ai_path = str(Path(__file__).parent.parent / "ai")
+if ai_path not in sys.path:
+    sys.path.append(ai_path)
+
+os.environ["LOG_LEVEL"] = "DEBUG"
+os.environ.setdefault("LOG_RATE_LIMIT", "0")
+# large enough that no record is dropped during the run
+os.environ.setdefault("LOG_QUEUE_SIZE", "1000000")
+
+from src.utils.logger import setup_logger
+
+STATE = {
+    "task": {"original": "Which invoices from March are still unpaid?", "thread_id": "t-1"},
+    "plan": "1. Search documents\n2. Filter invoices\n3. Summarise" * 5,
+    "memories": [{"question": f"q{i}", "answer": "a" * 200} for i in range(5)],
+}
+
+
+class SlowSink:
+    def __init__(self, latency_us: float):
+        self.latency = latency_us / 1e6
+        self.devnull = open(os.devnull, "w")
+
+    def write(self, text: str) -> int:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.devnull.write(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def time_calls(fn, records: int) -> float:
+    start = time.perf_counter()
+    for i in range(records):
+        fn(i)
+    return (time.perf_counter() - start) / records * 1e6
+
+
+def main(args):
+    sink = SlowSink(args.sink_latency_us)
+
+    sync_logger = logging.getLogger("benchmark.sync")
+    sync_logger.setLevel(logging.DEBUG)
+    sync_logger.propagate = False
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter("%(levelname)-8s %(name)s:%(lineno)d - %(message)s"))
+    sync_logger.addHandler(handler)
+
+    # the queue logger's writer thread writes to stderr; point it at the sink
+    sys.stderr = sink
+    queue_logger = setup_logger("benchmark.queue")
+
+    results = {
+        "sync handler, f-string of state": time_calls(
+            lambda i: sync_logger.debug(f"Generating final response: {STATE}"), args.records),
+        "sync handler, %-style keys": time_calls(
+            lambda i: sync_logger.debug("Generating final response with state keys: %s", list(STATE)), args.records),
+        "queue handler, f-string of state": time_calls(
+            lambda i: queue_logger.debug(f"Generating final response: {STATE}"), args.records),
+        "queue handler, %-style keys": time_calls(
+            lambda i: queue_logger.debug("Generating final response with state keys: %s", list(STATE)), args.records),
+    }
+    sys.stderr = sys.__stderr__
+    for name, per_call_us in results.items():
+        print(f"{name:<36} {per_call_us:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark caller-side logging cost")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--sink-latency-us", type=float, default=50.0)
+    main(parser.parse_args())
@@ -0,0 +1,68 @@
+# In-process fakes of the chat service's external dependencies, for the ai/
+# checks and benchmarks in this directory.
+#
+# install_fakes() replaces the LLM with a fake chat model that answers every
+# call with the same message, the embeddings endpoint with a client returning
+# zero vectors and Milvus with a client that finds nothing, and installs the
+# document tool stand-ins (see document_tool_stubs.py). Importing this module
+# puts ai/ on sys.path and sets the environment the settings need; set any
+# other variables before importing it, and call install_fakes() before
+# importing src.agents or src.main.
+
+import itertools
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+ai_path = str(Path(__file__).parent.parent / "ai")
+if ai_path not in sys.path:
+    sys.path.append(ai_path)
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+os.environ.setdefault("OPENAI_MODEL_NAME", "gpt-4o-mini")
+os.environ.setdefault("OPENAI_EMBEDDING_MODEL_NAME", "text-embedding-3-small")
+os.environ.setdefault("CHAT_THREAD_DB_PATH", os.path.join(tempfile.mkdtemp(), "threads.db"))
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+import src.llm.embed as embed
+import src.llm.runner as runner
+from src.llm.openai import OpenAI
+from src.memory.vectordb import ASYNC_VECTOR_STORE_CONNECTIONS, VECTOR_STORE_CONNECTIONS, VectorStoreConnection
+
+from document_tool_stubs import install_document_tool_stubs
+
+
+class FakeChatModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+class FakeEmbeddingsClient:
+    async def create(self, input, **kwargs):
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[0.0] * 768) for i in range(len(input))
+        ])
+
+
+class FakeAsyncMilvus:
+    async def search(self, data, **kwargs):
+        return [[] for _ in data]
+
+    async def insert(self, **kwargs):
+        return {}
+
+
+def install_fakes(answer: str = "generate_answer") -> None:
+    """Replace the LLM (answering every call with answer), the embeddings client and Milvus"""
+    install_document_tool_stubs()
+    fake = OpenAI.__new__(OpenAI)
+    fake.llm = FakeChatModel(messages=itertools.cycle([AIMessage(content=answer)]))
+    runner.get_openai = lambda model_id=None: fake
+    embed.openai_embeddings.async_client = FakeEmbeddingsClient()
+    VECTOR_STORE_CONNECTIONS.append(VectorStoreConnection(customer="default", client=FakeAsyncMilvus()))
+    ASYNC_VECTOR_STORE_CONNECTIONS["default"] = FakeAsyncMilvus()
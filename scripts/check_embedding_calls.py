@@ -0,0 +1,50 @@
+# Regression check: a chat request must embed its question exactly once.
+#
+# Runs /chat (stateless and as two turns of a thread) and /chat/batch against
+# the app with the LLM, the embeddings endpoint and Milvus replaced by
+# in-process fakes (see chat_fakes.py), counts the embedding requests each
+# one makes and exits non-zero if any request makes more than one.
+#
+#   python scripts/check_embedding_calls.py
+
+import asyncio
+import sys
+
+import httpx
+
+from chat_fakes import install_fakes
+from src.llm.embed import track_embedding_calls
+
+
+async def count_calls(client: httpx.AsyncClient, path: str, payload: dict) -> int:
+    with track_embedding_calls() as calls:
+        async with client.stream("POST", path, json=payload) as response:
+            async for _ in response.aiter_bytes():
+                pass
+    return calls.calls
+
+
+async def main() -> int:
+    install_fakes()
+    from src.main import app
+
+    checks = [
+        ("stateless question", "/chat", {"question": "Which invoices are overdue?", "stream_mode": "messages"}),
+        ("first turn of a thread", "/chat", {"question": "Which invoices are overdue?", "thread_id": "check"}),
+        ("follow-up turn", "/chat", {"question": "And the largest one?", "thread_id": "check"}),
+        ("batch of three", "/chat/batch", {"questions": ["one", "two", "three"]}),
+    ]
+    failed = False
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            for name, path, payload in checks:
+                calls = await count_calls(client, path, payload)
+                status = "ok" if calls == 1 else "FAIL"
+                failed = failed or calls != 1
+                print(f"{status:<4} {name}: {calls} embedding call(s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,137 @@
+# Share of documents the local markdown parser extracts without the model,
+# and how well it agrees with the model where both ran.
+#
+# Reads the OCR markdown and the model's structured JSON of every entry in
+# the OCR cache (SQLITE_DB_PATH), runs parse_structured_markdown on the
+# markdown and reports the fraction it accepts. For accepted documents the
+# values it extracted are compared with the values in the model's JSON
+# (numbers and text, ignoring keys, case and spacing); a low agreement means
+# the parser accepts documents it should leave to the model. Entries cached
+# while local extraction was enabled may hold the parser's own output, so
+# run this against a cache filled with LOCAL_EXTRACTION_ENABLED=false. The
+# cache report is skipped when the database does not exist yet.
+#
+# Before that, a few fixed documents are parsed and compared with their
+# expected JSON; the script exits non-zero if any of them differs.
+#
+# Markdown files can be checked instead of the cache (fast path fraction only):
+#
+#   python scripts/check_local_extraction.py
+#   python scripts/check_local_extraction.py --markdown pages/*.md
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+backend_path = str(Path(__file__).parent.parent / "backend")
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+from app.core.config import settings
+from app.utils.markdown_extraction import parse_structured_markdown
+
+
+# (markdown, expected parse_structured_markdown output)
+REGRESSION_CASES = [
+    (
+        "# Account\n\nCustomer ID: 000123\nZIP: 02134\nPhone: 0012345678\nBalance: 1,250.50\n"
+        "Rate: 0.25\nOpen items: 0\n",
+        {
+            "title": "Account",
+            "Customer ID": "000123",
+            "ZIP": "02134",
+            "Phone": "0012345678",
+            "Balance": 1250.5,
+            "Rate": 0.25,
+            "Open items": 0,
+        },
+    ),
+    (
+        "| Item | Code | Qty |\n| --- | --- | --- |\n| Widget | 00417 | 2 |\n| Gadget | 10417 | 10 |\n",
+        [
+            {"Item": "Widget", "Code": "00417", "Qty": 2},
+            {"Item": "Gadget", "Code": 10417, "Qty": 10},
+        ],
+    ),
+]
+
+
+def check_regression_cases() -> bool:
+    ok = True
+    for markdown, expected in REGRESSION_CASES:
+        structured = parse_structured_markdown(markdown)
+        if structured != expected:
+            ok = False
+            print(f"FAIL {markdown.splitlines()[0]!r}: expected {expected}, got {structured}")
+    print(f"{len(REGRESSION_CASES)} regression cases: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def leaf_values(data) -> set:
+    """Scalar values of a JSON document, normalized for comparison"""
+    if isinstance(data, dict):
+        return set().union(*(leaf_values(value) for value in data.values()))
+    if isinstance(data, list):
+        return set().union(*(leaf_values(value) for value in data))
+    if data is None or data == "":
+        return set()
+    if isinstance(data, (int, float)) and not isinstance(data, bool):
+        return {repr(float(data))}
+    text = re.sub(r"\s+", " ", str(data)).strip().lower()
+    try:
+        return {repr(float(text.replace(",", "")))}
+    except ValueError:
+        return {text}
+
+
+def cached_documents(db_path: str):
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        for markdown, structured_json in conn.execute("SELECT ocr_markdown, structured_json FROM ocr_cache"):
+            yield markdown, json.loads(structured_json)
+
+
+def main(args) -> int:
+    if not check_regression_cases():
+        return 1
+
+    if args.markdown:
+        documents = ((Path(path).read_text(), None) for path in args.markdown)
+    elif not Path(args.db).is_file():
+        print(f"No OCR cache at {args.db}; skipping the cache report (pass --db or --markdown)")
+        return 0
+    else:
+        documents = cached_documents(args.db)
+
+    total = local = 0
+    agreement = []
+    for markdown, llm_json in documents:
+        total += 1
+        structured = parse_structured_markdown(markdown)
+        if structured is None:
+            continue
+        local += 1
+        if llm_json is not None:
+            values = leaf_values(structured)
+            if values:
+                agreement.append(len(values & leaf_values(llm_json)) / len(values))
+
+    if not total:
+        print("No documents found")
+        return 0
+    print(f"{local} of {total} documents ({local / total:.0%}) take the local extraction path")
+    if agreement:
+        print(
+            f"Values also found in the model's JSON: {sum(agreement) / len(agreement):.0%} on average, "
+            f"{sum(share == 1 for share in agreement)} of {len(agreement)} documents fully"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the local structured extraction fast path")
+    parser.add_argument("--db", default=settings.SQLITE_DB_PATH, help="SQLite database with the OCR cache")
+    parser.add_argument("--markdown", nargs="*", help="Markdown files to check instead of the cache")
+    sys.exit(main(parser.parse_args()))
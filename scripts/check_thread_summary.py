@@ -0,0 +1,81 @@
+# Regression check: turns of a chat thread must reach the rolling summary
+# before they leave the thread history.
+#
+# Runs a thread of several /chat turns against the app with the LLM, the
+# embeddings endpoint and Milvus replaced by in-process fakes (see
+# chat_fakes.py), and with small windows: 2 recent turns kept
+# verbatim, 3 folded turns kept in the history. The summarization call fails
+# for some turns. After every turn the check waits for the background summary
+# update and exits non-zero if a turn is neither in the history nor folded
+# into the summary, or if a successful update leaves folded turns beyond
+# CHAT_THREAD_MAX_TURNS in the history.
+#
+#   python scripts/check_thread_summary.py --turns 8 --fail-after 4,5,6
+
+import argparse
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("CHAT_SUMMARY_RECENT_TURNS", "2")
+os.environ.setdefault("CHAT_THREAD_MAX_TURNS", "3")
+
+import httpx
+
+from chat_fakes import install_fakes
+
+
+async def main(args) -> int:
+    install_fakes()
+    from src.main import app
+    import src.memory.summary as summary
+    from src.agents.supervisor import get_supervisor_agent
+    from src.memory.checkpoint import THREAD_MAX_TURNS, get_thread_store
+
+    fail_after = {int(turn) for turn in args.fail_after.split(",") if turn}
+    current = {"turn": 0}
+    summarize_turns = summary.summarize_turns
+
+    async def flaky_summarize_turns(text, turns):
+        if current["turn"] in fail_after:
+            return None
+        return await summarize_turns(text, turns)
+
+    summary.summarize_turns = flaky_summarize_turns
+
+    thread_id = "check-summary"
+    config = {"configurable": {"thread_id": thread_id}}
+    failed = False
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            for turn in range(1, args.turns + 1):
+                current["turn"] = turn
+                payload = {"question": f"question {turn}", "thread_id": thread_id, "stream_mode": "messages"}
+                async with client.stream("POST", "/chat", json=payload) as response:
+                    async for _ in response.aiter_bytes():
+                        pass
+                # the summary update runs as the next turn of the thread
+                async with get_thread_store().turn(thread_id):
+                    pass
+
+                state = (await get_supervisor_agent().threaded_app.aget_state(config)).values
+                through = state.get("summary_through") or 0
+                kept = [entry.get("turn") for entry in state.get("history") or []]
+                lost = [n for n in range(through + 1, turn + 1) if n not in kept]
+                # a successful update prunes the folded turns beyond THREAD_MAX_TURNS
+                too_long = turn not in fail_after and len(kept) > max(THREAD_MAX_TURNS, turn - through)
+                status = "FAIL" if lost or too_long else "ok"
+                failed = failed or status == "FAIL"
+                note = " (summary failed)" if turn in fail_after else ""
+                print(f"{status:<4} turn {turn}: summary through {through}, history {kept}{note}")
+                if lost:
+                    print(f"     turns {lost} were dropped before they were summarized")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that thread turns are summarized before they are dropped")
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--fail-after", default="4,5,6", help="Turns after which the summary update fails")
+    sys.exit(asyncio.run(main(parser.parse_args())))
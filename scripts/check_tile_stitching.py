@@ -0,0 +1,156 @@
+# Regression check: stitching the markdown of overlapping OCR tiles must keep
+# every line of the page exactly once.
+#
+# Simulates OCR of a tall page split the way prepare_image_tiles splits it:
+# each strip "reads" the lines that lie inside it, with a few character
+# errors, and a line cut by the strip's edge is read as a garbled fragment
+# or missed. The stitched markdown is compared with the page's lines and the
+# script exits non-zero if any line is lost or duplicated. It also checks
+# which image shapes prepare_image_tiles splits: only images taller than
+# max_size once narrowed to max_size wide are worth more than one OCR call.
+#
+#   python scripts/check_tile_stitching.py --pages 200
+
+import argparse
+import random
+import re
+import sys
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+backend_path = str(Path(__file__).parent.parent / "backend")
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+from app.utils.tiling import _normalize, _tile_starts, prepare_image_tiles, stitch_markdown
+
+LINE_HEIGHT = 48
+# (width, height) of a scan and whether prepare_image_tiles should split it
+SHAPES = [
+    ((3000, 3900), False),
+    ((7000, 7000), False),
+    ((8000, 5000), False),
+    ((6000, 4500), False),
+    ((9000, 4000), False),
+    ((3000, 9000), True),
+    ((6000, 7000), True),
+]
+WORDS = "invoice total amount service tax due date account balance payment widget item qty unit price".split()
+
+
+def sample_page(rng: random.Random, line_count: int):
+    """Lines of a page with their vertical extent; some are blank or table rows"""
+    lines, y = [], 100
+    for number in range(1, line_count + 1):
+        if rng.random() < 0.1:
+            text = ""
+        elif rng.random() < 0.2:
+            text = f"| {rng.choice(WORDS)} {number} | {rng.randint(1, 999)}.{rng.randint(0, 99):02d} |"
+        else:
+            text = f"{number}. " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))
+        lines.append((text, y, y + LINE_HEIGHT - 12))
+        y += LINE_HEIGHT
+    return lines, y + 100
+
+
+def misread(rng: random.Random, text: str, rate: float) -> str:
+    # letters only, so each line's number stays its first number
+    return "".join(rng.choice("ilo") if c.isalpha() and rng.random() < rate else c for c in text)
+
+
+def ocr_strip(rng: random.Random, lines, top: int, bottom: int) -> str:
+    read = []
+    for text, y0, y1 in lines:
+        if y0 >= top and y1 <= bottom:
+            read.append(misread(rng, text, 0.02))
+        elif y0 < bottom and y1 > top and text and rng.random() < 0.7:
+            # cut by the edge: a fragment of the line
+            half = len(text) // 2
+            read.append(misread(rng, text[:half] if y0 < top else text[half:], 0.3))
+    return "\n".join(read)
+
+
+def similarity(a: str, b: str) -> float:
+    """1 - edit distance / length of the longer string
+
+    difflib's ratio() is not used here: its greedy block matching scores a
+    line of repeated words with a few misread letters as low as 0.47 against
+    the original, which counted such lines as lost.
+    """
+    if not a or not b:
+        return float(a == b)
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return 1 - previous[-1] / max(len(a), len(b))
+
+
+def check(rng: random.Random, tile_height: int, overlap: int) -> tuple:
+    lines, height = sample_page(rng, rng.randint(60, 300))
+    strips = [ocr_strip(rng, lines, top, top + tile_height) for top in _tile_starts(height, tile_height, overlap)]
+    stitched = [_normalize(line) for line in stitch_markdown(strips).splitlines() if line.strip()]
+    expected = [_normalize(text) for text, _, _ in lines if text]
+
+    # Every line of the page carries its number; find each one's copies among the stitched lines
+    by_number = {}
+    for line in stitched:
+        match = re.search(r"\d+", line)
+        if match:
+            by_number.setdefault(match.group(), []).append(line)
+    missing = duplicated = 0
+    for text in expected:
+        # looser than the stitcher's own matching: a misread line still counts as present
+        copies = [
+            line for line in by_number.get(re.search(r"\d+", text).group(), [])
+            if similarity(text, line) >= 0.7
+        ]
+        missing += not copies
+        duplicated += max(0, len(copies) - 1)
+    extra = max(0, len(stitched) - len(expected) + missing - duplicated)
+    return missing, duplicated, extra, len(strips)
+
+
+def check_shapes(tile_height: int, overlap: int) -> int:
+    """Number of SHAPES that prepare_image_tiles tiles (or does not) against expectation"""
+    wrong = 0
+    for (width, height), tiled in SHAPES:
+        buffer = BytesIO()
+        Image.new("L", (width, height), 255).save(buffer, format="PNG")
+        overview, tiles = prepare_image_tiles(buffer.getvalue(), tile_height=tile_height, overlap=overlap)
+        ok = (tiles is not None) == tiled
+        wrong += not ok
+        size = Image.open(BytesIO(overview)).size
+        strips = f"{len(tiles)} strips" if tiles else "not tiled"
+        print(f"{'ok' if ok else 'FAIL':<4} {width}x{height}: overview {size[0]}x{size[1]}, {strips}")
+    return wrong
+
+
+def main(args) -> int:
+    wrong_shapes = check_shapes(args.tile_height, args.overlap)
+    rng = random.Random(args.seed)
+    totals = {"missing": 0, "duplicated": 0, "fragments": 0, "tiles": 0}
+    for _ in range(args.pages):
+        missing, duplicated, extra, tiles = check(rng, args.tile_height, args.overlap)
+        totals["missing"] += missing
+        totals["duplicated"] += duplicated
+        totals["fragments"] += extra
+        totals["tiles"] += tiles
+    print(
+        f"{args.pages} pages, {totals['tiles']} strips: {totals['missing']} lines lost, "
+        f"{totals['duplicated']} duplicated, {totals['fragments']} leftover edge fragments"
+    )
+    return 1 if totals["missing"] or totals["duplicated"] or wrong_shapes else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check overlap de-duplication of tiled OCR")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--tile-height", type=int, default=2000)
+    parser.add_argument("--overlap", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(main(parser.parse_args()))
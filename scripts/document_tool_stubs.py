@@ -0,0 +1,46 @@
+# Stand-ins for the document agent's tools, for the ai/ checks and
+# benchmarks in this directory.
+#
+# ai/src/agents/document.py imports ten tools from src.tools.document, which
+# is empty in this tree, so importing the agents (or src.main) fails.
+# install_document_tool_stubs() adds a stand-in for every tool the module
+# does not define; each one answers with an error as the document data.
+# Call it after putting ai/ on sys.path and before importing src.agents.
+
+import importlib
+import sys
+import types
+from typing import Any, Dict
+
+TOOL_NAMES = (
+    "create_document",
+    "update_document",
+    "assign_document",
+    "fetch_documents",
+    "analyze_documents",
+    "search_documents",
+    "comment_on_document",
+    "delete_document",
+    "store_document_in_milvus",
+    "search_document_in_milvus",
+)
+
+
+def _stub(name: str):
+    def tool(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {"document_data": {"error": f"{name} is not available in this tree"}}
+
+    tool.__name__ = name
+    tool.__doc__ = f"Stand-in for the {name} document tool."
+    return tool
+
+
+def install_document_tool_stubs() -> None:
+    try:
+        module = importlib.import_module("src.tools.document")
+    except ImportError:
+        module = types.ModuleType("src.tools.document")
+        sys.modules["src.tools.document"] = module
+    for name in TOOL_NAMES:
+        if not hasattr(module, name):
+            setattr(module, name, _stub(name))
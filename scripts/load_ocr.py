@@ -0,0 +1,74 @@
+# Concurrent uploads against the OCR endpoint.
+#
+# Sends --requests image uploads with at most --concurrency in flight and
+# reports the wall time, throughput and per-request latency percentiles.
+# Compare with a run at --concurrency 1: when the server overlaps requests,
+# throughput grows with concurrency; when a blocked event loop serializes
+# them, throughput stays at 1 / single-request latency and the latency
+# seen by clients grows with concurrency instead.
+#
+# See scripts/mistral_standin.py for running the backend against a local
+# stand-in of the Mistral API.
+#
+#   python scripts/load_ocr.py --url http://127.0.0.1:8001 --requests 20 --concurrency 10
+
+import argparse
+import asyncio
+import io
+import time
+
+import httpx
+from PIL import Image, ImageDraw
+
+OCR_PATH = "/api/v1/ocr/process-image"
+
+
+def sample_image() -> bytes:
+    image = Image.new("RGB", (850, 1100), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((50, 50), "Invoice 1042", fill="black")
+    draw.text((50, 100), "Service ........ 120.00", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def percentile(ordered, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def main(args) -> None:
+    image = sample_image()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    failures = 0
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        async def upload(i: int) -> None:
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(OCR_PATH, files={"file": (f"sample-{i}.png", image, "image/png")})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+                    print(f"request {i}: HTTP {response.status_code} {response.text[:200]}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(upload(i) for i in range(args.requests)))
+        wall = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"requests     {args.requests} ({failures} failed), concurrency {args.concurrency}")
+    print(f"wall time    {wall:.2f} s")
+    print(f"latency      p50 {percentile(latencies, 50):.2f} s  p95 {percentile(latencies, 95):.2f} s  max {latencies[-1]:.2f} s")
+    print(f"throughput   {args.requests / wall:.2f} requests/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the OCR endpoint")
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    asyncio.run(main(parser.parse_args()))
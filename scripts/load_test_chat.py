@@ -0,0 +1,60 @@
+# Fire concurrent /chat requests at a running AI service and summarise the
+# outcome: status codes, latency percentiles and Retry-After hints.
+#
+#   python scripts/load_test_chat.py --url http://localhost:8000 --concurrency 100
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+
+async def one_request(client: httpx.AsyncClient, url: str, question: str):
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", f"{url}/chat", json={"question": question}) as response:
+            async for _ in response.aiter_bytes():
+                pass
+            return response.status_code, time.perf_counter() - start, response.headers.get("retry-after")
+    except httpx.HTTPError as e:
+        return type(e).__name__, time.perf_counter() - start, None
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def main(args):
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        results = await asyncio.gather(*[
+            one_request(client, args.url, f"{args.question} #{i}")
+            for i in range(args.concurrency)
+        ])
+        health = (await client.get(f"{args.url}/health")).json()
+
+    statuses = Counter(status for status, _, _ in results)
+    print(f"status codes: {dict(statuses)}")
+    for status in statuses:
+        latencies = [latency for s, latency, _ in results if s == status]
+        print(
+            f"  {status}: p50={percentile(latencies, 50):.3f}s "
+            f"p95={percentile(latencies, 95):.3f}s max={max(latencies):.3f}s "
+            f"mean={statistics.mean(latencies):.3f}s"
+        )
+    retry_after = [r for _, _, r in results if r]
+    if retry_after:
+        print(f"retry-after hints: {dict(Counter(retry_after))}")
+    print(f"admission after run: {health.get('chat')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test for the /chat endpoint")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--question", default="What documents do I have about invoices?")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,189 @@
+# Local stand-in for the Mistral OCR and chat completion endpoints, for load
+# testing the OCR API without calling (or paying for) the real service.
+#
+# Each call sleeps for a fixed latency and returns a canned response in the
+# shape the mistralai SDK expects. File upload/download and batch jobs are
+# stood in too: a job answers every request of its input file with the same
+# canned responses after --batch-latency seconds. Point the backend at it
+# with MISTRAL_SERVER_URL:
+#
+#   python scripts/mistral_standin.py --port 8090 --ocr-latency 1.0 --chat-latency 1.0
+#   MISTRAL_SERVER_URL=http://127.0.0.1:8090 MISTRAL_API_KEY=test \
+#       uvicorn app.main:app --app-dir backend --port 8001
+#   python scripts/load_ocr.py --url http://127.0.0.1:8001 --requests 20 --concurrency 10
+#
+#   MISTRAL_SERVER_URL=http://127.0.0.1:8090 MISTRAL_API_KEY=test BATCH_JOB_POLL_INTERVAL=1 \
+#       python backend/app/services/mistral_batch_service.py images/ --batch-jobs
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import Response
+
+app = FastAPI(title="Mistral stand-in")
+latency = {"ocr": 1.0, "chat": 1.0, "batch": 5.0}
+calls = {"ocr": 0, "chat": 0, "batch_jobs": 0, "batch_requests": 0}
+files = {}
+jobs = {}
+ocr_markdown = "# Invoice 1042\n\n| Item | Amount |\n|---|---|\n| Service | 120.00 |\n\nTotal: 120.00"
+
+
+def ocr_response(model: str) -> dict:
+    return {
+        "model": model,
+        "pages": [{
+            "index": 0,
+            "markdown": ocr_markdown,
+            "images": [],
+            "dimensions": {"dpi": 200, "height": 1100, "width": 850},
+        }],
+        "usage_info": {"pages_processed": 1, "doc_size_bytes": None},
+    }
+
+
+def chat_response(model: str) -> dict:
+    content = json.dumps({"invoice_number": "1042", "items": [{"item": "Service", "amount": 120.0}], "total": 120.0})
+    return {
+        "id": f"standin-{uuid.uuid4().hex[:8]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+
+
+BATCH_RESPONSES = {"/v1/ocr": ocr_response, "/v1/chat/completions": chat_response}
+
+
+@app.post("/v1/ocr")
+async def ocr(request: Request):
+    body = await request.json()
+    calls["ocr"] += 1
+    await asyncio.sleep(latency["ocr"])
+    return ocr_response(body.get("model", "mistral-ocr-latest"))
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    calls["chat"] += 1
+    await asyncio.sleep(latency["chat"])
+    return chat_response(body.get("model", "pixtral-12b-latest"))
+
+
+def store_file(content: bytes, filename: str, purpose: str) -> dict:
+    file_id = str(uuid.uuid4())
+    files[file_id] = content
+    return {
+        "id": file_id,
+        "object": "file",
+        "size_bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "sample_type": "batch_request" if purpose == "batch" else "instruct",
+        "source": "upload",
+        "num_lines": content.count(b"\n"),
+    }
+
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form("batch")):
+    return store_file(await file.read(), file.filename or "upload.jsonl", purpose)
+
+
+@app.get("/v1/files/{file_id}/content")
+async def download_file(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="File not found")
+    return Response(files[file_id], media_type="application/octet-stream")
+
+
+async def run_job(job: dict) -> None:
+    await asyncio.sleep(latency["batch"])
+    respond = BATCH_RESPONSES.get(job["endpoint"])
+    output = []
+    for file_id in job["input_files"]:
+        for line in files[file_id].splitlines():
+            request = json.loads(line)
+            calls["batch_requests"] += 1
+            if respond is None:
+                reply = {"status_code": 404, "body": {"message": "Endpoint not supported by the stand-in"}}
+            else:
+                reply = {"status_code": 200, "body": respond(job["model"])}
+            output.append(json.dumps({
+                "id": f"batch-{uuid.uuid4().hex[:8]}",
+                "custom_id": request["custom_id"],
+                "response": reply,
+                "error": None,
+            }))
+    succeeded = 0 if respond is None else len(output)
+    job.update(
+        status="SUCCESS",
+        output_file=store_file("\n".join(output).encode() + b"\n", f"{job['id']}.jsonl", "batch")["id"],
+        completed_requests=len(output),
+        succeeded_requests=succeeded,
+        failed_requests=len(output) - succeeded,
+        completed_at=int(time.time()),
+    )
+
+
+@app.post("/v1/batch/jobs")
+async def create_batch_job(request: Request):
+    body = await request.json()
+    calls["batch_jobs"] += 1
+    total = sum(files[file_id].count(b"\n") for file_id in body["input_files"])
+    job = {
+        "id": str(uuid.uuid4()),
+        "object": "batch",
+        "input_files": body["input_files"],
+        "endpoint": body["endpoint"],
+        "model": body.get("model"),
+        "metadata": body.get("metadata"),
+        "errors": [],
+        "status": "QUEUED",
+        "created_at": int(time.time()),
+        "total_requests": total,
+        "completed_requests": 0,
+        "succeeded_requests": 0,
+        "failed_requests": 0,
+    }
+    jobs[job["id"]] = job
+    asyncio.create_task(run_job(job))
+    return job
+
+
+@app.get("/v1/batch/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs[job_id]
+
+
+@app.get("/calls")
+async def call_counts():
+    return calls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Mistral API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--ocr-latency", type=float, default=1.0, help="Seconds per OCR call")
+    parser.add_argument("--chat-latency", type=float, default=1.0, help="Seconds per chat completion")
+    parser.add_argument("--batch-latency", type=float, default=5.0, help="Seconds before a batch job completes")
+    parser.add_argument(
+        "--ocr-markdown",
+        default=ocr_markdown,
+        help="OCR result of every image (the default table converts without the extraction model)",
+    )
+    args = parser.parse_args()
+    ocr_markdown = args.ocr_markdown
+    latency.update(ocr=args.ocr_latency, chat=args.chat_latency, batch=args.batch_latency)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
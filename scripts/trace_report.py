@@ -0,0 +1,117 @@
+# Aggregate the spans written by src.utils.tracing into per-stage latency
+# tables: count, errors, mean, p50, p95, p99 and max of each span name.
+# Spans are only written when the ai service runs with TRACE_EXPORT_PATH set,
+# e.g. TRACE_EXPORT_PATH=traces/spans.jsonl.
+#
+#   python scripts/trace_report.py ai/traces/spans.jsonl
+#   python scripts/trace_report.py spans.jsonl --prefix node. --by cache_hit
+#   python scripts/trace_report.py spans.jsonl --metric ttft_ms --prefix llm.
+#
+# --by splits each stage by the value of a span attribute; --metric reports a
+# numeric attribute (e.g. ttft_ms, input_tokens) instead of the duration.
+
+import argparse
+import json
+import math
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+def attribute_value(value: Dict[str, Any]) -> Any:
+    if "boolValue" in value:
+        return value["boolValue"]
+    if "intValue" in value:
+        return int(value["intValue"])
+    if "doubleValue" in value:
+        return float(value["doubleValue"])
+    return value.get("stringValue")
+
+
+def read_spans(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Yield every span of the OTLP/JSON lines in paths with decoded attributes"""
+    for path in paths:
+        with open(path) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"{path}:{line_number}: skipping malformed line", file=sys.stderr)
+                    continue
+                for resource_spans in request.get("resourceSpans", []):
+                    for scope_spans in resource_spans.get("scopeSpans", []):
+                        for s in scope_spans.get("spans", []):
+                            attributes = {
+                                a["key"]: attribute_value(a["value"]) for a in s.get("attributes", [])
+                            }
+                            if "duration_ms" not in attributes:
+                                attributes["duration_ms"] = (
+                                    int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])
+                                ) / 1e6
+                            yield {
+                                "name": s["name"],
+                                "error": s.get("status", {}).get("code") == 2,
+                                "attributes": attributes,
+                            }
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def aggregate(spans, metric: str, by: str, prefix: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    groups: Dict[Tuple[str, str], Dict[str, Any]] = defaultdict(lambda: {"values": [], "errors": 0})
+    for s in spans:
+        if not s["name"].startswith(prefix):
+            continue
+        value = s["attributes"].get(metric)
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        key = (s["name"], str(s["attributes"].get(by, "-")) if by else "")
+        groups[key]["values"].append(float(value))
+        groups[key]["errors"] += s["error"]
+    return groups
+
+
+def main(args) -> int:
+    groups = aggregate(read_spans(args.paths), args.metric, args.by, args.prefix)
+    if not groups:
+        print("no matching spans", file=sys.stderr)
+        return 1
+
+    stage_header = f"stage [{args.by}]" if args.by else "stage"
+    rows = []
+    for (name, group), data in groups.items():
+        values = sorted(data["values"])
+        rows.append((
+            f"{name} [{group}]" if args.by else name,
+            len(values),
+            data["errors"],
+            sum(values) / len(values),
+            percentile(values, 50),
+            percentile(values, 95),
+            percentile(values, 99),
+            values[-1],
+        ))
+    # slowest stages first
+    rows.sort(key=lambda row: row[5], reverse=True)
+
+    width = max(len(stage_header), *(len(row[0]) for row in rows))
+    print(f"{args.metric} per stage")
+    print(f"{stage_header:<{width}} {'count':>7} {'errors':>6} {'mean':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}")
+    for name, count, errors, mean, p50, p95, p99, maximum in rows:
+        print(f"{name:<{width}} {count:>7} {errors:>6} {mean:>10.1f} {p50:>10.1f} {p95:>10.1f} {p99:>10.1f} {maximum:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage latency percentiles from exported spans")
+    parser.add_argument("paths", nargs="+", help="OTLP/JSON lines files written by src.utils.tracing")
+    parser.add_argument("--metric", default="duration_ms", help="Numeric span attribute to aggregate")
+    parser.add_argument("--by", default="", help="Split each stage by this span attribute")
+    parser.add_argument("--prefix", default="", help="Only include spans whose name starts with this")
+    sys.exit(main(parser.parse_args()))
@@ -1,4 +1,4 @@
-CREATE TABLE images (
+CREATE TABLE IF NOT EXISTS images (
     image_id     INTEGER PRIMARY KEY,
     bytes        BLOB            NOT NULL,
     format       TEXT            NOT NULL,
@@ -7,7 +7,63 @@ CREATE TABLE images (
     created_ts   DATETIME        DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE milvus_map (
+CREATE TABLE IF NOT EXISTS milvus_map (
     vector_id   BIGINT PRIMARY KEY,
     image_id    INTEGER REFERENCES images(image_id)
-);
\ No newline at end of file
+);
+
+-- OCR and extraction results keyed by the SHA-256 of the normalized image
+-- bytes and the models (and extraction prompt) that produced them
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    image_sha256      TEXT            NOT NULL,
+    ocr_model         TEXT            NOT NULL,
+    extraction_model  TEXT            NOT NULL,
+    prompt_version    INTEGER         NOT NULL,
+    ocr_markdown      TEXT            NOT NULL,
+    structured_json   TEXT            NOT NULL,
+    hits              INTEGER         NOT NULL DEFAULT 0,
+    created_ts        DATETIME        DEFAULT CURRENT_TIMESTAMP,
+    last_hit_ts       DATETIME,
+    PRIMARY KEY (image_sha256, ocr_model, extraction_model, prompt_version)
+);
+
+-- Perceptual (dHash) fingerprints of the images behind ocr_cache entries,
+-- split into four 16-bit bands for multi-index Hamming-distance lookups:
+-- two hashes within distance d agree within d // 4 bits on at least one band
+CREATE TABLE IF NOT EXISTS image_dhash (
+    image_sha256  TEXT PRIMARY KEY,
+    band0         INTEGER         NOT NULL,
+    band1         INTEGER         NOT NULL,
+    band2         INTEGER         NOT NULL,
+    band3         INTEGER         NOT NULL,
+    created_ts    DATETIME        DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS image_dhash_band0 ON image_dhash (band0);
+CREATE INDEX IF NOT EXISTS image_dhash_band1 ON image_dhash (band1);
+CREATE INDEX IF NOT EXISTS image_dhash_band2 ON image_dhash (band2);
+CREATE INDEX IF NOT EXISTS image_dhash_band3 ON image_dhash (band3);
+
+-- Queue of asynchronous OCR jobs (POST /api/v1/ocr/jobs). The upload is kept
+-- until the job finishes so queued jobs survive restarts; workers take the
+-- queued job with the lowest priority (0 interactive, 1 bulk), oldest first.
+-- A running job is leased to the queue (process) that claimed it, which renews
+-- heartbeat_ts while it works on it; jobs whose lease ran out are queued again
+CREATE TABLE IF NOT EXISTS ocr_jobs (
+    seq           INTEGER PRIMARY KEY,
+    job_id        TEXT            NOT NULL UNIQUE,
+    priority      INTEGER         NOT NULL,
+    status        TEXT            NOT NULL,    -- queued, running, done or failed
+    filename      TEXT,
+    upload        BLOB,                        -- cleared when the job finishes
+    result_json   TEXT,
+    error         TEXT,
+    attempts      INTEGER         NOT NULL DEFAULT 0,
+    created_ts    DATETIME        DEFAULT CURRENT_TIMESTAMP,
+    started_ts    DATETIME,
+    finished_ts   DATETIME,
+    owner         TEXT,                        -- queue running the job
+    heartbeat_ts  DATETIME                     -- last renewal of its lease
+);
+
+CREATE INDEX IF NOT EXISTS ocr_jobs_queue ON ocr_jobs (status, priority);